@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import AsyncIterator, Callable
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive
+
+from app.config import settings
+from app.schemas import TurnRequest, TurnResult
+from app.services.assistant_service import AssistantService
+
+
+def build_router(get_service: Callable[[], AssistantService]) -> APIRouter:
+    router = APIRouter(prefix="/v1", tags=["assistant"])
+
+    @router.post("/answer", response_model=TurnResult)
+    async def answer(turn: TurnRequest) -> TurnResult:
+        result = await get_service().answer_one(turn.model_dump())
+        if "error" in result:
+            raise HTTPException(status_code=502, detail=result["error"])
+        return TurnResult(answer=result["answer"], source=result["source"], latency_ms=result["latency_ms"])
+
+    @router.post("/answer/batch")
+    async def answer_batch(
+        request: Request, concurrency: int | None = Query(default=None, ge=1)
+    ) -> StreamingResponse:
+        """
+        NDJSON in, NDJSON out: one turn request per line, one result line per
+        request as soon as it is answered (in completion order, tagged with the
+        input line's `index`). A malformed line gets an error result; the rest
+        of the batch carries on.
+        """
+        limit = min(concurrency or settings.batch_max_concurrency, max(1, settings.batch_max_concurrency))
+        body_read = asyncio.Event()
+        service = get_service()
+
+        async def lines() -> AsyncIterator[str]:
+            requests = _ndjson(request.stream(), body_read)
+            async for result in service.answer_many(requests, concurrency=limit):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+        return _UploadStreamingResponse(lines(), body_read, media_type="application/x-ndjson")
+
+    return router
+
+
+class _UploadStreamingResponse(StreamingResponse):
+    """
+    Streams results while the request body is still being read. Before ASGI
+    spec 2.4 Starlette watches `receive` for a disconnect during the response,
+    which would swallow the remaining body chunks, so the watch starts only
+    once the upload has been read to the end.
+    """
+
+    def __init__(self, content: AsyncIterator[str], body_read: asyncio.Event, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self._body_read = body_read
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await self._body_read.wait()
+        await super().listen_for_disconnect(receive)
+
+
+async def _ndjson(chunks: AsyncIterator[bytes], done: asyncio.Event) -> AsyncIterator[dict | None]:
+    # Parsed as the body arrives, one line per request the batch pulls; None stands in for a malformed line.
+    buffer = b""
+    try:
+        async for chunk in chunks:
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                if line.strip():
+                    yield _parse_line(line)
+        if buffer.strip():
+            yield _parse_line(buffer)
+    except ClientDisconnect:
+        return
+    finally:
+        done.set()
+
+
+def _parse_line(line: bytes) -> dict | None:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Hashable, Iterable
+
+from app.cache.ttl import TTLCache
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+# Words that carry no intent once the products and goal are pinned by the exact key.
+_FILLER = {
+    "a", "an", "and", "bar", "can", "compare", "could", "for", "i", "in", "is", "it", "me", "of", "on", "or",
+    "please", "see", "tell", "the", "to", "versus", "vs", "what", "which", "with", "you",
+}
+
+
+def question_features(question: str, ignore: Iterable[str] = ()) -> list[str]:
+    """Words of `question` left after dropping filler and the (already keyed) product names."""
+    drop = _FILLER | set(_WORD_RE.findall(" ".join(ignore).lower()))
+    return [w for w in _WORD_RE.findall((question or "").lower()) if w not in drop]
+
+
+def simhash(features: Iterable[str], bits: int = 64) -> int:
+    """SimHash of a feature list; similar lists differ in few bits."""
+    weights = [0] * bits
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(bits):
+            weights[i] += 1 if (h >> i) & 1 else -1
+    return sum(1 << i for i, w in enumerate(weights) if w > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def fingerprint(parts: Iterable[str]) -> str:
+    """Order-insensitive digest of catalog context blocks."""
+    digest = hashlib.sha256()
+    for part in sorted(parts):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class AnswerCache:
+    """
+    Reuses grounded LLM answers across sessions. The exact key pins mode,
+    canonical items, goal and the catalog rows shown to the model; within a
+    key, a stored answer is reused when the SimHash of the question's
+    remaining words is within `max_distance` bits of the one that produced it,
+    so rephrasings hit while different questions about the same products miss.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        max_distance: int = 6,
+        per_key: int = 8,
+    ) -> None:
+        self.max_distance = max_distance
+        self.per_key = max(1, per_key)
+        self.cache: TTLCache[list[tuple[int, str]]] = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def get(self, key: Hashable, question: str, ignore: Iterable[str] = ()) -> str | None:
+        variants = self.cache.get(key)
+        if not variants:
+            return None
+        probe = simhash(question_features(question, ignore))
+        best = min(variants, key=lambda v: hamming(v[0], probe))
+        return best[1] if hamming(best[0], probe) <= self.max_distance else None
+
+    def put(self, key: Hashable, question: str, answer: str, ignore: Iterable[str] = ()) -> None:
+        probe = simhash(question_features(question, ignore))
+        variants = [v for v in (self.cache.get(key) or []) if v[0] != probe]
+        variants.append((probe, answer))
+        self.cache.set(key, variants[-self.per_key :])
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from app.cache.ttl import TTLCache
+
+
+def prompt_version(*parts: str) -> str:
+    """Short digest of everything that shapes an extraction (prompts, model)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+class ExtractionCache:
+    """
+    Cross-session cache of LLM query extractions keyed by normalized message
+    text and prompt version. A bounded in-memory LRU sits in front of an
+    optional SQLite store; rows written under another prompt version are
+    dropped when the store is opened, so prompt edits invalidate it.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        max_entries: int = 4096,
+        ttl_seconds: float = 7 * 24 * 3600,
+        path: str | Path | None = None,
+    ) -> None:
+        self.version = version
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.memory: TTLCache[dict] = TTLCache(max_entries=self.max_entries, ttl_seconds=ttl_seconds)
+        self.path = Path(path) if path else None
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, text: str) -> dict | None:
+        key = normalize_text(text)
+        if not key:
+            return None
+        cached = self.memory.get(key)
+        if cached is None:
+            cached = self._load(key)
+            if cached is None:
+                return None
+            self.memory.set(key, cached)
+        return _copy(cached)
+
+    def put(self, text: str, extraction: dict) -> None:
+        key = normalize_text(text)
+        if not key:
+            return
+        self.memory.set(key, _copy(extraction))
+        self._store(key, extraction)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self.path is None:
+            return None
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                " version TEXT NOT NULL, text TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL,"
+                " PRIMARY KEY (version, text))"
+            )
+            conn.execute("DELETE FROM extractions WHERE version != ?", (self.version,))
+            self._conn = conn
+        return self._conn
+
+    def _load(self, key: str) -> dict | None:
+        # Primary-key lookups on a local file take microseconds; no thread hop needed.
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT value FROM extractions WHERE version = ? AND text = ? AND created > ?",
+                (self.version, key, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, key: str, extraction: dict) -> None:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (version, text, value, created) VALUES (?, ?, ?, ?)",
+                (self.version, key, json.dumps(extraction), time.time()),
+            )
+            self._writes += 1
+            if self._writes % 256 == 0:
+                # Keep the store bounded like the in-memory tier.
+                conn.execute(
+                    "DELETE FROM extractions WHERE rowid NOT IN"
+                    " (SELECT rowid FROM extractions ORDER BY created DESC LIMIT ?)",
+                    (self.max_entries * 4,),
+                )
+
+
+def _copy(extraction: dict) -> dict:
+    out = dict(extraction)
+    out["compare_items"] = list(extraction.get("compare_items", []) or [])
+    return out
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+
+class SharedCache:
+    """
+    JSON values in a SQLite file in WAL mode, shared by every worker process
+    that opens the same path: one process's upstream result spares the others
+    the call. Each row expires on its own TTL; expired and surplus rows are
+    pruned every 256 writes. `namespace` keeps several caches in one file.
+    """
+
+    def __init__(self, path: str | Path, namespace: str, max_entries: int = 8192) -> None:
+        self.path = Path(path)
+        self.namespace = namespace
+        self.max_entries = max(1, max_entries)
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key: str) -> Any | None:
+        # Primary-key lookups on a local file take microseconds; no thread hop needed.
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM shared_cache WHERE namespace = ? AND key = ? AND expires > ?",
+                (self.namespace, key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        if ttl_seconds <= 0:
+            return
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_cache (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now + ttl_seconds),
+            )
+            self._writes += 1
+            if self._writes % 256 == 0:
+                conn.execute("DELETE FROM shared_cache WHERE expires <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM shared_cache WHERE namespace = ? AND rowid NOT IN"
+                    " (SELECT rowid FROM shared_cache WHERE namespace = ? ORDER BY expires DESC LIMIT ?)",
+                    (self.namespace, self.namespace, self.max_entries),
+                )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Writers in other processes hold the lock for microseconds; wait for them rather than fail.
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS shared_cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn = conn
+        return self._conn
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+V = TypeVar("V")
+
+
+@dataclass
+class FlightStats:
+    leaders: int = 0
+    shared: int = 0
+    abandoned: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+class _Flight(Generic[V]):
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task[V]) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[V]):
+    """
+    Coalesces concurrent identical calls: the first caller for a key starts
+    the call as a task and later callers await the same task until it
+    finishes. Each waiter is shielded, so one caller leaving does not cancel
+    the call for the others; the call is cancelled once every waiter has left.
+    Nothing is kept after completion; pair with a cache for that.
+    """
+
+    def __init__(self) -> None:
+        self.stats = FlightStats()
+        self._flights: dict[Hashable, _Flight[V]] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[V]]) -> tuple[V, bool]:
+        """Return (result, shared); `shared` is True when another caller's call was reused."""
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.stats.leaders += 1
+        else:
+            self.stats.shared += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller was cancelled; stop the upstream call and let the next caller start fresh.
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.stats.abandoned += 1
+
+    def _forget(self, key: Hashable, flight: _Flight[V]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+V = TypeVar("V")
+
+FRESH = "hit"
+STALE = "stale"
+MISS = "miss"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    negative_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    refreshes: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class _Entry(Generic[V]):
+    value: V
+    expires_at: float
+    stale_until: float
+    negative: bool
+
+
+class TTLCache(Generic[V]):
+    """
+    Bounded in-process LRU cache with per-entry TTL.
+    Expired entries stay servable for `stale_seconds` while a single background
+    refresh replaces them (stale-while-revalidate). Negative entries (empty
+    results) use their own, usually shorter, TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        stale_seconds: float = 0.0,
+        negative_ttl_seconds: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = max(0.0, stale_seconds)
+        self.negative_ttl_seconds = ttl_seconds if negative_ttl_seconds is None else negative_ttl_seconds
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: OrderedDict[Hashable, _Entry[V]] = OrderedDict()
+        self._refreshing: dict[Hashable, asyncio.Task] = {}
+
+    def lookup(self, key: Hashable) -> tuple[str, V | None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return MISS, None
+        now = self._clock()
+        if now >= entry.stale_until:
+            del self._entries[key]
+            self.stats.misses += 1
+            return MISS, None
+        self._entries.move_to_end(key)
+        if entry.negative:
+            self.stats.negative_hits += 1
+        if now < entry.expires_at:
+            self.stats.hits += 1
+            return FRESH, entry.value
+        self.stats.stale_hits += 1
+        return STALE, entry.value
+
+    def get(self, key: Hashable) -> V | None:
+        state, value = self.lookup(key)
+        return value if state == FRESH else None
+
+    def set(self, key: Hashable, value: V, negative: bool = False) -> None:
+        ttl = self.negative_ttl_seconds if negative else self.ttl_seconds
+        now = self._clock()
+        self._entries[key] = _Entry(
+            value=value,
+            expires_at=now + ttl,
+            stale_until=now + ttl + self.stale_seconds,
+            negative=negative,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[V]],
+        is_cacheable: Callable[[V], bool] = lambda _: True,
+        is_negative: Callable[[V], bool] = lambda _: False,
+    ) -> tuple[str, V]:
+        state, value = self.lookup(key)
+        if state == FRESH:
+            return state, value  # type: ignore[return-value]
+        if state == STALE:
+            self._schedule_refresh(key, loader, is_cacheable, is_negative)
+            return state, value  # type: ignore[return-value]
+        value = await loader()
+        self._store(key, value, is_cacheable, is_negative)
+        return MISS, value
+
+    def _store(
+        self,
+        key: Hashable,
+        value: V,
+        is_cacheable: Callable[[V], bool],
+        is_negative: Callable[[V], bool],
+    ) -> None:
+        if is_cacheable(value):
+            self.set(key, value, negative=is_negative(value))
+
+    def _schedule_refresh(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[V]],
+        is_cacheable: Callable[[V], bool],
+        is_negative: Callable[[V], bool],
+    ) -> None:
+        if key in self._refreshing:
+            return
+
+        async def refresh() -> None:
+            try:
+                self._store(key, await loader(), is_cacheable, is_negative)
+                self.stats.refreshes += 1
+            except Exception:
+                # Keep serving the stale entry; the next stale hit retries.
+                pass
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"entries": len(self._entries), **self.stats.as_dict()}
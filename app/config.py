@@ -19,19 +19,64 @@ class Settings:
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     openai_base_url: str = os.getenv("OPENAI_BASE_URL", "")
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-5-nano")
+    llm_timeout_seconds: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "1"))
+    stream_responses: bool = _as_bool(os.getenv("STREAM_RESPONSES", "1"), default=True)
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    prompt_token_budget: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+    batch_max_concurrency: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
     off_country: str = os.getenv("OFF_COUNTRY", "world")
+    off_base_url: str = os.getenv("OFF_BASE_URL", "")
     off_page_size: int = int(os.getenv("OFF_PAGE_SIZE", "20"))
     off_max_retries: int = int(os.getenv("OFF_MAX_RETRIES", "2"))
+    extraction_cache_max_entries: int = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "4096"))
+    extraction_cache_ttl_seconds: float = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", "604800"))
+    extraction_cache_path: str = os.getenv("EXTRACTION_CACHE_PATH", "")
+    answer_cache_max_entries: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+    answer_cache_ttl_seconds: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    answer_cache_max_distance: int = int(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "6"))
+    session_memo_max_sessions: int = int(os.getenv("SESSION_MEMO_MAX_SESSIONS", "1024"))
+    session_ttl_seconds: float = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    session_store_path: str = os.getenv("SESSION_STORE_PATH", "")
     debug_log: bool = _as_bool(os.getenv("DEBUG_LOG", "0"))
     usda_api_key: str = os.getenv("USDA_API_KEY", "")
+    usda_base_url: str = os.getenv("USDA_BASE_URL", "")
     usda_page_size: int = int(os.getenv("USDA_PAGE_SIZE", "12"))
+    speculative_search: bool = _as_bool(os.getenv("SPECULATIVE_SEARCH", "1"), default=True)
+    search_fanout_variants: int = int(os.getenv("SEARCH_FANOUT_VARIANTS", "3"))
+    usda_provider: str = os.getenv("USDA_PROVIDER", "api").strip().lower()
+    usda_snapshot_path: str = os.getenv("USDA_SNAPSHOT_PATH") or str(ROOT_DIR / "data" / "usda_snapshot.sqlite3")
+    search_providers: str = os.getenv("SEARCH_PROVIDERS", "usda")
+    federated_budget_seconds: float = float(os.getenv("FEDERATED_BUDGET_SECONDS", "8"))
+    federated_strategy: str = os.getenv("FEDERATED_STRATEGY", "first").strip().lower()
+    federated_grace_seconds: float = float(os.getenv("FEDERATED_GRACE_SECONDS", "0.25"))
+    usda_cache_max_entries: int = int(os.getenv("USDA_CACHE_MAX_ENTRIES", "2048"))
+    usda_cache_ttl_seconds: float = float(os.getenv("USDA_CACHE_TTL_SECONDS", "21600"))
+    usda_cache_stale_seconds: float = float(os.getenv("USDA_CACHE_STALE_SECONDS", "86400"))
+    usda_cache_negative_ttl_seconds: float = float(os.getenv("USDA_CACHE_NEGATIVE_TTL_SECONDS", "600"))
+    provider_cache_path: str = os.getenv("PROVIDER_CACHE_PATH", "")
     meli_site_id: str = os.getenv("MELI_SITE_ID", "MPE")
     meli_fallback_sites: str = os.getenv("MELI_FALLBACK_SITES", "MLA,MLB")
     meli_access_token: str = os.getenv("MELI_ACCESS_TOKEN", "")
     meli_items_limit: int = int(os.getenv("MELI_ITEMS_LIMIT", "20"))
+    http_max_connections: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    http_max_keepalive_connections: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    http_keepalive_seconds: float = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+    http2: bool = _as_bool(os.getenv("HTTP2", "0"))
+    usda_rate_limit_per_hour: float = float(os.getenv("USDA_RATE_LIMIT_PER_HOUR", "1000"))
+    off_rate_limit_per_minute: float = float(os.getenv("OFF_RATE_LIMIT_PER_MINUTE", "10"))
+    llm_rate_limit_rpm: float = float(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+    upstream_max_concurrency: int = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "16"))
+    rate_limit_max_wait_seconds: float = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "5"))
+    turn_budget_seconds: float = float(os.getenv("TURN_BUDGET_SECONDS", "20"))
+    hedge_quantile: float = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+    circuit_failure_threshold: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    circuit_reset_seconds: float = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+    coalesce_requests: bool = _as_bool(os.getenv("COALESCE_REQUESTS", "1"), default=True)
     request_timeout_seconds: int = int(os.getenv("REQUEST_TIMEOUT_SECONDS", "12"))
     gradio_server_name: str = os.getenv("GRADIO_SERVER_NAME", "0.0.0.0")
     gradio_server_port: int = int(os.getenv("GRADIO_SERVER_PORT", "7860"))
+    web_workers: int = int(os.getenv("WEB_WORKERS", "1"))
 
 
 settings = Settings()
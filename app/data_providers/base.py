@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import importlib.util
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+import httpx
+
+from app.cache.singleflight import SingleFlight
+from app.config import settings
+from app.data_providers.ratelimit import UpstreamLimiter
+from app.data_providers.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    LatencyWindow,
+    budget_timeout,
+    hedged,
+)
+
+DEFAULT_HEADERS = {"User-Agent": "opencommerce-ai-assistant/0.1", "Accept": "application/json"}
+# Never hedge sooner than this: duplicating fast requests buys nothing and spends quota.
+MIN_HEDGE_DELAY_SECONDS = 0.05
+
+
+@dataclass
+class ProviderResult:
+    products: list[Any] = field(default_factory=list)
+    source: str = ""
+    error: str = ""
+    status: int | None = None
+    url: str = ""
+    cache_status: str = ""
+
+
+class PooledHTTPClient:
+    """
+    Owns one long-lived, connection-pooled httpx client per provider.
+    The client is created lazily on the running loop and reused across calls
+    so lookups skip DNS/TCP/TLS setup after the first request.
+    """
+
+    def __init__(
+        self,
+        timeout: httpx.Timeout,
+        headers: dict[str, str] | None = None,
+        limiter: UpstreamLimiter | None = None,
+    ) -> None:
+        self._timeout = timeout
+        self.limiter = limiter
+        name = limiter.name if limiter is not None else type(self).__name__.lower()
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=settings.circuit_failure_threshold,
+            reset_seconds=settings.circuit_reset_seconds,
+        )
+        self.latency = LatencyWindow(quantile=settings.hedge_quantile)
+        self._headers = dict(headers or DEFAULT_HEADERS)
+        self._client: httpx.AsyncClient | None = None
+        self._client_loop: asyncio.AbstractEventLoop | None = None
+        self.flights: SingleFlight[ProviderResult] | None = SingleFlight() if settings.coalesce_requests else None
+
+    async def coalesced(self, key: Hashable, load: Callable[[], Awaitable[ProviderResult]]) -> ProviderResult:
+        """Run `load` once for concurrent identical searches; joiners get their own copy of the result."""
+        if self.flights is None:
+            return await load()
+        result, shared = await self.flights.do(key, load)
+        if not shared:
+            return result
+        return dataclasses.replace(result, products=list(result.products), cache_status="coalesced")
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Send one request within the turn deadline. Fails fast while the
+        provider's circuit is open; once the provider's latency profile is
+        known, a request still running at its HEDGE_QUANTILE latency is
+        hedged with a second copy and the first response wins.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} circuit open")
+        timeout, clipped = budget_timeout(self._timeout.read or settings.request_timeout_seconds)
+        delay = self.latency.hedge_delay(floor=MIN_HEDGE_DELAY_SECONDS)
+        if delay is not None and delay >= timeout:
+            delay = None
+        try:
+            return await asyncio.wait_for(
+                hedged(lambda: self._send(method, url, **kwargs), delay, upstream=self.breaker.name),
+                timeout=timeout if clipped else None,
+            )
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded() from None
+
+    async def _send(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        # Goes through the rate limiter; a 429 is retried once when the advertised wait fits RATE_LIMIT_MAX_WAIT_SECONDS.
+        client = self.http()
+        for attempt in range(2):
+            async with self.limiter.slot() if self.limiter is not None else nullcontext():
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.TransportError as exc:
+                    # Deadline cuts cancel this coroutine instead, so only the provider's own failures count here.
+                    self.breaker.record_failure()
+                    if self.limiter is not None and isinstance(exc, httpx.TimeoutException):
+                        self.limiter.observe(None, overloaded=True)
+                    raise
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                elif response.status_code != 429:
+                    self.breaker.record_success()
+                    self.latency.record(time.perf_counter() - started)
+                if self.limiter is None:
+                    return response
+                self.limiter.observe(response.status_code, response.headers)
+            if response.status_code != 429 or attempt or self.limiter.bucket.delay() > settings.rate_limit_max_wait_seconds:
+                return response
+        return response
+
+    def http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            # Pooled connections are bound to the loop that opened them.
+            self._client = build_http_client(self._timeout, self._headers)
+            self._client_loop = loop
+        return self._client
+
+    async def start(self) -> None:
+        self.http()
+
+    async def aclose(self) -> None:
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+
+def quota_limiter(name: str, requests: float, per_seconds: float) -> UpstreamLimiter:
+    """
+    Limiter for a quota of `requests` per `per_seconds` (0 = unmetered),
+    bursting up to a minute of quota. The quota is per host, so each of
+    WEB_WORKERS processes gets an equal share.
+    """
+    rate = requests / per_seconds / max(1, settings.web_workers) if requests > 0 else 0.0
+    return UpstreamLimiter(
+        name,
+        rate_per_second=rate,
+        burst=max(1.0, rate * 60),
+        max_concurrency=max(1, settings.upstream_max_concurrency),
+    )
+
+
+def build_http_client(timeout: httpx.Timeout, headers: dict[str, str]) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_seconds,
+    )
+    # HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 without it.
+    http2 = settings.http2 and importlib.util.find_spec("h2") is not None
+    return httpx.AsyncClient(timeout=timeout, headers=headers, limits=limits, http2=http2)
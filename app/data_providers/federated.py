@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import asyncio
+import re
+from typing import Any
+
+from app.config import settings
+from app.data_providers.base import ProviderResult
+from app.data_providers.resilience import remaining as turn_remaining
+from app.schemas import FoodProduct
+
+NUTRIENT_FIELDS = ("energy_kcal_100g", "sugars_100g", "proteins_100g", "fat_100g", "salt_100g")
+
+
+class FederatedFoodSearch:
+    """
+    Queries several food providers concurrently under one latency budget.
+    strategy="first" returns the first non-empty result set to arrive; a
+    provider listed earlier that is still running gets `grace_seconds` more
+    to answer and wins if it does. strategy="merge" combines everything that
+    finished in time and dedupes by barcode and normalized name.
+    """
+
+    def __init__(
+        self,
+        providers: list[Any],
+        budget_seconds: float | None = None,
+        strategy: str | None = None,
+        grace_seconds: float | None = None,
+    ) -> None:
+        self.providers = providers
+        self.budget_seconds = float(budget_seconds or settings.federated_budget_seconds)
+        self.grace_seconds = max(0.0, settings.federated_grace_seconds if grace_seconds is None else grace_seconds)
+        self.strategy = (strategy or settings.federated_strategy).strip().lower()
+        self.debug = settings.debug_log
+
+    async def start(self) -> None:
+        for provider in self.providers:
+            await provider.start()
+
+    async def aclose(self) -> None:
+        for provider in self.providers:
+            await provider.aclose()
+
+    async def search(self, query: str, page_size: int | None = None) -> ProviderResult:
+        tasks = {
+            asyncio.create_task(provider.search(query, page_size=page_size)): idx
+            for idx, provider in enumerate(self.providers)
+        }
+        finished: dict[int, ProviderResult] = {}
+        loop = asyncio.get_running_loop()
+        left = turn_remaining()
+        deadline = loop.time() + (self.budget_seconds if left is None else min(self.budget_seconds, max(0.0, left)))
+        grace_until: float | None = None
+        try:
+            pending = set(tasks)
+            while pending:
+                remaining = deadline - loop.time()
+                if grace_until is not None:
+                    # A result is in hand; earlier-listed providers only get the grace period to beat it.
+                    remaining = min(remaining, grace_until - loop.time())
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    idx = tasks[task]
+                    try:
+                        finished[idx] = task.result()
+                    except Exception as exc:
+                        finished[idx] = ProviderResult(error=f"{exc.__class__.__name__}: {exc}")
+                if self.strategy == "first":
+                    if self._first_good(finished, pending, tasks) is not None:
+                        break
+                    if grace_until is None and any(r.products for r in finished.values()):
+                        grace_until = loop.time() + self.grace_seconds
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        timed_out = [type(self.providers[idx]).__name__ for idx in tasks.values() if idx not in finished]
+        if self.debug:
+            summary = {r.source or idx: len(r.products) for idx, r in finished.items()}
+            print(f"[DEBUG][FEDERATED] query='{query}' results={summary} timed_out={timed_out}")
+
+        if self.strategy == "first":
+            idx = self._first_good(finished, set(), tasks)
+            if idx is not None:
+                return finished[idx]
+            return self._empty_result(finished, timed_out)
+
+        merged = merge_results([finished[idx] for idx in sorted(finished)])
+        if not merged.products:
+            return self._empty_result(finished, timed_out)
+        return merged
+
+    @staticmethod
+    def _first_good(
+        finished: dict[int, ProviderResult],
+        pending: set[asyncio.Task],
+        tasks: dict[asyncio.Task, int],
+    ) -> int | None:
+        # The earliest-listed provider with results, once every provider listed before it has finished.
+        waiting = {tasks[t] for t in pending}
+        for idx in sorted(set(finished) | waiting):
+            if idx in waiting:
+                return None
+            if finished[idx].products:
+                return idx
+        return None
+
+    @staticmethod
+    def _empty_result(finished: dict[int, ProviderResult], timed_out: list[str]) -> ProviderResult:
+        errors = [r.error for _, r in sorted(finished.items()) if r.error]
+        if timed_out:
+            errors.append("latency budget exceeded for " + ", ".join(timed_out))
+        first = finished[min(finished)] if finished else ProviderResult()
+        return ProviderResult(
+            source="+".join(r.source for _, r in sorted(finished.items()) if r.source),
+            error="; ".join(errors) or "No products returned by any provider.",
+            status=first.status,
+            url=first.url,
+        )
+
+
+def merge_results(results: list[ProviderResult]) -> ProviderResult:
+    merged: list[FoodProduct] = []
+    # key -> (merged index, position of the result that added it)
+    by_key: dict[str, tuple[int, int]] = {}
+    sources: list[str] = []
+    for pos, result in enumerate(results):
+        contributed = False
+        for product in result.products:
+            keys = dedupe_keys(product)
+            idx = next((by_key[k][0] for k in keys if _matches(k, by_key.get(k), pos)), None)
+            if idx is None:
+                idx = len(merged)
+                merged.append(product)
+                contributed = True
+            else:
+                merged[idx] = _fill_missing(merged[idx], product)
+            for k in keys:
+                by_key.setdefault(k, (idx, pos))
+        if contributed and result.source:
+            sources.append(result.source)
+    first = results[0] if results else ProviderResult()
+    return ProviderResult(
+        products=merged,
+        source="+".join(sources),
+        error="" if merged else "; ".join(r.error for r in results if r.error),
+        status=first.status,
+        url=first.url,
+    )
+
+
+def dedupe_keys(product: FoodProduct) -> list[str]:
+    keys = []
+    gtin = re.sub(r"\D", "", product.gtin or "").lstrip("0")
+    if gtin:
+        keys.append(f"gtin:{gtin}")
+    name = " ".join(re.findall(r"[a-z0-9]+", product.product_name.lower()))
+    if name:
+        keys.append(f"name:{name}")
+    return keys
+
+
+def _matches(key: str, held: tuple[int, int] | None, pos: int) -> bool:
+    # A GTIN is the same product anywhere. Names only match across providers:
+    # one provider lists different brands' foods under the same description.
+    return held is not None and (key.startswith("gtin:") or held[1] != pos)
+
+
+def _fill_missing(kept: FoodProduct, other: FoodProduct) -> FoodProduct:
+    update = {f: getattr(other, f) for f in NUTRIENT_FIELDS if getattr(kept, f) is None and getattr(other, f) is not None}
+    if not kept.brands and other.brands:
+        update["brands"] = other.brands
+    return kept.model_copy(update=update) if update else kept
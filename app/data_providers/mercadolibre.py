@@ -5,53 +5,66 @@ from typing import Any
 import httpx
 
 from app.config import settings
+from app.data_providers.base import DEFAULT_HEADERS, PooledHTTPClient, ProviderResult, quota_limiter
 from app.schemas import Product
 
 
-class MercadoLibreClient:
+class MercadoLibreClient(PooledHTTPClient):
     BASE_URL = "https://api.mercadolibre.com"
 
     def __init__(self) -> None:
         self.timeout = settings.request_timeout_seconds
+        self.access_token = settings.meli_access_token.strip()
+        headers = dict(DEFAULT_HEADERS)
+        if self.access_token:
+            headers["Authorization"] = f"Bearer {self.access_token}"
+        # No published quota: the limiter only caps concurrency and honours rate-limit headers.
+        super().__init__(
+            timeout=httpx.Timeout(self.timeout), headers=headers, limiter=quota_limiter("mercadolibre", 0, 60)
+        )
         self.site_id = settings.meli_site_id
         self.fallback_sites = [
             s.strip().upper()
             for s in settings.meli_fallback_sites.split(",")
             if s.strip()
         ]
-        self.access_token = settings.meli_access_token.strip()
         self.default_limit = settings.meli_items_limit
         self.last_error: str = ""
 
     async def search_products(self, query: str, limit: int | None = None) -> list[Product]:
-        self.last_error = ""
+        result = await self.search(query, limit=limit)
+        self.last_error = result.error
+        return result.products
+
+    async def search(self, query: str, limit: int | None = None) -> ProviderResult:
+        result = ProviderResult(source="mercadolibre")
         if not query.strip():
-            return []
+            return result
 
         params = {"q": query.strip(), "limit": str(limit or self.default_limit)}
         sites = [self.site_id] + [s for s in self.fallback_sites if s != self.site_id]
-        headers = {"User-Agent": "opencommerce-ai-assistant/0.1", "Accept": "application/json"}
-        if self.access_token:
-            headers["Authorization"] = f"Bearer {self.access_token}"
 
-        async with httpx.AsyncClient(timeout=self.timeout, headers=headers) as client:
-            for site in sites:
-                url = f"{self.BASE_URL}/sites/{site}/search"
-                try:
-                    response = await client.get(url, params=params)
-                    response.raise_for_status()
-                    data: dict[str, Any] = response.json()
-                    items = [self._to_product(item) for item in data.get("results", [])]
-                    if items:
-                        return items
-                    self.last_error = f"No results for site={site}"
-                except httpx.HTTPStatusError as exc:
-                    body = (exc.response.text or "")[:120].replace("\n", " ")
-                    self.last_error = f"MercadoLibre site={site} HTTP {exc.response.status_code}: {body}"
-                except httpx.HTTPError as exc:
-                    self.last_error = f"MercadoLibre network error: {exc.__class__.__name__}"
+        for site in sites:
+            url = f"{self.BASE_URL}/sites/{site}/search"
+            try:
+                response = await self.request("GET", url, params=params)
+                result.status = response.status_code
+                result.url = str(response.request.url)
+                response.raise_for_status()
+                data: dict[str, Any] = response.json()
+                items = [self._to_product(item) for item in data.get("results", [])]
+                if items:
+                    result.products = items
+                    result.error = ""
+                    return result
+                result.error = f"No results for site={site}"
+            except httpx.HTTPStatusError as exc:
+                body = (exc.response.text or "")[:120].replace("\n", " ")
+                result.error = f"MercadoLibre site={site} HTTP {exc.response.status_code}: {body}"
+            except httpx.HTTPError as exc:
+                result.error = f"MercadoLibre network error: {exc.__class__.__name__}"
 
-        return []
+        return result
 
     @staticmethod
     def _to_product(item: dict[str, Any]) -> Product:
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import re
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, Iterator, Mapping
+
+from app.observability.tracing import UPSTREAM_THROTTLED, UPSTREAM_WAIT_SECONDS
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority: ContextVar[int] = ContextVar("upstream_priority", default=INTERACTIVE)
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+# Bare reset values above this (about 32 years in seconds) are Unix timestamps, not durations.
+EPOCH_THRESHOLD = 1e9
+
+
+@contextmanager
+def background() -> Iterator[None]:
+    """Upstream calls started inside (including tasks created here) queue behind interactive ones."""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class TokenBucket:
+    """
+    Request budget refilled at `rate` per second up to `capacity`. A rate of
+    0 means no configured quota; the bucket then only enforces pauses learned
+    from rate-limit headers.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = max(0.0, rate)
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self, now: float) -> None:
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until a request may start (0 when it may start now)."""
+        now = self._clock()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.rate and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self) -> None:
+        if self.rate:
+            self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, self._clock() + max(0.0, seconds))
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Sync with the server's view: remaining quota caps local tokens, and exhaustion pauses until reset."""
+        self._refill(self._clock())
+        retry_after = parse_retry_after(headers)
+        if retry_after is not None:
+            self.pause(retry_after)
+        for remaining_key, reset_key in (
+            ("x-ratelimit-remaining", "x-ratelimit-reset"),
+            ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+            ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+        ):
+            remaining = _to_float(headers.get(remaining_key))
+            if remaining is None:
+                continue
+            if remaining_key != "x-ratelimit-remaining-tokens" and self.rate:
+                self.tokens = min(self.tokens, remaining)
+            if remaining <= 0:
+                reset = parse_duration(headers.get(reset_key, ""))
+                self.pause(reset if reset is not None else (1 / self.rate if self.rate else 1.0))
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit: each
+    window of `limit` successes adds one slot; an overload signal (429, 503,
+    timeout) multiplies the limit by `backoff`, at most once per `cooldown`.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        minimum: float = 1.0,
+        maximum: float = 64.0,
+        backoff: float = 0.5,
+        cooldown: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.minimum = max(1.0, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self._clock = clock
+        self._last_decrease = float("-inf")
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_overload(self) -> None:
+        now = self._clock()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._last_decrease = now
+
+
+class UpstreamLimiter:
+    """
+    Admission gate for one upstream: a request starts when the AIMD
+    concurrency limit has room and the token bucket has budget. Waiters are
+    served by priority, then arrival, so interactive turns overtake queued
+    background prefetches.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate_per_second: float,
+        burst: float,
+        max_concurrency: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.bucket = TokenBucket(rate_per_second, burst, clock=clock)
+        self.concurrency = AIMDController(initial=max_concurrency, maximum=max_concurrency, clock=clock)
+        self.in_flight = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_loop: asyncio.AbstractEventLoop | None = None
+
+    @asynccontextmanager
+    async def slot(self, priority: int | None = None) -> AsyncIterator[UpstreamLimiter]:
+        await self.acquire(priority)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int | None = None) -> None:
+        priority = current_priority() if priority is None else priority
+        started = time.perf_counter()
+        if not self._waiters and self._admit():
+            UPSTREAM_WAIT_SECONDS.observe(0.0, upstream=self.name)
+            return
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller gave up: hand the slot to the next waiter.
+                self.release()
+            raise
+        UPSTREAM_WAIT_SECONDS.observe(time.perf_counter() - started, upstream=self.name)
+
+    def release(self) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
+        self._dispatch()
+
+    def observe(self, status: int | None, headers: Mapping[str, str] | None = None, overloaded: bool = False) -> None:
+        """Feed back one response (or a timeout via `overloaded`) into the bucket and the concurrency limit."""
+        if headers:
+            self.bucket.observe({k.lower(): v for k, v in headers.items()})
+        if status == 429 or status == 503 or overloaded:
+            UPSTREAM_THROTTLED.inc(upstream=self.name, status=status or "timeout")
+            self.concurrency.on_overload()
+            if status == 429 and not (headers and parse_retry_after(headers)):
+                self.bucket.pause(1 / self.bucket.rate if self.bucket.rate else 1.0)
+        elif status is not None and status < 500:
+            self.concurrency.on_success()
+        self._dispatch()
+
+    def _admit(self) -> bool:
+        if self.in_flight >= int(self.concurrency.limit) or self.bucket.delay() > 0:
+            return False
+        self.bucket.take()
+        self.in_flight += 1
+        return True
+
+    def _dispatch(self) -> None:
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.concurrency.limit):
+                return
+            delay = self.bucket.delay()
+            if delay > 0:
+                self._wake_in(delay)
+                return
+            heapq.heappop(self._waiters)
+            self.bucket.take()
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _wake_in(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        if self._timer is not None and self._timer_loop is loop and not self._timer.cancelled():
+            return
+        self._timer_loop = loop
+        self._timer = loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+
+def parse_duration(value: str) -> float | None:
+    """
+    Parse OpenAI-style reset values such as `20ms`, `1.5s` or `6m0s`. Bare
+    numbers are seconds, except those past `EPOCH_THRESHOLD`: some providers
+    send the reset as a Unix timestamp (in seconds, or in milliseconds).
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    number = _to_float(value)
+    if number is not None:
+        if number > EPOCH_THRESHOLD * 1000:
+            number /= 1000
+        return max(0.0, number - time.time()) if number > EPOCH_THRESHOLD else number
+    parts = _DURATION_RE.findall(value)
+    return sum(float(n) * _UNIT_SECONDS[u] for n, u in parts) if parts else None
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float | None:
+    lowered = {k.lower(): v for k, v in headers.items()}
+    ms = _to_float(lowered.get("retry-after-ms"))
+    if ms is not None:
+        return ms / 1000
+    raw = (lowered.get("retry-after") or "").strip()
+    if not raw:
+        return None
+    seconds = _to_float(raw)
+    if seconds is not None:
+        return seconds
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value: object) -> float | None:
+    try:
+        return float(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
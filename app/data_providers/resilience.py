@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterator, TypeVar
+
+import httpx
+
+from app.observability.tracing import CIRCUIT_OPENED, UPSTREAM_HEDGES
+
+T = TypeVar("T")
+
+_deadline: ContextVar[float | None] = ContextVar("turn_deadline", default=None)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The turn's latency budget ran out before (or while) calling an upstream."""
+
+    def __init__(self, message: str = "turn latency budget exhausted") -> None:
+        super().__init__(message)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """An upstream's circuit breaker is open; the call was not attempted."""
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """
+    Bound every upstream call started inside (including tasks created here)
+    to `seconds` from now. Nested deadlines can only shorten the outer one;
+    None or a non-positive budget leaves the current deadline unchanged.
+    """
+    previous = _deadline.get()
+    if seconds is not None and seconds > 0:
+        at = time.monotonic() + seconds
+        _deadline.set(at if previous is None else min(previous, at))
+    try:
+        yield
+    finally:
+        # Restore by value: async generators may be finalized from another context.
+        _deadline.set(previous)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current deadline, or None when there is none."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def budget_timeout(timeout: float) -> tuple[float, bool]:
+    """
+    `timeout` clipped to the current deadline, and whether the deadline was
+    the tighter bound. Raises DeadlineExceeded when no time is left.
+    """
+    left = remaining()
+    if left is None or left >= timeout:
+        return timeout, False
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left, True
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after `failure_threshold` consecutive upstream failures.
+    While open, one probe call is let through every `reset_seconds`; a
+    successful probe closes the circuit, a failed one keeps it open.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._clock = clock
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = self._clock()
+        if now - self.opened_at < self.reset_seconds:
+            return False
+        # Re-arm before probing so concurrent callers keep failing fast.
+        self.opened_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                CIRCUIT_OPENED.inc(upstream=self.name)
+            self.opened_at = self._clock()
+
+
+class LatencyWindow:
+    """Recent call latencies of one upstream; the hedge delay is their `quantile`."""
+
+    def __init__(self, quantile: float = 0.95, size: int = 256, min_samples: int = 20) -> None:
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=size)
+        self._cached: float | None = None
+        self._dirty = 0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._dirty += 1
+
+    def hedge_delay(self, floor: float = 0.0) -> float | None:
+        if not self.quantile or len(self._samples) < self.min_samples:
+            return None
+        # Re-sorting a few hundred floats is cheap, but not worth doing per call.
+        if self._cached is None or self._dirty >= 16:
+            ordered = sorted(self._samples)
+            self._cached = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+            self._dirty = 0
+        return max(floor, self._cached)
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float | None, upstream: str = "") -> T:
+    """
+    Await `call()`; if it has not finished after `delay` seconds, start a
+    second copy and return whichever succeeds first. The loser is cancelled.
+    A failure of one copy only surfaces if the other fails too.
+    """
+    primary = asyncio.ensure_future(call())
+    if delay is None:
+        return await primary
+    tasks: dict[asyncio.Future[T], str] = {primary: "primary"}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            tasks[asyncio.ensure_future(call())] = "hedge"
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1:
+                        UPSTREAM_HEDGES.inc(upstream=upstream, winner=tasks[task])
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,112 +1,166 @@
 from __future__ import annotations
 
+import dataclasses
+import json
 from typing import Any
 from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import httpx
 
+from app.cache.shared import SharedCache
+from app.cache.ttl import MISS, TTLCache
 from app.config import settings
+from app.data_providers.base import PooledHTTPClient, ProviderResult, quota_limiter
+from app.data_providers.usda_decode import decode_food, loads
 from app.schemas import FoodProduct
 
 
-class USDAFoodDataClient:
+class USDAFoodDataClient(PooledHTTPClient):
     BASE_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
+    DATA_TYPES = ("Branded", "Foundation", "Survey (FNDDS)")
 
     def __init__(self) -> None:
         self.timeout = settings.request_timeout_seconds
+        super().__init__(
+            timeout=httpx.Timeout(
+                connect=min(10.0, float(self.timeout)), read=float(self.timeout), write=10.0, pool=10.0
+            ),
+            limiter=quota_limiter("usda", settings.usda_rate_limit_per_hour, 3600),
+        )
+        self.base_url = settings.usda_base_url or self.BASE_URL
         self.api_key = settings.usda_api_key.strip()
         self.page_size = settings.usda_page_size
         self.debug = settings.debug_log
+        # Mirrors of the latest search() result for scripts; concurrent callers
+        # should read the returned ProviderResult instead.
         self.last_error: str = ""
         self.last_status: int | None = None
         self.last_url: str = ""
+        self.cache: TTLCache[ProviderResult] | None = None
+        if settings.usda_cache_max_entries > 0:
+            self.cache = TTLCache(
+                max_entries=settings.usda_cache_max_entries,
+                ttl_seconds=settings.usda_cache_ttl_seconds,
+                stale_seconds=settings.usda_cache_stale_seconds,
+                negative_ttl_seconds=settings.usda_cache_negative_ttl_seconds,
+            )
+        # Second tier shared with the other worker processes of a multi-worker server.
+        self.shared: SharedCache | None = None
+        if settings.provider_cache_path:
+            self.shared = SharedCache(settings.provider_cache_path, "usda", max_entries=settings.usda_cache_max_entries)
 
     async def search_products(self, query: str, page_size: int | None = None) -> list[FoodProduct]:
-        self.last_error = ""
-        self.last_status = None
-        self.last_url = ""
+        result = await self.search(query, page_size=page_size)
+        self.last_error, self.last_status, self.last_url = result.error, result.status, result.url
+        return result.products
+
+    async def search(self, query: str, page_size: int | None = None) -> ProviderResult:
+        size = int(page_size or self.page_size)
+        if not query.strip() or not self.api_key:
+            return await self._fetch(query, size)
+
+        key = (_normalize_query(query), size, self.DATA_TYPES)
+        if self.cache is None:
+            return await self.coalesced(key, lambda: self._load(key, query, size))
+        state, cached = await self.cache.get_or_load(
+            key,
+            # Concurrent misses for the same key share one upstream request.
+            lambda: self.coalesced(key, lambda: self._load(key, query, size)),
+            # Only successful round trips are cached; transport errors and 4xx/5xx are retried.
+            is_cacheable=lambda r: r.status == 200,
+            is_negative=lambda r: not r.products,
+        )
+        if self.debug:
+            print(f"[DEBUG][USDA] cache={state} query='{query}' stats={self.cache.stats.as_dict()}")
+        if state == MISS and cached.cache_status in {"coalesced", "shared"}:
+            state = cached.cache_status
+        return dataclasses.replace(cached, products=list(cached.products), cache_status=state)
+
+    async def aclose(self) -> None:
+        await super().aclose()
+        if self.shared is not None:
+            self.shared.close()
+
+    async def _load(self, key: tuple, query: str, page_size: int) -> ProviderResult:
+        if self.shared is None:
+            return await self._fetch(query, page_size)
+        shared_key = json.dumps(key)
+        stored = self.shared.get(shared_key)
+        if stored is not None:
+            return _result_from_json(stored)
+        result = await self._fetch(query, page_size)
+        if result.status == 200:
+            ttl = settings.usda_cache_ttl_seconds if result.products else settings.usda_cache_negative_ttl_seconds
+            self.shared.set(shared_key, _result_to_json(result), ttl)
+        return result
 
+    async def _fetch(self, query: str, page_size: int) -> ProviderResult:
+        result = ProviderResult(source="usda")
         if not query.strip():
-            return []
+            return result
         if not self.api_key:
-            self.last_error = "USDA API key not configured."
-            return []
+            result.error = "USDA API key not configured."
+            return result
 
         params = {"api_key": self.api_key}
         payload = {
             "query": query.strip(),
-            "pageSize": int(page_size or self.page_size),
-            "dataType": ["Branded", "Foundation", "Survey (FNDDS)"],
+            "pageSize": page_size,
+            "dataType": list(self.DATA_TYPES),
         }
-        headers = {"User-Agent": "opencommerce-ai-assistant/0.1", "Accept": "application/json"}
-
-        timeout = httpx.Timeout(connect=10.0, read=max(20.0, float(self.timeout)), write=10.0, pool=10.0)
-        async with httpx.AsyncClient(timeout=timeout, headers=headers) as client:
-            try:
-                response = await client.post(self.BASE_URL, params=params, json=payload)
-                self.last_status = response.status_code
-                self.last_url = str(response.request.url)
-                if self.debug:
-                    safe_url = _redact_query_params(self.last_url, {"api_key"})
-                    print(f"[DEBUG][USDA] status={self.last_status} url={safe_url} query='{query}'")
-                response.raise_for_status()
-                data: dict[str, Any] = response.json()
-            except httpx.HTTPStatusError as exc:
-                self.last_error = f"USDA HTTP {exc.response.status_code}"
-                return []
-            except httpx.HTTPError as exc:
-                self.last_error = f"USDA network error: {exc.__class__.__name__}"
-                return []
+
+        try:
+            response = await self.request("POST", self.base_url, params=params, json=payload)
+            result.status = response.status_code
+            result.url = str(response.request.url)
+            if self.debug:
+                safe_url = _redact_query_params(result.url, {"api_key"})
+                print(f"[DEBUG][USDA] status={result.status} url={safe_url} query='{query}'")
+            response.raise_for_status()
+            data: dict[str, Any] = loads(response.content)
+        except httpx.HTTPStatusError as exc:
+            result.error = f"USDA HTTP {exc.response.status_code}"
+            return result
+        except httpx.HTTPError as exc:
+            result.error = f"USDA network error: {exc.__class__.__name__}"
+            return result
+        except ValueError:
+            result.error = "USDA returned a malformed response."
+            return result
 
         foods = data.get("foods", []) or []
-        result = [self._to_food_product(item) for item in foods if item.get("description")]
+        result.products = [decode_food(item) for item in foods if item.get("description")]
         if self.debug:
-            print(f"[DEBUG][USDA] returned_products={len(result)} query='{query}'")
-        if not result and not self.last_error:
-            self.last_error = "No products returned by USDA FoodData Central for this query."
+            print(f"[DEBUG][USDA] returned_products={len(result.products)} query='{query}'")
+        if not result.products:
+            result.error = "No products returned by USDA FoodData Central for this query."
         return result
 
-    @staticmethod
-    def _to_food_product(item: dict[str, Any]) -> FoodProduct:
-        nutrients = item.get("foodNutrients", []) or []
-
-        kcal = _extract_nutrient(nutrients, {"Energy"})
-        sugar = _extract_nutrient(nutrients, {"Sugars, total including NLEA", "Sugars, total"})
-        protein = _extract_nutrient(nutrients, {"Protein"})
-        fat = _extract_nutrient(nutrients, {"Total lipid (fat)"})
-        sodium_mg = _extract_nutrient(nutrients, {"Sodium, Na"})
-        salt_g = (sodium_mg / 1000.0) * 2.5 if sodium_mg is not None else None
-
-        brand = str(item.get("brandOwner", "") or item.get("brandName", ""))
-        desc = str(item.get("description", ""))
-        fdc_id = str(item.get("fdcId", ""))
-        return FoodProduct(
-            code=fdc_id,
-            product_name=desc,
-            brands=brand,
-            nutriscore_grade="",
-            energy_kcal_100g=kcal,
-            sugars_100g=sugar,
-            proteins_100g=protein,
-            fat_100g=fat,
-            salt_100g=salt_g,
-            ingredients_text=str(item.get("ingredients", "")),
-            url=f"https://fdc.nal.usda.gov/fdc-app.html#/food-details/{fdc_id}/nutrients" if fdc_id else "",
-        )
+
+def _result_to_json(result: ProviderResult) -> dict[str, Any]:
+    return {
+        "products": [p.model_dump() for p in result.products],
+        "source": result.source,
+        "error": result.error,
+        "status": result.status,
+        # The file outlives the process and is readable by every worker: never store the key.
+        "url": _redact_query_params(result.url, {"api_key"}),
+    }
+
+
+def _result_from_json(data: dict[str, Any]) -> ProviderResult:
+    return ProviderResult(
+        products=[FoodProduct.model_validate(p) for p in data.get("products", [])],
+        source=data.get("source", "usda"),
+        error=data.get("error", ""),
+        status=data.get("status"),
+        url=data.get("url", ""),
+        cache_status="shared",
+    )
 
 
-def _extract_nutrient(nutrients: list[dict[str, Any]], names: set[str]) -> float | None:
-    for n in nutrients:
-        name = str(n.get("nutrientName", ""))
-        if name in names:
-            value = n.get("value")
-            try:
-                if value is None:
-                    return None
-                return float(value)
-            except (TypeError, ValueError):
-                return None
-    return None
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
 
 
 def _redact_query_params(url: str, keys: set[str]) -> str:
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from app.schemas import FoodProduct
+
+# orjson is optional; it parses large search pages several times faster.
+if importlib.util.find_spec("orjson") is not None:
+    import orjson
+
+    loads: Callable[[bytes | str], Any] = orjson.loads
+else:
+    loads = json.loads
+
+KJ_PER_KCAL = 4.184
+
+
+@dataclass(frozen=True)
+class NutrientField:
+    """A FoodProduct field and the USDA nutrient numbers that fill it, in preference order."""
+
+    field: str
+    sources: tuple[tuple[str, float], ...]  # (nutrient number, factor into the field's unit)
+
+
+NUTRIENT_FIELDS = (
+    # 208 is kcal; the Atwater variants are kcal too; 268 is kJ and only used when nothing else is present.
+    NutrientField("energy_kcal_100g", (("208", 1.0), ("957", 1.0), ("958", 1.0), ("268", 1 / KJ_PER_KCAL))),
+    NutrientField("sugars_100g", (("269", 1.0), ("269.3", 1.0))),
+    NutrientField("proteins_100g", (("203", 1.0),)),
+    NutrientField("fat_100g", (("204", 1.0),)),
+    # Sodium (mg) -> salt (g).
+    NutrientField("salt_100g", (("307", 2.5 / 1000),)),
+    NutrientField("fiber_100g", (("291", 1.0),)),
+    NutrientField("saturated_fat_100g", (("606", 1.0),)),
+    NutrientField("added_sugars_100g", (("539", 1.0),)),
+)
+
+# Full-format records carry nutrientId only; older fixtures carry only names.
+_NUMBER_BY_ID = {
+    1008: "208", 2047: "957", 2048: "958", 1062: "268", 2000: "269", 1063: "269.3",
+    1003: "203", 1004: "204", 1093: "307", 1079: "291", 1258: "606", 1235: "539",
+}
+_NUMBER_BY_NAME = {
+    "Energy": "208",
+    "Energy (Atwater General Factors)": "957",
+    "Energy (Atwater Specific Factors)": "958",
+    "Sugars, total including NLEA": "269",
+    "Total Sugars": "269",
+    "Sugars, total": "269.3",
+    "Protein": "203",
+    "Total lipid (fat)": "204",
+    "Sodium, Na": "307",
+    "Fiber, total dietary": "291",
+    "Fatty acids, total saturated": "606",
+    "Sugars, added": "539",
+}
+_ENERGY_NUMBERS = {"208", "268", "957", "958"}
+_GRAM_UNITS = {"g", "grm", "ml", "mlt"}
+_validate = FoodProduct.__pydantic_validator__.validate_python
+
+# nutrient number -> (field index, preference rank, factor)
+_SLOTS = {
+    number: (idx, rank, factor)
+    for idx, spec in enumerate(NUTRIENT_FIELDS)
+    for rank, (number, factor) in enumerate(spec.sources)
+}
+
+
+def decode_nutrients(nutrients: list[dict[str, Any]]) -> dict[str, float | None]:
+    """Walk `foodNutrients` once and return every NUTRIENT_FIELDS value (None when absent)."""
+    best: dict[int, tuple[int, float]] = {}
+    slots = _SLOTS
+    for nutrient in nutrients:
+        number = nutrient.get("nutrientNumber") or _fallback_number(nutrient)
+        slot = slots.get(number)
+        if slot is None:
+            continue
+        if number in _ENERGY_NUMBERS:
+            slot = slots[_energy_number(number, nutrient)]
+        idx, rank, factor = slot
+        held = best.get(idx)
+        if held is not None and held[0] <= rank:
+            continue
+        # A preferred nutrient without a usable value must not shadow a lower-ranked one that has it.
+        value = _scaled(nutrient.get("value"), factor)
+        if value is not None:
+            best[idx] = (rank, value)
+    return {spec.field: best[idx][1] if idx in best else None for idx, spec in enumerate(NUTRIENT_FIELDS)}
+
+
+def decode_food(item: dict[str, Any]) -> FoodProduct:
+    """Build a FoodProduct from one search hit through the schema's compiled validator."""
+    fdc_id = str(item.get("fdcId", "") or "")
+    values = decode_nutrients(item.get("foodNutrients") or [])
+    values.update(
+        code=fdc_id,
+        product_name=str(item.get("description", "") or ""),
+        brands=str(item.get("brandOwner", "") or item.get("brandName", "") or ""),
+        gtin=str(item.get("gtinUpc", "") or ""),
+        nutriscore_grade="",
+        serving_size_g=_serving_grams(item),
+        ingredients_text=str(item.get("ingredients", "") or ""),
+        url=f"https://fdc.nal.usda.gov/fdc-app.html#/food-details/{fdc_id}/nutrients" if fdc_id else "",
+    )
+    # Skips BaseModel.__init__ bookkeeping; field validation still runs.
+    return _validate(values)
+
+
+def _fallback_number(nutrient: dict[str, Any]) -> str:
+    return _NUMBER_BY_ID.get(nutrient.get("nutrientId")) or _NUMBER_BY_NAME.get(nutrient.get("nutrientName"), "")
+
+
+def _serving_grams(item: dict[str, Any]) -> float | None:
+    # Branded foods report servings in g or ml; ml is taken as g (drinks are close to water).
+    if str(item.get("servingSizeUnit", "")).lower() not in _GRAM_UNITS:
+        return None
+    return _scaled(item.get("servingSize"), 1.0)
+
+
+def _energy_number(number: str, nutrient: dict[str, Any]) -> str:
+    # "Energy" rows come in both units and are sometimes mislabeled; the unit decides.
+    unit = str(nutrient.get("unitName", "")).upper()
+    if unit == "KJ":
+        return "268"
+    if unit == "KCAL" and number == "268":
+        return "208"
+    return number
+
+
+def _scaled(value: Any, factor: float) -> float | None:
+    if value is None:
+        return None
+    try:
+        out = float(value)
+    except (TypeError, ValueError):
+        return None
+    return out * factor if factor != 1.0 else out
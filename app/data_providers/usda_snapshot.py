@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import re
+import sqlite3
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from app.cache.ttl import TTLCache
+from app.config import settings
+from app.data_providers.base import ProviderResult
+from app.schemas import FoodProduct
+
+# FoodData Central `food.data_type` values kept in the snapshot.
+SNAPSHOT_DATA_TYPES = {
+    "branded_food": "Branded",
+    "foundation_food": "Foundation",
+    "survey_fndds_food": "Survey (FNDDS)",
+}
+
+# Nutrient numbers (nutrient.csv `nutrient_nbr`) mapped to snapshot columns.
+SNAPSHOT_NUTRIENTS = {
+    "208": "kcal",
+    "958": "kcal_atwater_specific",
+    "957": "kcal_atwater_general",
+    "268": "kj",
+    "269": "sugar",
+    "203": "protein",
+    "204": "fat",
+    "307": "sodium_mg",
+}
+
+_SCHEMA = """
+CREATE TABLE foods (
+    fdc_id INTEGER PRIMARY KEY,
+    data_type TEXT NOT NULL,
+    description TEXT NOT NULL,
+    brand TEXT NOT NULL DEFAULT '',
+    gtin TEXT NOT NULL DEFAULT '',
+    ingredients TEXT NOT NULL DEFAULT '',
+    kcal REAL,
+    sugar REAL,
+    protein REAL,
+    fat REAL,
+    sodium_mg REAL
+);
+CREATE VIRTUAL TABLE foods_fts USING fts5(
+    description, brand, ingredients,
+    content='foods', content_rowid='fdc_id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class USDASnapshotClient:
+    """
+    Serves USDA FoodData Central searches from a local SQLite FTS5 index built
+    by `build_snapshot`, so lookups need no network round trip or API quota.
+    """
+
+    def __init__(self, path: str | Path | None = None) -> None:
+        self.path = Path(path or settings.usda_snapshot_path)
+        self.page_size = settings.usda_page_size
+        self.debug = settings.debug_log
+        self.last_error: str = ""
+        self.last_status: int | None = None
+        self.last_url: str = ""
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        # The snapshot is immutable, so repeat queries are answered from memory.
+        self.cache: TTLCache[list[FoodProduct]] = TTLCache(
+            max_entries=max(1, settings.usda_cache_max_entries),
+            ttl_seconds=float("inf"),
+        )
+
+    async def start(self) -> None:
+        with self._lock:
+            self._connect()
+
+    async def aclose(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def search_products(self, query: str, page_size: int | None = None) -> list[FoodProduct]:
+        result = await self.search(query, page_size=page_size)
+        self.last_error, self.last_status, self.last_url = result.error, result.status, result.url
+        return result.products
+
+    async def search(self, query: str, page_size: int | None = None) -> ProviderResult:
+        result = ProviderResult(source="usda-snapshot", url=str(self.path))
+        tokens = _TOKEN_RE.findall(query.lower())
+        if not tokens:
+            return result
+        key = (" ".join(tokens), int(page_size or self.page_size))
+        state, cached = self.cache.lookup(key)
+        if cached is not None:
+            result.products = list(cached)
+            result.cache_status = state
+        else:
+            try:
+                products = await asyncio.to_thread(self.search_sync, tokens, key[1])
+            except sqlite3.Error as exc:
+                result.error = f"USDA snapshot error: {exc.__class__.__name__}: {exc}"
+                return result
+            self.cache.set(key, products, negative=not products)
+            result.products = list(products)
+            result.cache_status = state
+        if self.debug:
+            print(f"[DEBUG][USDA-SNAPSHOT] returned_products={len(result.products)} query='{query}'")
+        if not result.products:
+            result.error = "No products found in the local USDA FoodData Central snapshot for this query."
+        return result
+
+    def search_sync(self, tokens: list[str], limit: int) -> list[FoodProduct]:
+        quoted = " AND ".join(f'"{t}"' for t in dict.fromkeys(tokens))
+        with self._lock:
+            conn = self._connect()
+            # Name/brand matches are both the most relevant and the most selective;
+            # widen to ingredients, then to any token, only when they miss.
+            rows = self._match(conn, "{description brand}: (" + quoted + ")", limit)
+            if not rows:
+                rows = self._match(conn, quoted, limit)
+            if not rows and len(tokens) > 1:
+                rows = self._match(conn, " OR ".join(f'"{t}"' for t in dict.fromkeys(tokens)), limit)
+        return [_row_to_food_product(row) for row in rows]
+
+    @staticmethod
+    def _match(conn: sqlite3.Connection, expression: str, limit: int) -> list[tuple]:
+        return conn.execute(
+            """
+            SELECT f.fdc_id, f.description, f.brand, f.gtin, f.ingredients,
+                   f.kcal, f.sugar, f.protein, f.fat, f.sodium_mg
+            FROM foods_fts
+            JOIN foods AS f ON f.fdc_id = foods_fts.rowid
+            WHERE foods_fts MATCH ?
+            ORDER BY bm25(foods_fts, 10.0, 5.0, 1.0)
+            LIMIT ?
+            """,
+            (expression, limit),
+        ).fetchall()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Callers hold self._lock, so worker threads never open (and leak) a second connection.
+        if self._conn is None:
+            if not self.path.exists():
+                raise sqlite3.OperationalError(f"snapshot not found at {self.path}")
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.execute("PRAGMA mmap_size = 1073741824")
+        return self._conn
+
+
+def _row_to_food_product(row: tuple) -> FoodProduct:
+    fdc_id, description, brand, gtin, ingredients, kcal, sugar, protein, fat, sodium_mg = row
+    return FoodProduct(
+        code=str(fdc_id),
+        product_name=description,
+        brands=brand,
+        gtin=gtin,
+        energy_kcal_100g=kcal,
+        sugars_100g=sugar,
+        proteins_100g=protein,
+        fat_100g=fat,
+        salt_100g=(sodium_mg / 1000.0) * 2.5 if sodium_mg is not None else None,
+        ingredients_text=ingredients,
+        url=f"https://fdc.nal.usda.gov/fdc-app.html#/food-details/{fdc_id}/nutrients",
+    )
+
+
+def build_snapshot(source_dirs: Iterable[str | Path], out_path: str | Path) -> int:
+    """
+    Ingest extracted FoodData Central CSV downloads (Branded, Foundation,
+    Survey FNDDS) into a SQLite FTS5 index. Returns the number of foods indexed.
+    """
+    out = Path(out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(out.suffix + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(
+            "PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;"
+            "CREATE TEMP TABLE staging_food (fdc_id INTEGER PRIMARY KEY, data_type TEXT, description TEXT,"
+            " brand TEXT DEFAULT '', gtin TEXT DEFAULT '', ingredients TEXT DEFAULT '');"
+            "CREATE TEMP TABLE staging_nutrient (fdc_id INTEGER, field TEXT, amount REAL);"
+        )
+        conn.executescript(_SCHEMA)
+        for source in source_dirs:
+            _ingest_dir(conn, Path(source))
+
+        pivot = ", ".join(
+            f"MAX(CASE WHEN n.field = '{field}' THEN n.amount END) AS {field}"
+            for field in SNAPSHOT_NUTRIENTS.values()
+        )
+        conn.executescript(
+            f"""
+            CREATE INDEX temp.staging_nutrient_fdc ON staging_nutrient (fdc_id);
+            INSERT INTO foods
+            SELECT fdc_id, data_type, description, brand, gtin, ingredients,
+                   COALESCE(kcal, kcal_atwater_specific, kcal_atwater_general, kj / 4.184),
+                   sugar, protein, fat, sodium_mg
+            FROM (
+                SELECT s.fdc_id, s.data_type, s.description, s.brand, s.gtin, s.ingredients, {pivot}
+                FROM staging_food AS s
+                LEFT JOIN staging_nutrient AS n ON n.fdc_id = s.fdc_id
+                GROUP BY s.fdc_id
+            );
+            INSERT INTO foods_fts(foods_fts) VALUES ('rebuild');
+            INSERT INTO foods_fts(foods_fts) VALUES ('optimize');
+            """
+        )
+        count = conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+        conn.commit()
+    finally:
+        conn.close()
+    tmp.replace(out)
+    return count
+
+
+def _ingest_dir(conn: sqlite3.Connection, source: Path) -> None:
+    # Rows stream from the CSVs into SQLite in batches; the full FDC dump never sits in memory.
+    # Brand and nutrient rows are matched against staging_food by primary key instead of a Python set.
+    _insert_batches(
+        conn,
+        "INSERT OR REPLACE INTO staging_food (fdc_id, data_type, description) VALUES (?, ?, ?)",
+        (
+            (int(row["fdc_id"]), SNAPSHOT_DATA_TYPES[row["data_type"]], (row.get("description") or "").strip())
+            for row in _read_csv(source / "food.csv")
+            if row.get("data_type") in SNAPSHOT_DATA_TYPES and (row.get("description") or "").strip()
+        ),
+    )
+
+    branded = source / "branded_food.csv"
+    if branded.exists():
+        _insert_batches(
+            conn,
+            "UPDATE staging_food SET brand = ?, gtin = ?, ingredients = ? WHERE fdc_id = ?",
+            (
+                (
+                    (row.get("brand_owner") or row.get("brand_name") or "").strip(),
+                    (row.get("gtin_upc") or "").strip(),
+                    (row.get("ingredients") or "").strip(),
+                    int(row["fdc_id"]),
+                )
+                for row in _read_csv(branded)
+            ),
+        )
+
+    nutrient_fields = {
+        row["id"]: SNAPSHOT_NUTRIENTS[row["nutrient_nbr"]]
+        for row in _read_csv(source / "nutrient.csv")
+        if row.get("nutrient_nbr") in SNAPSHOT_NUTRIENTS
+    }
+    _insert_batches(
+        conn,
+        "INSERT INTO staging_nutrient (fdc_id, field, amount)"
+        " SELECT fdc_id, ?, ? FROM staging_food WHERE fdc_id = ?",
+        (
+            (nutrient_fields[row["nutrient_id"]], float(row["amount"]), int(row["fdc_id"]))
+            for row in _read_csv(source / "food_nutrient.csv")
+            if row.get("nutrient_id") in nutrient_fields and row.get("amount") not in (None, "")
+        ),
+    )
+
+
+def _insert_batches(conn: sqlite3.Connection, sql: str, rows: Iterable[tuple], size: int = 10_000) -> None:
+    it = iter(rows)
+    while batch := list(islice(it, size)):
+        conn.executemany(sql, batch)
+
+
+def _read_csv(path: Path) -> Iterator[dict[str, str]]:
+    with path.open(newline="", encoding="utf-8") as fh:
+        yield from csv.DictReader(fh)
@@ -1,46 +1,35 @@
 from __future__ import annotations
 
-import os
-from urllib.parse import urlparse
-
-from openai import OpenAI
-
-from app.config import settings
+from app.llm.gateway import LLMGateway, is_valid_http_url
 from app.llm.parser import parse_intent_output
 from app.llm.prompts import INTENT_PROMPT
 from app.schemas import IntentPayload
 
 
 class IntentExtractor:
-    def __init__(self) -> None:
-        self.model = settings.openai_model
-        self.client = None
+    def __init__(self, gateway: LLMGateway | None = None) -> None:
+        self.gateway = gateway or LLMGateway()
+        self.model = self.gateway.model
         self.last_source = "fallback"
-        if settings.openai_api_key:
-            kwargs = {"api_key": settings.openai_api_key}
-            if self._is_valid_http_url(settings.openai_base_url):
-                kwargs["base_url"] = settings.openai_base_url
-            else:
-                # Let OpenAI SDK use its default URL when direct API is intended.
-                os.environ.pop("OPENAI_BASE_URL", None)
-            self.client = OpenAI(**kwargs)
 
-    def extract(self, user_text: str) -> IntentPayload:
+    @property
+    def client(self):
+        return self.gateway.client
+
+    async def extract(self, user_text: str) -> IntentPayload:
         if not self.client:
             self.last_source = "fallback"
             return parse_intent_output("", fallback_query=user_text)
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                temperature=0.0,
-                max_tokens=240,
-                messages=[
+            output = await self.gateway.chat(
+                [
                     {"role": "system", "content": INTENT_PROMPT},
                     {"role": "user", "content": user_text},
                 ],
+                temperature=0.0,
+                max_tokens=240,
             )
-            output = response.choices[0].message.content or ""
             self.last_source = "llm"
             return parse_intent_output(output, fallback_query=user_text)
         except Exception:
@@ -50,7 +39,4 @@ class IntentExtractor:
 
     @staticmethod
     def _is_valid_http_url(value: str) -> bool:
-        if not value:
-            return False
-        parsed = urlparse(value)
-        return parsed.scheme in {"http", "https"} and bool(parsed.netloc)
+        return is_valid_http_url(value)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+
+from app.config import settings
+
+# Compiled once; these run over every prompt.
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_")
+_SOURCE_TAG_RE = re.compile(r"^\[source:[^\]]*\]\s*")
+_WORD_RE = re.compile(r"\S+")
+
+# Chat-format framing the API adds around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+HISTORY_MESSAGES = 6
+HISTORY_USER_TOKENS = 200
+HISTORY_REPLY_TOKENS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local BPE-style token estimate: a word is one token per 8 letters, a
+    number one per 3 digits, and every symbol one. Close enough to the real
+    tokenizer to size prompts, and needs no model files or network.
+    """
+    count = 0
+    for piece in _PIECE_RE.findall(text or ""):
+        if piece[0].isdigit():
+            count += (len(piece) + 2) // 3
+        elif piece[0].isalpha():
+            count += (len(piece) + 7) // 8
+        else:
+            count += 1
+    return count
+
+
+def clip_tokens(text: str, max_tokens: int) -> str:
+    """`text` cut at a word boundary to at most about `max_tokens` tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    out: list[str] = []
+    used = 0
+    for word in _WORD_RE.findall(text):
+        cost = estimate_tokens(word)
+        if used + cost > max_tokens - 1:
+            break
+        out.append(word)
+        used += cost
+    return " ".join(out) + " …"
+
+
+def compact_reply(text: str, max_tokens: int = HISTORY_REPLY_TOKENS) -> str:
+    """
+    An earlier assistant reply as history for the model: the source tag, match
+    quality notes and headings are dropped, and a comparison table becomes one
+    line naming its products and goal. The prose is clipped to `max_tokens`.
+    """
+    prose: list[str] = []
+    products: list[str] = []
+    goal = ""
+    in_servings = False
+    for line in _SOURCE_TAG_RE.sub("", (text or "").strip()).splitlines():
+        line = line.strip()
+        if line == "Match quality":
+            break
+        # Per-serving figures restate the table.
+        if line == "Per serving":
+            in_servings = True
+            continue
+        if in_servings and (not line or line.startswith("- ")):
+            continue
+        in_servings = False
+        if line.startswith("|"):
+            cells = [c.strip() for c in line.strip("|").split("|")]
+            # Data rows only: skip the header and the |---| separator.
+            if len(cells) > 1 and cells[1] not in {"Product", ""} and not cells[1].startswith("-"):
+                products.append(cells[1])
+        elif line.startswith("Assumed goal:"):
+            goal = line.split(":", 1)[1].strip()
+        elif line and line != "Comparison table" and not line.startswith("#"):
+            prose.append(line)
+    out = clip_tokens(" ".join(prose), max_tokens)
+    if products:
+        table = "[table shown: " + "; ".join(products) + (f" | goal: {goal}" if goal else "") + "]"
+        out = f"{out}\n{table}" if out else table
+    return out
+
+
+@dataclass
+class ContextBlock:
+    """Catalog rows for one searched item, best match first, under an optional header line."""
+
+    header: str = ""
+    rows: list[str] = field(default_factory=list)
+
+
+@dataclass
+class PromptBuilder:
+    """
+    Assembles the messages for one model call within a token budget. The
+    system prompt and the current request are always sent; the rest is added
+    by priority while it fits: catalog rows (every block's best match first,
+    then the runners-up rank by rank), session state, then the most recent
+    history. A budget of 0 or less means no limit.
+    """
+
+    budget: int = field(default_factory=lambda: settings.prompt_token_budget)
+    history_messages: int = HISTORY_MESSAGES
+
+    def build(
+        self,
+        system: str,
+        request: str,
+        blocks: list[ContextBlock] | None = None,
+        session: str = "",
+        history: list[dict] | None = None,
+    ) -> list[dict]:
+        used = estimate_tokens(system) + estimate_tokens(request) + 2 * MESSAGE_OVERHEAD_TOKENS
+        rows, used = self._fill_rows(blocks or [], used)
+        parts = []
+        if session:
+            line = f"SESSION_STATE: {session}"
+            if self._fits(used, line):
+                parts.append(line)
+                used += estimate_tokens(line)
+        parts.append(request)
+        if blocks:
+            parts.append("CATALOG_CONTEXT:\n" + "\n\n".join(rows))
+        earlier = self._fill_history(history or [], used)
+        return [{"role": "system", "content": system}, *earlier, {"role": "user", "content": "\n\n".join(parts)}]
+
+    def _fits(self, used: int, text: str) -> bool:
+        return self.budget <= 0 or used + estimate_tokens(text) <= self.budget
+
+    def _fill_rows(self, blocks: list[ContextBlock], used: int) -> tuple[list[str], int]:
+        kept: list[list[str]] = [[] for _ in blocks]
+        depth = max((len(b.rows) for b in blocks), default=0)
+        full = False
+        for rank in range(depth):
+            for block, lines in zip(blocks, kept):
+                if rank >= len(block.rows):
+                    continue
+                row = block.rows[rank]
+                cost = estimate_tokens(row) + (estimate_tokens(block.header) if rank == 0 else 0)
+                # Every block's best row is sent regardless: without it the answer has nothing to ground on.
+                if rank and (full or (self.budget > 0 and used + cost > self.budget)):
+                    full = True
+                    continue
+                lines.append(row)
+                used += cost
+        rendered = ["\n".join(([b.header] if b.header else []) + lines) for b, lines in zip(blocks, kept)]
+        return rendered, used
+
+    def _fill_history(self, history: list[dict], used: int) -> list[dict]:
+        picked: list[dict] = []
+        for msg in reversed(history[-self.history_messages :]):
+            role = str(msg.get("role", "")).strip().lower()
+            content = str(msg.get("content", "")).strip()
+            if role == "assistant":
+                content = compact_reply(content)
+            elif role == "user":
+                content = clip_tokens(content, HISTORY_USER_TOKENS)
+            else:
+                continue
+            if not content:
+                continue
+            cost = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            if self.budget > 0 and used + cost > self.budget:
+                # Older turns matter less than newer ones: stop rather than skip ahead.
+                break
+            picked.append({"role": role, "content": content})
+            used += cost
+        picked.reverse()
+        return picked
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+@dataclass(frozen=True)
+class CueRule:
+    signal: str
+    cues: tuple[str, ...]
+
+
+GOALS = ("lower calories", "lower sugar", "higher protein", "lower sodium", "lower fat")
+
+# Substring cues (matched against lowercased text, spaces included) and the signal each raises.
+CUE_RULES = (
+    CueRule("compare_split", (" vs ", " versus ", " or ", "compare ", "which has better", "better than")),
+    CueRule(
+        "correction",
+        (
+            "didn t ask about that",
+            "didn't ask about that",
+            "not related to my query",
+            "not what i asked",
+            "you are wrong",
+            "your answer wasn't related",
+            "answer was not related",
+            "off topic",
+        ),
+    ),
+    CueRule("memory", ("products i asked", "what products", "list the products", "conversation history", "earlier products")),
+    CueRule("catalog_term", ("brand", "bar", "bottle", "snickers", "doritos", "gatorade", "coca", "pepsi")),
+    CueRule(
+        "general_term",
+        ("more calories than", "vs", "versus", "is it good", "healthy", "calories in an", "calories in a"),
+    ),
+    CueRule("compare_cue", ("compare", " vs ", " versus ", " or ", " with ", "better than", "which is better")),
+    CueRule("goal:lower calories", ("calorie", "kcal", "less calorie", "lower calorie", "calorie dense")),
+    CueRule("goal:lower sugar", ("sugar", "less sweet", "lower sugar")),
+    CueRule("goal:higher protein", ("protein", "more protein", "high protein")),
+    CueRule("goal:lower sodium", ("sodium", "salt", "electrolyte")),
+    CueRule("goal:lower fat", ("fat", "grease", "greasy")),
+    CueRule("asks_better", ("better", "healthier", "best option", "which is best")),
+    CueRule("has_goal", ("calorie", "kcal", "sugar", "protein", "sodium", "salt", "fat", "electrolyte")),
+    CueRule(
+        "catalog_force",
+        ("show me", "find me", "look up", "nutrition facts for", "product", "products", "option", "options"),
+    ),
+)
+
+
+class CueMatcher:
+    """
+    Compiles every cue into one prefix-factored regex and reports all signals
+    in a single scan. A zero-width lookahead tries each text position and takes
+    the longest cue there; cues that are prefixes of it start at the same
+    position, so their signals are folded into it at compile time.
+    """
+
+    def __init__(self, rules: tuple[CueRule, ...]) -> None:
+        signals_by_cue: dict[str, set[str]] = {}
+        for rule in rules:
+            for cue in rule.cues:
+                signals_by_cue.setdefault(cue, set()).add(rule.signal)
+        cues = sorted(signals_by_cue, key=len, reverse=True)
+        self._signals = {
+            cue: frozenset().union(*(signals_by_cue[p] for p in cues if cue.startswith(p))) for cue in cues
+        }
+        self._pattern = re.compile("(?=(" + _trie_pattern(cues) + "))")
+
+    def scan(self, text: str) -> frozenset[str]:
+        found: set[str] = set()
+        for match in self._pattern.finditer(text):
+            found |= self._signals[match.group(1)]
+        return frozenset(found)
+
+
+def _trie_pattern(words: list[str]) -> str:
+    # Shared prefixes become one branch, so a position fails after one character
+    # instead of after trying every cue; greedy optionals keep longest-match order.
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+CUES = CueMatcher(CUE_RULES)
+
+
+@lru_cache(maxsize=4096)
+def cue_signals(text: str) -> frozenset[str]:
+    """Signals raised by `text`; cached because history messages are rescanned every turn."""
+    return CUES.scan((text or "").lower())
+
+
+def goal_from_signals(signals: frozenset[str]) -> str:
+    # Several goals in one message ("less sugar, more protein") are kept together and ranked equally weighted.
+    return ", ".join(goal for goal in GOALS if f"goal:{goal}" in signals)
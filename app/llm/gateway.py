@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator
+from urllib.parse import urlparse
+
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
+
+from app.cache.singleflight import SingleFlight
+from app.config import settings
+from app.data_providers.ratelimit import UpstreamLimiter
+from app.data_providers.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, budget_timeout
+from app.observability.tracing import record_cache, record_tokens
+
+
+class LLMGateway:
+    """
+    Shared async entrypoint for every model call.
+    Admits completions through an adaptive, header-aware rate limiter and
+    enforces a per-call timeout, clipped to the turn deadline, so a slow
+    completion only delays the turn that issued it. A circuit breaker fails
+    calls fast while the API keeps erroring. Identical non-streaming calls
+    that overlap in time share one request.
+    """
+
+    def __init__(self) -> None:
+        self.model = settings.openai_model
+        self.timeout = float(settings.llm_timeout_seconds)
+        self.client: AsyncOpenAI | None = None
+        # The quota is per account: each worker process gets an equal share.
+        rate = settings.llm_rate_limit_rpm / 60 / max(1, settings.web_workers) if settings.llm_rate_limit_rpm > 0 else 0.0
+        self.limiter = UpstreamLimiter(
+            "llm",
+            rate_per_second=rate,
+            burst=max(1.0, rate * 60),
+            max_concurrency=max(1, settings.llm_max_concurrency),
+        )
+        self.breaker = CircuitBreaker(
+            "llm",
+            failure_threshold=settings.circuit_failure_threshold,
+            reset_seconds=settings.circuit_reset_seconds,
+        )
+        self.flights: SingleFlight[str] | None = SingleFlight() if settings.coalesce_requests else None
+
+        if settings.openai_api_key:
+            kwargs: dict[str, Any] = {
+                "api_key": settings.openai_api_key,
+                "timeout": self.timeout,
+                "max_retries": settings.llm_max_retries,
+            }
+            if is_valid_http_url(settings.openai_base_url):
+                kwargs["base_url"] = settings.openai_base_url
+            else:
+                # Let OpenAI SDK use its default URL when direct API is intended.
+                os.environ.pop("OPENAI_BASE_URL", None)
+            self.client = AsyncOpenAI(**kwargs)
+
+    @property
+    def enabled(self) -> bool:
+        return self.client is not None
+
+    def warm_up(self) -> None:
+        # The SDK imports its API resources on first attribute access (about 0.4 s);
+        # paid at startup instead of by the first turn.
+        if self.client is not None:
+            _ = self.client.chat, self.client.responses
+
+    async def chat(self, messages: list[dict], timeout: float | None = None, **params: Any) -> str:
+        if not self.client:
+            raise RuntimeError("OPENAI_API_KEY is not configured.")
+        return await self._coalesced(("chat", messages, params), lambda: self._chat(messages, timeout, **params))
+
+    async def _chat(self, messages: list[dict], timeout: float | None = None, **params: Any) -> str:
+        response = await self._limited(
+            self.client.chat.completions.with_raw_response.create,
+            timeout,
+            model=self.model,
+            messages=messages,
+            **params,
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_tokens(usage.prompt_tokens, usage.completion_tokens)
+        return response.choices[0].message.content or ""
+
+    async def stream_chat(
+        self, messages: list[dict], timeout: float | None = None, **params: Any
+    ) -> AsyncIterator[str]:
+        if not self.client:
+            raise RuntimeError("OPENAI_API_KEY is not configured.")
+        self._check_circuit()
+        async with self.limiter.slot():
+            # The timeout bounds time to the first byte; the SDK read timeout bounds gaps between chunks.
+            # Once text is flowing the user sees progress, so the turn deadline does not cut the stream.
+            limit, clipped = budget_timeout(timeout or self.timeout)
+            with self._health(clipped):
+                stream = await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **params,
+                    ),
+                    timeout=limit,
+                )
+            self.limiter.observe(200)
+            try:
+                async for chunk in stream:
+                    # With include_usage the final chunk carries token counts and no choices.
+                    if getattr(chunk, "usage", None) is not None:
+                        record_tokens(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            finally:
+                await stream.close()
+
+    async def respond(self, input_text: str, timeout: float | None = None) -> str:
+        if not self.client:
+            raise RuntimeError("OPENAI_API_KEY is not configured.")
+        return await self._coalesced(("respond", input_text), lambda: self._respond(input_text, timeout))
+
+    async def _respond(self, input_text: str, timeout: float | None = None) -> str:
+        response = await self._limited(
+            self.client.responses.with_raw_response.create, timeout, model=self.model, input=input_text
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_tokens(usage.input_tokens, usage.output_tokens)
+        return responses_text(response)
+
+    async def _limited(self, create: Callable[..., Awaitable[Any]], timeout: float | None, **kwargs: Any) -> Any:
+        """Call a `with_raw_response` endpoint inside a limiter slot, feeding its rate-limit headers back."""
+        self._check_circuit()
+        async with self.limiter.slot():
+            limit, clipped = budget_timeout(timeout or self.timeout)
+            try:
+                with self._health(clipped):
+                    raw = await asyncio.wait_for(create(**kwargs), timeout=limit)
+            except RateLimitError as exc:
+                self.limiter.observe(429, exc.response.headers)
+                raise
+            except asyncio.TimeoutError:
+                self.limiter.observe(None, overloaded=True)
+                raise
+            self.limiter.observe(raw.status_code, raw.headers)
+        return raw.parse()
+
+    def _check_circuit(self) -> None:
+        if not self.breaker.allow():
+            raise CircuitOpenError("llm circuit open")
+
+    @contextmanager
+    def _health(self, clipped: bool) -> Iterator[None]:
+        # Only connection failures, timeouts and 5xx count against the API; 4xx are the request's fault.
+        try:
+            yield
+        except asyncio.TimeoutError:
+            if clipped:
+                # The turn ran out of budget; that says nothing about the API's health.
+                raise DeadlineExceeded() from None
+            self.breaker.record_failure()
+            raise
+        except (APIConnectionError, InternalServerError):
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+
+    async def _coalesced(self, request: tuple, call: Callable[[], Awaitable[str]]) -> str:
+        if self.flights is None:
+            return await call()
+        key = (self.model, json.dumps(request, sort_keys=True, default=str))
+        text, shared = await self.flights.do(key, call)
+        if shared:
+            record_cache("llm_inflight", "coalesced")
+        return text
+
+    async def aclose(self) -> None:
+        if self.client:
+            await self.client.close()
+
+
+def is_valid_http_url(value: str) -> bool:
+    if not value:
+        return False
+    parsed = urlparse(value)
+    return parsed.scheme in {"http", "https"} and bool(parsed.netloc)
+
+
+def responses_text(response: object) -> str:
+    text = getattr(response, "output_text", None)
+    if isinstance(text, str) and text.strip():
+        return text
+    output = getattr(response, "output", None) or []
+    parts: list[str] = []
+    for item in output:
+        content = getattr(item, "content", None) or []
+        for c in content:
+            c_text = getattr(c, "text", None)
+            if c_text:
+                parts.append(str(c_text))
+    return "\n".join(parts).strip()
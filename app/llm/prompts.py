@@ -97,3 +97,16 @@ Output: {"mode":"memory","food_query":"conversation products","compare_items":[]
 User: "your answer wasn't related to my query"
 Output: {"mode":"correction","food_query":"off topic correction","compare_items":[]}
 """
+
+
+FOOD_QUERY_BATCH_EXTRACTION_SYSTEM_PROMPT = (
+    FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT
+    + """
+# Batch Input
+The user message is a JSON array of independent user messages.
+Classify each message on its own, using the same rules and output object as above.
+
+Return ONLY valid JSON:
+{"results": [<one output object per input message, in the same order>]}
+"""
+)
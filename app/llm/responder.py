@@ -1,18 +1,36 @@
 from __future__ import annotations
 
+import asyncio
 import json
-import os
 import re
-from urllib.parse import urlparse
-
-from openai import OpenAI
+from contextvars import ContextVar
+from typing import AsyncIterator
 
+from app.cache.extraction_cache import ExtractionCache, prompt_version
 from app.config import settings
+from app.llm.context import ContextBlock, PromptBuilder
+from app.llm.cues import cue_signals
+from app.llm.gateway import LLMGateway, is_valid_http_url, responses_text
 from app.llm.prompts import (
     CATALOG_GROUNDED_SYSTEM_PROMPT,
+    FOOD_QUERY_BATCH_EXTRACTION_SYSTEM_PROMPT,
     FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT,
     GENERAL_NUTRITION_SYSTEM_PROMPT,
 )
+from app.observability.tracing import record_cache
+
+# Compiled once; these run on every extraction.
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+_ALPHA_RE = re.compile(r"[a-z]+")
+_QUERY_FILLER_RE = re.compile(
+    r"\b(i|want|to|know|if|can you|could you|please|tell me|about|how many|what are|what is|there|in|the|a|an|bottle|facts|nutrition|nutritional|for|of)\b"
+)
+_COMPARE_FILLER_RE = re.compile(
+    r"\b(i|want|to|know|if|the|a|an|of|for|nutrition|nutritional|facts|calories|calorie|electrolytes|has|more|better|which|content|less|lower|higher|see|dense|than|is|are|there)\b"
+)
+_COMPARE_CUE_RE = re.compile(r"\b(which has better|compare|versus|vs|better than|with)\b")
+_COMPARE_SPLIT_RE = re.compile(r"\bor\b|\band\b|\bwith\b")
 
 
 class ChatResponder:
@@ -41,65 +59,129 @@ class ChatResponder:
         "beef",
         "fish",
     }
-    def __init__(self) -> None:
-        self.model = settings.openai_model
-        self.client = None
-        self.last_source = "fallback"
-        self.last_error = ""
+    def __init__(self, gateway: LLMGateway | None = None) -> None:
+        self.gateway = gateway or LLMGateway()
+        self.model = self.gateway.model
+        # Outcome of the latest call, scoped to the calling task so concurrent
+        # sessions sharing this responder never read each other's status.
+        self._last_source: ContextVar[str] = ContextVar(f"last_source_{id(self)}", default="fallback")
+        self._last_error: ContextVar[str] = ContextVar(f"last_error_{id(self)}", default="")
+        self.extraction_cache = self._build_extraction_cache(self.model)
+        self.prompts = PromptBuilder()
 
-        if settings.openai_api_key:
-            kwargs = {"api_key": settings.openai_api_key}
-            if self._is_valid_http_url(settings.openai_base_url):
-                kwargs["base_url"] = settings.openai_base_url
-            else:
-                os.environ.pop("OPENAI_BASE_URL", None)
-            self.client = OpenAI(**kwargs)
-
-    def reply(self, user_text: str, history: list[dict] | None = None) -> str:
-        return self._reply_with_messages(
-            messages=self._with_history(
-                base_messages=[{"role": "system", "content": GENERAL_NUTRITION_SYSTEM_PROMPT}],
-                history=history,
-                user_text=user_text,
-            )
+    @staticmethod
+    def _build_extraction_cache(model: str) -> ExtractionCache | None:
+        if settings.extraction_cache_max_entries <= 0:
+            return None
+        # Editing either extraction prompt or switching models changes the version and invalidates old entries.
+        version = prompt_version(model, FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT, FOOD_QUERY_BATCH_EXTRACTION_SYSTEM_PROMPT)
+        return ExtractionCache(
+            version,
+            max_entries=settings.extraction_cache_max_entries,
+            ttl_seconds=settings.extraction_cache_ttl_seconds,
+            path=settings.extraction_cache_path or None,
+        )
+
+    async def aclose(self) -> None:
+        if self.extraction_cache is not None:
+            self.extraction_cache.close()
+        await self.gateway.aclose()
+
+    @property
+    def client(self):
+        return self.gateway.client
+
+    @property
+    def last_source(self) -> str:
+        return self._last_source.get()
+
+    @last_source.setter
+    def last_source(self, value: str) -> None:
+        self._last_source.set(value)
+
+    @property
+    def last_error(self) -> str:
+        return self._last_error.get()
+
+    @last_error.setter
+    def last_error(self, value: str) -> None:
+        self._last_error.set(value)
+
+    async def reply(self, user_text: str, history: list[dict] | None = None, session: str = "") -> str:
+        return await self._reply_with_messages(
+            messages=self.prompts.build(GENERAL_NUTRITION_SYSTEM_PROMPT, user_text, session=session, history=history)
         )
 
-    def reply_with_context(self, user_text: str, context: str, history: list[dict] | None = None) -> str:
-        return self._reply_with_messages(
-            messages=self._with_history(
-                base_messages=[{"role": "system", "content": CATALOG_GROUNDED_SYSTEM_PROMPT}],
-                history=history,
-                user_text=f"User request: {user_text}\n\nCATALOG_CONTEXT:\n{context}",
+    async def reply_with_context(
+        self, user_text: str, context: list[ContextBlock], history: list[dict] | None = None, session: str = ""
+    ) -> str:
+        return await self._reply_with_messages(
+            messages=self.prompts.build(
+                CATALOG_GROUNDED_SYSTEM_PROMPT, user_text, blocks=context, session=session, history=history
             )
         )
 
-    def _reply_with_messages(self, messages: list[dict]) -> str:
+    async def stream_reply(
+        self, user_text: str, history: list[dict] | None = None, session: str = ""
+    ) -> AsyncIterator[str]:
+        async for delta in self._stream_with_messages(
+            messages=self.prompts.build(GENERAL_NUTRITION_SYSTEM_PROMPT, user_text, session=session, history=history)
+        ):
+            yield delta
+
+    async def stream_reply_with_context(
+        self, user_text: str, context: list[ContextBlock], history: list[dict] | None = None, session: str = ""
+    ) -> AsyncIterator[str]:
+        async for delta in self._stream_with_messages(
+            messages=self.prompts.build(
+                CATALOG_GROUNDED_SYSTEM_PROMPT, user_text, blocks=context, session=session, history=history
+            )
+        ):
+            yield delta
+
+    async def _stream_with_messages(self, messages: list[dict]) -> AsyncIterator[str]:
+        self.last_error = ""
+        if not self.client:
+            self.last_source = "fallback"
+            yield "OPENAI_API_KEY is not configured."
+            return
+
+        emitted = False
+        try:
+            async for delta in self.gateway.stream_chat(messages, max_completion_tokens=900):
+                if not emitted:
+                    emitted = True
+                    self.last_source = "llm"
+                yield delta
+        except Exception as exc:
+            self.last_error = f"{exc.__class__.__name__}: {exc}"
+            if emitted:
+                # The user already sees a partial answer; keep it rather than restarting.
+                return
+        if emitted:
+            return
+        yield await self._fallback_reply(messages)
+
+    async def _reply_with_messages(self, messages: list[dict]) -> str:
         self.last_error = ""
         if not self.client:
             self.last_source = "fallback"
             return "OPENAI_API_KEY is not configured."
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                max_completion_tokens=900,
-                messages=messages,
-            )
-            text = (response.choices[0].message.content or "").strip()
+            text = (await self.gateway.chat(messages, max_completion_tokens=900)).strip()
             if text:
                 self.last_source = "llm"
                 return text
         except Exception as exc:
             self.last_error = f"{exc.__class__.__name__}: {exc}"
+        return await self._fallback_reply(messages)
 
+    async def _fallback_reply(self, messages: list[dict]) -> str:
         # Some model/account combinations are more reliable via Responses API, and
         # also helps when chat completion returns empty text.
         try:
-            response = self.client.responses.create(
-                model=self.model,
-                input=self._messages_to_text(messages),
-            )
-            text = self._responses_text(response).strip()
+            text = (await self.gateway.respond(self._messages_to_text(messages))).strip()
             if text:
                 self.last_source = "llm"
                 self.last_error = ""
@@ -113,165 +195,156 @@ class ChatResponder:
         self.last_error = "EmptyResponse: model returned no text."
         return "I couldn't generate a complete natural-language response. Please try rephrasing your request."
 
-    def extract_food_query(self, user_text: str, history: list[dict] | None = None, use_history: bool = False) -> dict:
+    async def extract_food_query(
+        self, user_text: str, history: list[dict] | None = None, use_history: bool = False
+    ) -> dict:
         fallback = self._fallback_extract_food_query(user_text)
         if not self.client:
             return fallback
+        if not use_history:
+            cached = self.cached_extraction(user_text)
+            if cached is not None:
+                return cached
 
+        if use_history:
+            messages = self.prompts.build(FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT, user_text, history=history)
+        else:
+            messages = [
+                {"role": "system", "content": FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT},
+                {"role": "user", "content": user_text},
+            ]
         try:
-            if use_history:
-                messages = self._with_history(
-                    base_messages=[{"role": "system", "content": FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT}],
-                    history=history,
-                    user_text=user_text,
-                )
-            else:
-                messages = [
-                    {"role": "system", "content": FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT},
-                    {"role": "user", "content": user_text},
-                ]
-            response = self.client.chat.completions.create(
-                model=self.model,
-                max_completion_tokens=220,
-                messages=messages,
-            )
-            raw = (response.choices[0].message.content or "").strip()
-            parsed = json.loads(raw)
-            mode = str(parsed.get("mode", "")).strip().lower()
-            food_query = str(parsed.get("food_query", "")).strip().lower()
-            compare_items = parsed.get("compare_items", []) or []
-            if mode not in {"catalog", "general", "memory", "compare", "correction"}:
-                return fallback
-            if not food_query:
-                return fallback
-            cleaned_items: list[str] = []
-            for item in compare_items:
-                s = self._normalize_compare_item(str(item))
-                if s and s not in cleaned_items:
-                    cleaned_items.append(s)
-            out = {"mode": mode, "food_query": food_query, "compare_items": cleaned_items[:4]}
-            out = self._enforce_compare_mode(user_text, out, fallback)
-            if self.is_natural_food_request(out):
-                out["mode"] = "general"
-            return out
+            raw = (await self.gateway.chat(messages, max_completion_tokens=220)).strip()
+            extraction = self._parse_extraction(raw, user_text, fallback)
         except Exception:
             try:
-                response = self.client.responses.create(
-                    model=self.model,
-                    input=self._messages_to_text(messages),
-                )
-                raw = self._responses_text(response).strip()
-                parsed = json.loads(raw)
-                mode = str(parsed.get("mode", "")).strip().lower()
-                food_query = str(parsed.get("food_query", "")).strip().lower()
-                compare_items = parsed.get("compare_items", []) or []
-                if mode not in {"catalog", "general", "memory", "compare", "correction"}:
-                    return fallback
-                if not food_query:
-                    return fallback
-                cleaned_items: list[str] = []
-                for item in compare_items:
-                    s = self._normalize_compare_item(str(item))
-                    if s and s not in cleaned_items:
-                        cleaned_items.append(s)
-                out = {"mode": mode, "food_query": food_query, "compare_items": cleaned_items[:4]}
-                out = self._enforce_compare_mode(user_text, out, fallback)
-                if self.is_natural_food_request(out):
-                    out["mode"] = "general"
-                return out
+                raw = (await self.gateway.respond(self._messages_to_text(messages))).strip()
+                extraction = self._parse_extraction(raw, user_text, fallback)
             except Exception:
+                # Heuristic fallbacks are not cached, so the next call retries the model.
                 return fallback
+        if not use_history:
+            self._cache_extraction(user_text, extraction)
+        return extraction
 
-    @staticmethod
-    def _with_history(base_messages: list[dict], history: list[dict] | None, user_text: str) -> list[dict]:
-        if not history:
-            return base_messages + [{"role": "user", "content": user_text}]
-
-        recent = history[-6:]
-        normalized: list[dict] = []
-        for msg in recent:
-            role = str(msg.get("role", "")).strip().lower()
-            if role not in {"user", "assistant"}:
+    async def extract_food_queries(self, texts: list[str]) -> list[dict]:
+        if not self.client:
+            return [self._fallback_extract_food_query(t) for t in texts]
+        out: dict[int, dict] = {}
+        for i, text in enumerate(texts):
+            cached = self.cached_extraction(text)
+            if cached is not None:
+                out[i] = cached
+        missing = [i for i in range(len(texts)) if i not in out]
+        if len(missing) <= 1:
+            for i in missing:
+                out[i] = await self.extract_food_query(texts[i], use_history=False)
+        else:
+            results = await self._extract_batch([texts[i] for i in missing])
+            out.update(zip(missing, results))
+        return [out[i] for i in range(len(texts))]
+
+    async def _extract_batch(self, texts: list[str]) -> list[dict]:
+        fallbacks = [self._fallback_extract_food_query(t) for t in texts]
+        messages = [
+            {"role": "system", "content": FOOD_QUERY_BATCH_EXTRACTION_SYSTEM_PROMPT},
+            {"role": "user", "content": json.dumps(texts, ensure_ascii=False)},
+        ]
+        try:
+            raw = (
+                await self.gateway.chat(messages, max_completion_tokens=min(4000, 160 * len(texts) + 120))
+            ).strip()
+            results = json.loads(raw).get("results", [])
+            if not isinstance(results, list) or len(results) != len(texts):
+                raise ValueError("batch extraction size mismatch")
+        except Exception:
+            # One bad batch should not cost accuracy: extract each message on its own.
+            return list(await asyncio.gather(*(self.extract_food_query(t, use_history=False) for t in texts)))
+
+        out: list[dict] = []
+        for text, item, fallback in zip(texts, results, fallbacks):
+            try:
+                extraction = self._clean_extraction(item, text, fallback)
+            except Exception:
+                out.append(fallback)
                 continue
-            content = str(msg.get("content", "")).strip()
-            if content:
-                normalized.append({"role": role, "content": content[:1500]})
-        normalized.append({"role": "user", "content": user_text})
-        return base_messages + normalized
+            self._cache_extraction(text, extraction)
+            out.append(extraction)
+        return out
+
+    def cached_extraction(self, user_text: str) -> dict | None:
+        """Extraction from an earlier identical message in any session, if still cached."""
+        if self.extraction_cache is None:
+            return None
+        cached = self.extraction_cache.get(user_text)
+        record_cache("extraction", "hit" if cached is not None else "miss")
+        return cached
+
+    def has_cached_extraction(self, user_text: str) -> bool:
+        return self.extraction_cache is not None and self.extraction_cache.get(user_text) is not None
+
+    def _cache_extraction(self, user_text: str, extraction: dict) -> None:
+        if self.extraction_cache is not None:
+            self.extraction_cache.put(user_text, extraction)
+
+    def _parse_extraction(self, raw: str, user_text: str, fallback: dict) -> dict:
+        return self._clean_extraction(json.loads(raw), user_text, fallback)
+
+    def _clean_extraction(self, parsed: dict, user_text: str, fallback: dict) -> dict:
+        mode = str(parsed.get("mode", "")).strip().lower()
+        food_query = str(parsed.get("food_query", "")).strip().lower()
+        compare_items = parsed.get("compare_items", []) or []
+        if mode not in {"catalog", "general", "memory", "compare", "correction"}:
+            return fallback
+        if not food_query:
+            return fallback
+        cleaned_items: list[str] = []
+        for item in compare_items:
+            s = self._normalize_compare_item(str(item))
+            if s and s not in cleaned_items:
+                cleaned_items.append(s)
+        out = {"mode": mode, "food_query": food_query, "compare_items": cleaned_items[:4]}
+        out = self._enforce_compare_mode(user_text, out, fallback)
+        if self.is_natural_food_request(out):
+            out["mode"] = "general"
+        return out
 
     @staticmethod
     def _is_valid_http_url(value: str) -> bool:
-        if not value:
-            return False
-        parsed = urlparse(value)
-        return parsed.scheme in {"http", "https"} and bool(parsed.netloc)
+        return is_valid_http_url(value)
 
     @staticmethod
     def _responses_text(response: object) -> str:
-        text = getattr(response, "output_text", None)
-        if isinstance(text, str) and text.strip():
-            return text
-        output = getattr(response, "output", None) or []
-        parts: list[str] = []
-        for item in output:
-            content = getattr(item, "content", None) or []
-            for c in content:
-                c_text = getattr(c, "text", None)
-                if c_text:
-                    parts.append(str(c_text))
-        return "\n".join(parts).strip()
+        return responses_text(response)
+
+    def guess_food_query(self, user_text: str) -> dict:
+        """Instant heuristic extraction, used before (or instead of) the LLM one."""
+        return self._fallback_extract_food_query(user_text)
 
     @staticmethod
     def _fallback_extract_food_query(text: str) -> dict:
         lower = (text or "").lower()
-        if any(x in lower for x in [" vs ", " versus ", " or ", "compare ", "which has better", "better than"]):
+        signals = cue_signals(lower)
+        if "compare_split" in signals:
             items = ChatResponder._extract_compare_items(lower)
             if len(items) >= 2:
                 return {"mode": "compare", "food_query": " ".join(items), "compare_items": items}
 
-        if any(
-            x in lower
-            for x in [
-                "didn t ask about that",
-                "didn't ask about that",
-                "not related to my query",
-                "not what i asked",
-                "you are wrong",
-                "your answer wasn't related",
-                "answer was not related",
-                "off topic",
-            ]
-        ):
+        if "correction" in signals:
             return {"mode": "correction", "food_query": "correction request", "compare_items": []}
 
-        if any(
-            x in lower
-            for x in [
-                "products i asked",
-                "what products",
-                "list the products",
-                "conversation history",
-                "earlier products",
-            ]
-        ):
+        if "memory" in signals:
             return {"mode": "memory", "food_query": "conversation products", "compare_items": []}
 
-        cleaned = re.sub(r"[^a-z0-9\s]", " ", lower)
-        cleaned = re.sub(
-            r"\b(i|want|to|know|if|can you|could you|please|tell me|about|how many|what are|what is|there|in|the|a|an|bottle|facts|nutrition|nutritional|for|of)\b",
-            " ",
-            cleaned,
-        )
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
+        cleaned = _NON_ALNUM_RE.sub(" ", lower)
+        cleaned = _QUERY_FILLER_RE.sub(" ", cleaned)
+        cleaned = _WHITESPACE_RE.sub(" ", cleaned).strip()
         tokens = cleaned.split()
         query = " ".join(tokens[:5]) if tokens else lower.strip() or "food"
 
-        if any(x in lower for x in ["brand", "bar", "bottle", "snickers", "doritos", "gatorade", "coca", "pepsi"]):
+        if "catalog_term" in signals:
             mode = "catalog"
-        elif any(
-            x in lower
-            for x in ["more calories than", "vs", "versus", "is it good", "healthy", "calories in an", "calories in a"]
-        ):
+        elif "general_term" in signals:
             mode = "general"
         else:
             mode = "catalog"
@@ -283,9 +356,9 @@ class ChatResponder:
 
     @staticmethod
     def _extract_compare_items(lower_text: str) -> list[str]:
-        text = re.sub(r"[^a-z0-9\s]", " ", lower_text)
-        text = re.sub(r"\b(which has better|compare|versus|vs|better than|with)\b", " ", text)
-        parts = re.split(r"\bor\b|\band\b|\bwith\b", text)
+        text = _NON_ALNUM_RE.sub(" ", lower_text)
+        text = _COMPARE_CUE_RE.sub(" ", text)
+        parts = _COMPARE_SPLIT_RE.split(text)
         items: list[str] = []
         for part in parts:
             cleaned = ChatResponder._normalize_compare_item(part)
@@ -295,9 +368,7 @@ class ChatResponder:
 
     @staticmethod
     def _enforce_compare_mode(user_text: str, extracted: dict, fallback: dict) -> dict:
-        lowered = (user_text or "").lower()
-        compare_cues = ["compare", " vs ", " versus ", " or ", " with ", "better than", "which is better"]
-        if any(cue in lowered for cue in compare_cues):
+        if "compare_cue" in cue_signals(user_text or ""):
             items = [ChatResponder._normalize_compare_item(str(x)) for x in (extracted.get("compare_items", []) or [])]
             items = [x for x in items if x]
             if extracted.get("mode") != "compare" or len(items) < 2:
@@ -316,13 +387,9 @@ class ChatResponder:
     @staticmethod
     def _normalize_compare_item(text: str) -> str:
         cleaned = (text or "").lower()
-        cleaned = re.sub(r"[^a-z0-9\s]", " ", cleaned)
-        cleaned = re.sub(
-            r"\b(i|want|to|know|if|the|a|an|of|for|nutrition|nutritional|facts|calories|calorie|electrolytes|has|more|better|which|content|less|lower|higher|see|dense|than|is|are|there)\b",
-            " ",
-            cleaned,
-        )
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
+        cleaned = _NON_ALNUM_RE.sub(" ", cleaned)
+        cleaned = _COMPARE_FILLER_RE.sub(" ", cleaned)
+        cleaned = _WHITESPACE_RE.sub(" ", cleaned).strip()
         return " ".join(cleaned.split()[:4]).strip()
 
     @staticmethod
@@ -344,5 +411,5 @@ class ChatResponder:
             [str(extracted.get("food_query", ""))]
             + [str(x) for x in (extracted.get("compare_items", []) or [])]
         ).lower()
-        tokens = set(re.findall(r"[a-z]+", hay))
+        tokens = set(_ALPHA_RE.findall(hay))
         return len(tokens & ChatResponder.NATURAL_FOODS) > 0
@@ -1,13 +1,35 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 import gradio as gr
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
+from app.api import build_router
 from app.config import settings
+from app.observability.metrics import REGISTRY
 from app.services.assistant_service import AssistantService
 
-service = AssistantService()
+# Created on first use, not at import: `app.serve` spawns worker processes that
+# import this module, and only the ones that serve requests should build clients.
+service: AssistantService | None = None
+
+
+def get_service() -> AssistantService:
+    global service
+    if service is None:
+        service = AssistantService()
+    return service
 
 
-async def chat_fn(message: str, history: list[dict]) -> str:
-    return await service.answer(message, history=history)
+async def chat_fn(message: str, history: list[dict], request: gr.Request) -> AsyncIterator[str]:
+    session_id = getattr(request, "session_hash", "") or ""
+    service = get_service()
+    if not settings.stream_responses:
+        yield await service.answer(message, history=history, session_id=session_id)
+        return
+    async for partial in service.answer_stream(message, history=history, session_id=session_id):
+        yield partial
 
 
 def build_demo() -> gr.Blocks:
@@ -32,6 +54,26 @@ def build_demo() -> gr.Blocks:
     return demo
 
 
-if __name__ == "__main__":
-    app = build_demo()
-    app.launch(server_name=settings.gradio_server_name, server_port=settings.gradio_server_port)
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Provider connection pools live for the whole process and are closed on shutdown.
+    service = get_service()
+    await service.startup()
+    try:
+        yield
+    finally:
+        await service.aclose()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="Nutrition Assistant", lifespan=lifespan)
+
+    # Registered before the Gradio mount so "/" does not shadow them.
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics() -> PlainTextResponse:
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    app.include_router(build_router(get_service))
+
+    return gr.mount_gradio_app(app, build_demo(), path="/")
+
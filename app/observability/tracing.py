@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+from app.config import settings
+from app.observability.metrics import REGISTRY
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "assistant_stage_duration_seconds", "Duration of answer pipeline stages.", ("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter("assistant_stage_errors_total", "Stages that raised or were cancelled.", ("stage",))
+TURN_SECONDS = REGISTRY.histogram("assistant_turn_duration_seconds", "End-to-end chat turn duration.", ("source",))
+PROVIDER_REQUESTS = REGISTRY.counter(
+    "assistant_provider_requests_total", "Catalog provider searches by provider and HTTP status.", ("provider", "status")
+)
+CACHE_LOOKUPS = REGISTRY.counter("assistant_cache_lookups_total", "Cache lookups by cache and outcome.", ("cache", "state"))
+LLM_TOKENS = REGISTRY.counter("assistant_llm_tokens_total", "Model tokens reported by the API.", ("kind",))
+UPSTREAM_WAIT_SECONDS = REGISTRY.histogram(
+    "assistant_upstream_queue_seconds", "Time requests waited for upstream rate and concurrency limits.", ("upstream",)
+)
+UPSTREAM_THROTTLED = REGISTRY.counter(
+    "assistant_upstream_throttled_total", "Upstream responses that signalled overload.", ("upstream", "status")
+)
+UPSTREAM_HEDGES = REGISTRY.counter(
+    "assistant_upstream_hedges_total", "Hedged upstream requests by which copy answered first.", ("upstream", "winner")
+)
+CIRCUIT_OPENED = REGISTRY.counter("assistant_circuit_opened_total", "Times an upstream circuit breaker opened.", ("upstream",))
+
+
+@dataclass
+class Span:
+    name: str
+    started: float = field(default_factory=time.perf_counter)
+    duration_ms: float = 0.0
+    error: str = ""
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def add(self, key: str, amount: float) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+
+@dataclass
+class Trace:
+    spans: list[Span] = field(default_factory=list)
+    root: Span | None = None
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("assistant_trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("assistant_span", default=None)
+_listeners: list[Callable[[Span], None]] = []
+
+
+def add_span_listener(listener: Callable[[Span], None]) -> None:
+    _listeners.append(listener)
+
+
+def remove_span_listener(listener: Callable[[Span], None]) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def current_span() -> Span:
+    # Outside a span, attributes land on a throwaway span so callers never need a guard.
+    return _current_span.get() or Span("detached")
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    s = Span(name, attrs=dict(attrs))
+    parent = _current_span.get()
+    _current_span.set(s)
+    try:
+        yield s
+    except asyncio.CancelledError:
+        s.error = "cancelled"
+        raise
+    except Exception as exc:
+        s.error = exc.__class__.__name__
+        raise
+    finally:
+        # Restore by value: async generators may be finalized from another context.
+        _current_span.set(parent)
+        s.duration_ms = (time.perf_counter() - s.started) * 1000
+        _finish(s)
+
+
+@contextmanager
+def turn_trace(**attrs: Any) -> Iterator[Trace]:
+    trace = Trace()
+    previous = _current_trace.get()
+    _current_trace.set(trace)
+    try:
+        with span("turn", **attrs) as root:
+            trace.root = root
+            yield trace
+    finally:
+        _current_trace.set(previous)
+        root = trace.root
+        if root is not None:
+            TURN_SECONDS.observe(root.duration_ms / 1000, source=root.attrs.get("source", "unknown"))
+            if settings.debug_log:
+                print(f"[DEBUG][TRACE] {format_trace(trace)}")
+
+
+def traced(name: str) -> Callable:
+    """Wrap a function, coroutine function or async generator function in a span."""
+
+    def decorate(fn: Callable) -> Callable:
+        if inspect.isasyncgenfunction(fn):
+
+            @functools.wraps(fn)
+            async def gen_wrapper(*args: Any, **kwargs: Any):
+                with span(name) as s:
+                    first = True
+                    async for item in fn(*args, **kwargs):
+                        if first:
+                            s.set(first_chunk_ms=round((time.perf_counter() - s.started) * 1000, 2))
+                            first = False
+                        yield item
+
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any):
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def sync_wrapper(*args: Any, **kwargs: Any):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return sync_wrapper
+
+    return decorate
+
+
+def record_cache(cache: str, state: str) -> None:
+    if state:
+        CACHE_LOOKUPS.inc(cache=cache, state=state)
+        current_span().set(cache=state)
+
+
+def record_tokens(prompt_tokens: int | None, completion_tokens: int | None) -> None:
+    s = current_span()
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        s.add("prompt_tokens", prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        s.add("completion_tokens", completion_tokens)
+
+
+def format_trace(trace: Trace) -> str:
+    parts = []
+    for s in trace.spans:
+        detail = ",".join(f"{k}={v}" for k, v in s.attrs.items())
+        error = f" error={s.error}" if s.error else ""
+        parts.append(f"{s.name}={s.duration_ms:.1f}ms" + (f"({detail})" if detail else "") + error)
+    return " ".join(parts)
+
+
+def _finish(s: Span) -> None:
+    STAGE_SECONDS.observe(s.duration_ms / 1000, stage=s.name)
+    if s.error:
+        STAGE_ERRORS.inc(stage=s.name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(s)
+    for listener in list(_listeners):
+        listener(s)
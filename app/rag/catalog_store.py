@@ -1,32 +1,199 @@
 from __future__ import annotations
 
+import math
 import re
-from collections import Counter
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from operator import attrgetter
+from typing import Callable, Generic, Sequence, TypeVar
 
 from app.schemas import Product
 
+T = TypeVar("T")
 
-def _tokenize(text: str) -> list[str]:
-    return re.findall(r"[a-z0-9]+", text.lower())
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+PREFIX_MIN_LEN = 4
+PREFIX_DISCOUNT = 0.5
 
 
-class CatalogStore:
+def _stem(token: str) -> str:
+    # Same light plural folding the query rewrites use, applied to both sides.
+    if len(token) > 4 and token.endswith(("ches", "shes", "sses", "xes", "zes", "oes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+@lru_cache(maxsize=16384)
+def field_tokens(text: str) -> tuple[str, ...]:
+    """Stemmed tokens of one field value; cached since providers return the same products repeatedly."""
+    return tuple(_stem(t) for t in _TOKEN_RE.findall((text or "").lower()) if len(t) >= 3)
+
+
+def query_terms(query: str) -> tuple[str, ...]:
+    return tuple(dict.fromkeys(field_tokens(query)))
+
+
+@dataclass(frozen=True)
+class Field:
+    attr: str
+    weight: float
+
+
+# FoodProduct: name and brand identify a product; ingredients only support a match.
+FOOD_FIELDS = (
+    Field("product_name", 3.0),
+    Field("brands", 2.0),
+    Field("ingredients_text", 0.5),
+)
+PRODUCT_FIELDS = (
+    Field("title", 2.0),
+    Field("category_id", 1.0),
+)
+
+
+@lru_cache(maxsize=16384)
+def field_terms(text: str) -> tuple[int, dict[str, int]]:
     """
-    Lightweight lexical retriever for Day 1.
-    Replaces embeddings while keeping the same retrieval interface.
+    Token count and term frequencies of one field value; cached since
+    providers return the same products repeatedly. Callers must not mutate
+    the dict.
     """
+    tokens = field_tokens(text)
+    counts: dict[str, int] = {}
+    for token in tokens:
+        counts[token] = counts.get(token, 0) + 1
+    return len(tokens), counts
 
-    def rerank(self, query: str, products: list[Product], top_k: int = 5) -> list[Product]:
-        if not products:
+
+@dataclass(slots=True)
+class Hit(Generic[T]):
+    item: T
+    score: float  # BM25F
+    coverage: float  # share of the query's IDF mass the item matched, 0..1
+    matched: int  # query terms matched
+    exact: bool  # all query terms appear contiguously in one field
+
+
+class CatalogStore(Generic[T]):
+    """
+    BM25F retriever over a fixed set of items. Field term frequencies are
+    cached per distinct field value; building a store length-normalizes them
+    against the corpus's average field lengths into an inverted index
+    (token -> [(doc, weighted tf)]), so a query only visits documents sharing
+    one of its terms. A query term that only prefixes longer tokens ("sugar"
+    in "sugarfree") reads their postings, found by bisecting the sorted
+    vocabulary, at PREFIX_DISCOUNT.
+    """
+
+    def __init__(
+        self,
+        items: Sequence[T] = (),
+        fields: Sequence[Field] = FOOD_FIELDS,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        self.items = list(items)
+        self.fields = tuple(fields)
+        self.k1 = k1
+        self._texts = _field_getter(self.fields)
+        docs = [tuple(field_terms(text or "") for text in self._texts(item)) for item in self.items]
+        n = max(1, len(docs))
+        avg_lens = [max(1.0, sum(doc[i][0] for doc in docs) / n) for i in range(len(self.fields))]
+        postings: dict[str, list[tuple[int, float]]] = defaultdict(list)
+        for doc_id, doc in enumerate(docs):
+            weighted: dict[str, float] = {}
+            for field, avg_len, (length, counts) in zip(self.fields, avg_lens, doc):
+                if not length:
+                    continue
+                norm = field.weight / (1 - b + b * length / avg_len)
+                for token, count in counts.items():
+                    weighted[token] = weighted.get(token, 0.0) + count * norm
+            for token, weight in weighted.items():
+                postings[token].append((doc_id, weight))
+        self._postings = dict(postings)
+        self._vocabulary: list[str] | None = None  # sorted on the first prefix lookup
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def search(self, query: str, top_k: int | None = None) -> list[Hit[T]]:
+        """Items matching at least one query term, exact phrase matches first, then by score."""
+        terms = query_terms(query)
+        if not terms:
             return []
+        n = len(self.items)
+        scores: dict[int, float] = defaultdict(float)
+        matched_idf: dict[int, float] = defaultdict(float)
+        matched: dict[int, int] = defaultdict(int)
+        total_idf = 0.0
+        k1 = self.k1
+        for term in terms:
+            docs = self._term_postings(term)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            total_idf += idf
+            for doc_id, weighted in docs:
+                scores[doc_id] += idf * weighted * (k1 + 1) / (k1 + weighted)
+                matched_idf[doc_id] += idf
+                matched[doc_id] += 1
+
+        phrase = field_tokens(query)
+        total_idf = total_idf or 1.0
+        hits = [
+            Hit(
+                self.items[d],
+                score,
+                matched_idf[d] / total_idf,
+                matched[d],
+                # Only items matching every query term can contain the phrase.
+                matched[d] == len(terms) and self._contains(d, phrase),
+            )
+            for d, score in scores.items()
+        ]
+        hits.sort(key=lambda h: (h.exact, h.score), reverse=True)
+        return hits[:top_k] if top_k is not None else hits
+
+    def _term_postings(self, term: str) -> Sequence[tuple[int, float]]:
+        exact = self._postings.get(term, ())
+        if len(term) < PREFIX_MIN_LEN:
+            return exact
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        # Tokens are [a-z0-9], so every token extending `term` sorts before term + "{".
+        start = bisect_right(self._vocabulary, term)
+        end = bisect_left(self._vocabulary, term + "{", start)
+        if start == end:
+            return exact
+        weights = dict(exact)
+        for token in self._vocabulary[start:end]:
+            for doc_id, weight in self._postings[token]:
+                weights[doc_id] = weights.get(doc_id, 0.0) + PREFIX_DISCOUNT * weight
+        return list(weights.items())
 
-        q_tokens = Counter(_tokenize(query))
-        scored: list[tuple[int, Product]] = []
+    def _contains(self, doc_id: int, phrase: tuple[str, ...]) -> bool:
+        width = len(phrase)
+        for text in self._texts(self.items[doc_id]):
+            tokens = field_tokens(text or "")
+            for start in range(len(tokens) - width + 1):
+                if tokens[start : start + width] == phrase:
+                    return True
+        return False
+
+    @staticmethod
+    def rerank(query: str, products: list[Product], top_k: int = 5) -> list[Product]:
+        if not products:
+            return []
+        store = CatalogStore(products, fields=PRODUCT_FIELDS)
+        ranked = [h.item for h in store.search(query)]
+        seen = {id(p) for p in ranked}
+        # Non-matching products keep their provider order after the matches.
+        ranked += [p for p in products if id(p) not in seen]
+        return ranked[:top_k]
 
-        for product in products:
-            p_tokens = Counter(_tokenize(f"{product.title} {product.category_id}"))
-            overlap = sum((q_tokens & p_tokens).values())
-            scored.append((overlap, product))
 
-        ranked = sorted(scored, key=lambda x: x[0], reverse=True)
-        return [item[1] for item in ranked[:top_k]]
+def _field_getter(fields: tuple[Field, ...]) -> Callable[[object], tuple[str, ...]]:
+    get = attrgetter(*(f.attr for f in fields))
+    return get if len(fields) > 1 else lambda item: (get(item),)
@@ -30,11 +30,28 @@ class FoodProduct(BaseModel):
     code: str
     product_name: str
     brands: str = ""
+    gtin: str = ""
     nutriscore_grade: str = ""
     energy_kcal_100g: Optional[float] = None
     sugars_100g: Optional[float] = None
     proteins_100g: Optional[float] = None
     fat_100g: Optional[float] = None
     salt_100g: Optional[float] = None
+    fiber_100g: Optional[float] = None
+    saturated_fat_100g: Optional[float] = None
+    added_sugars_100g: Optional[float] = None
+    serving_size_g: Optional[float] = None
     ingredients_text: str = ""
     url: str = ""
+
+
+class TurnRequest(BaseModel):
+    message: str = Field(min_length=1)
+    history: list[dict] = Field(default_factory=list)
+    session_id: str = ""
+
+
+class TurnResult(BaseModel):
+    answer: str
+    source: str
+    latency_ms: float
@@ -0,0 +1,314 @@
+"""
+Serve the app on one port with one or more worker processes.
+
+    python -m app.serve --workers 4
+
+With one worker this is plain uvicorn. With more, each worker runs the full
+app on a Unix socket and this process routes each request from the public
+port. Chat UI requests are pinned to a worker by their Gradio session hash,
+because Gradio's event queue lives in the process that created it. Everything
+else goes to the least busy worker. `GET /metrics` is answered here, with the
+sum of every worker's metrics.
+Workers share session state, LLM extractions and USDA results through SQLite
+files in WAL mode; unset paths default to files in `--run-dir`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import re
+import signal
+import tempfile
+import zlib
+from pathlib import Path
+
+from app.config import settings
+from app.observability.metrics import merge_expositions
+
+API_PREFIX = b"/v1/"
+METRICS_PATH = b"/metrics"
+# Longest request head read before routing; longer ones are refused with 431.
+MAX_REQUEST_HEAD = 65536
+# UI request bodies up to this size are read before routing, to find their Gradio session.
+MAX_PEEKED_BODY = 65536
+_SESSION_IN_TARGET = re.compile(rb"(?:[?&]session_hash=|/heartbeat/|/stream/)([\w-]+)")
+_SESSION_IN_BODY = re.compile(rb'"session_hash"\s*:\s*"([\w-]+)"')
+SHARED_PATHS = {
+    "SESSION_STORE_PATH": "sessions.sqlite3",
+    "EXTRACTION_CACHE_PATH": "extractions.sqlite3",
+    "PROVIDER_CACHE_PATH": "providers.sqlite3",
+}
+
+
+def _run_worker(socket_path: str) -> None:
+    import uvicorn
+
+    uvicorn.run("app.main:create_app", factory=True, uds=socket_path, log_level="warning")
+
+
+class WorkerPool:
+    """Worker processes, each serving the app on its own Unix socket; crashed workers are restarted."""
+
+    def __init__(self, count: int, run_dir: Path) -> None:
+        # Spawned, not forked: each worker imports the app (and reads settings) on its own.
+        self._context = multiprocessing.get_context("spawn")
+        self.sockets = [str(run_dir / f"worker-{i}.sock") for i in range(count)]
+        self.processes: list[multiprocessing.process.BaseProcess | None] = [None] * count
+        self.active = [0] * count
+
+    def start(self, index: int) -> None:
+        Path(self.sockets[index]).unlink(missing_ok=True)
+        process = self._context.Process(target=_run_worker, args=(self.sockets[index],), daemon=True)
+        process.start()
+        self.processes[index] = process
+
+    def start_all(self) -> None:
+        for index in range(len(self.sockets)):
+            self.start(index)
+
+    async def wait_ready(self, timeout: float = 120.0) -> None:
+        loop = asyncio.get_running_loop()
+        until = loop.time() + timeout
+        while not all(Path(s).exists() for s in self.sockets):
+            if loop.time() > until:
+                raise RuntimeError("workers did not start in time")
+            await asyncio.sleep(0.1)
+
+    async def supervise(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            await asyncio.sleep(1.0)
+            for index, process in enumerate(self.processes):
+                # Ctrl-C reaches the workers too; do not restart them while shutting down.
+                if process is not None and not process.is_alive() and not stop.is_set():
+                    print(f"[serve] worker {index} exited with {process.exitcode}; restarting")
+                    self.start(index)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.kill()
+        for path in self.sockets:
+            Path(path).unlink(missing_ok=True)
+
+
+class AffinityProxy:
+    """
+    Routes each HTTP request to a worker: Gradio traffic by its session hash,
+    everything else to the least busy worker. Requests are relayed with
+    `Connection: close`, so a keep-alive client comes back through routing for
+    its next request. Metrics scrapes are answered by the proxy itself.
+    """
+
+    def __init__(self, pool: WorkerPool) -> None:
+        self.pool = pool
+        self._open: dict[asyncio.Task, tuple[asyncio.StreamWriter, ...]] = {}
+
+    def pick(self, head: bytes, body: bytes = b"") -> int:
+        session = _session_hash(head, body)
+        if session:
+            return zlib.crc32(session) % len(self.pool.sockets)
+        return min(range(len(self.pool.active)), key=self.pool.active.__getitem__)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            body = await _peek_body(reader, head)
+        except asyncio.LimitOverrunError:
+            writer.write(b"HTTP/1.1 431 Request Header Fields Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            writer.close()
+            return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        if _is_metrics_scrape(head):
+            await self._serve_metrics(writer)
+            return
+        first = self.pick(head, body)
+        # Counted before connecting, so a burst of new requests spreads across workers.
+        self.pool.active[first] += 1
+        upstream = await self._connect(first)
+        self.pool.active[first] -= 1
+        if upstream is None:
+            writer.close()
+            return
+        index, (up_reader, up_writer) = upstream
+        task = asyncio.current_task()
+        self._open[task] = (writer, up_writer)
+        self.pool.active[index] += 1
+        to_worker = asyncio.create_task(_relay(reader, up_writer))
+        try:
+            up_writer.write(_close_after_response(head) + body)
+            # The worker closes once it has answered; nothing more can come back on this connection.
+            await _relay(up_reader, writer)
+        finally:
+            to_worker.cancel()
+            self.pool.active[index] -= 1
+            self._open.pop(task, None)
+            up_writer.close()
+            writer.close()
+
+    async def close(self, timeout: float = 5.0) -> None:
+        # Closing both ends lets every relay see EOF and finish on its own.
+        for writers in list(self._open.values()):
+            for writer in writers:
+                writer.close()
+        if self._open:
+            await asyncio.wait(list(self._open), timeout=timeout)
+
+    async def _serve_metrics(self, writer: asyncio.StreamWriter) -> None:
+        # A worker that is restarting is left out of this scrape.
+        scrapes = await asyncio.gather(*(_scrape_metrics(path) for path in self.pool.sockets))
+        body = merge_expositions(text for text in scrapes if text is not None).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _connect(self, first: int) -> tuple[int, tuple[asyncio.StreamReader, asyncio.StreamWriter]] | None:
+        # A restarting worker's socket refuses connections; the next worker takes them meanwhile.
+        count = len(self.pool.sockets)
+        for step in range(count):
+            index = (first + step) % count
+            try:
+                return index, await asyncio.open_unix_connection(self.pool.sockets[index])
+            except OSError:
+                continue
+        return None
+
+
+def _is_metrics_scrape(head: bytes) -> bool:
+    parts = head.split(b"\r\n", 1)[0].split(b" ", 2)
+    return len(parts) > 1 and parts[0] == b"GET" and parts[1].split(b"?", 1)[0] == METRICS_PATH
+
+
+def _header(head: bytes, name: bytes) -> bytes | None:
+    for line in head.split(b"\r\n")[1:]:
+        key, sep, value = line.partition(b":")
+        if sep and key.strip().lower() == name:
+            return value.strip()
+    return None
+
+
+def _session_hash(head: bytes, body: bytes) -> bytes | None:
+    # Gradio names the session in the query string, the path or the JSON body, depending on the route.
+    target = head.split(b"\r\n", 1)[0].split(b" ", 2)[1:2]
+    match = _SESSION_IN_TARGET.search(target[0] if target else b"") or _SESSION_IN_BODY.search(body)
+    return match.group(1) if match else None
+
+
+async def _peek_body(reader: asyncio.StreamReader, head: bytes) -> bytes:
+    """Reads small UI request bodies before routing, where Gradio puts the session hash."""
+    target = head.split(b"\r\n", 1)[0].split(b" ", 2)[1:2]
+    length = _header(head, b"content-length")
+    if not target or target[0].startswith(API_PREFIX) or length is None or not length.isdigit():
+        return b""
+    if int(length) > MAX_PEEKED_BODY:
+        return b""
+    return await reader.readexactly(int(length))
+
+
+def _close_after_response(head: bytes) -> bytes:
+    # Upgraded connections (websockets) stay open; everything else gets one request per connection.
+    if _header(head, b"upgrade") is not None:
+        return head
+    lines = [line for line in head[:-4].split(b"\r\n") if not line.lower().startswith(b"connection:")]
+    return b"\r\n".join(lines + [b"Connection: close"]) + b"\r\n\r\n"
+
+
+async def _scrape_metrics(socket_path: str, timeout: float = 5.0) -> str | None:
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(socket_path), timeout)
+        try:
+            # HTTP/1.0: the worker closes the connection after the response, so read() ends with it.
+            writer.write(b"GET /metrics HTTP/1.0\r\nHost: worker\r\n\r\n")
+            response = await asyncio.wait_for(reader.read(), timeout)
+        finally:
+            writer.close()
+    except (OSError, asyncio.TimeoutError):
+        return None
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = head.split(b" ", 2)[1:2]
+    return body.decode() if status == [b"200"] else None
+
+
+async def _relay(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while chunk := await reader.read(65536):
+            writer.write(chunk)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+    except (ConnectionError, OSError):
+        writer.close()
+
+
+async def serve_workers(workers: int, host: str, port: int, run_dir: Path) -> None:
+    pool = WorkerPool(workers, run_dir)
+    pool.start_all()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    proxy = AffinityProxy(pool)
+    supervisor: asyncio.Task | None = None
+    try:
+        await pool.wait_ready()
+        server = await asyncio.start_server(proxy.handle, host, port, limit=MAX_REQUEST_HEAD)
+        supervisor = asyncio.create_task(pool.supervise(stop))
+        print(f"[serve] {workers} workers on http://{host}:{port} (run dir {run_dir})")
+        async with server:
+            await stop.wait()
+            server.close()
+            await proxy.close()
+    finally:
+        if supervisor is not None:
+            supervisor.cancel()
+        pool.stop()
+
+
+def share_caches(run_dir: Path) -> None:
+    """Point every worker at the same SQLite files, unless the environment already names them."""
+    for name, filename in SHARED_PATHS.items():
+        if not os.environ.get(name):
+            os.environ[name] = str(run_dir / filename)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=settings.web_workers, help="Worker processes (WEB_WORKERS).")
+    parser.add_argument("--host", default=settings.gradio_server_name)
+    parser.add_argument("--port", type=int, default=settings.gradio_server_port)
+    parser.add_argument("--run-dir", default="", help="Directory for worker sockets and default shared caches.")
+    args = parser.parse_args(argv)
+
+    if args.workers <= 1:
+        import uvicorn
+
+        from app.main import create_app
+
+        uvicorn.run(create_app(), host=args.host, port=args.port)
+        return
+
+    run_dir = Path(args.run_dir or tempfile.mkdtemp(prefix="nutrition-assistant-"))
+    run_dir.mkdir(parents=True, exist_ok=True)
+    share_caches(run_dir)
+    # Workers read it to split upstream quotas and to revalidate shared session state.
+    os.environ["WEB_WORKERS"] = str(args.workers)
+    asyncio.run(serve_workers(args.workers, args.host, args.port, run_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,34 +2,239 @@ from __future__ import annotations
 
 import asyncio
 import re
+import time
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Iterable
 
+from app.cache.answer_cache import AnswerCache, fingerprint
 from app.config import settings
+from app.data_providers.federated import FederatedFoodSearch
+from app.data_providers.openfoodfacts import OpenFoodFactsClient
+from app.data_providers.ratelimit import background
+from app.data_providers.resilience import deadline, remaining
 from app.data_providers.usda import USDAFoodDataClient
+from app.data_providers.usda_snapshot import USDASnapshotClient
 from app.schemas import FoodProduct
+from app.llm.context import ContextBlock
+from app.llm.cues import cue_signals, goal_from_signals
 from app.llm.responder import ChatResponder
+from app.observability.tracing import PROVIDER_REQUESTS, current_span, record_cache, span, traced, turn_trace
+from app.rag.catalog_store import CatalogStore, Hit, query_terms
+from app.services.food_batch import per_serving, rank_products
+from app.services.session_store import SessionState, SessionStore
+
+
+GREETINGS = {"hi", "hello", "hey", "hola", "buenas", "ola"}
+_CONFIDENCE_RANK = {"low": 1, "medium": 2, "high": 3}
+# Shares of TURN_BUDGET_SECONDS: extraction may use at most the first, and searches end when the second is left.
+_EXTRACTION_SHARE = 0.3
+_ANSWER_SHARE = 0.4
+# Batch requests read (and extracted in one model call) at a time.
+_BATCH_CHUNK = 16
 
 
 class AssistantService:
     def __init__(self) -> None:
         self.chat = ChatResponder()
-        self.usda = USDAFoodDataClient()
+        self.usda = self._build_usda_provider()
+        self.catalog = self._build_catalog(self.usda)
         self.debug = settings.debug_log
+        self.sessions = SessionStore(
+            max_sessions=settings.session_memo_max_sessions,
+            ttl_seconds=settings.session_ttl_seconds,
+            path=settings.session_store_path or None,
+            # Other worker processes update the same sessions.
+            shared=settings.web_workers > 1,
+        )
+        self.answers: AnswerCache | None = None
+        if settings.answer_cache_max_entries > 0:
+            self.answers = AnswerCache(
+                max_entries=settings.answer_cache_max_entries,
+                ttl_seconds=settings.answer_cache_ttl_seconds,
+                max_distance=settings.answer_cache_max_distance,
+            )
+
+    @staticmethod
+    def _build_usda_provider() -> USDAFoodDataClient | USDASnapshotClient:
+        if settings.usda_provider == "snapshot":
+            return USDASnapshotClient(settings.usda_snapshot_path)
+        return USDAFoodDataClient()
+
+    @staticmethod
+    def _build_catalog(
+        usda: USDAFoodDataClient | USDASnapshotClient,
+    ) -> USDAFoodDataClient | USDASnapshotClient | FederatedFoodSearch:
+        # SEARCH_PROVIDERS=usda,off queries both under one budget; a lone USDA provider is used directly.
+        names = [n.strip().lower() for n in settings.search_providers.split(",") if n.strip()]
+        providers = []
+        for name in dict.fromkeys(names or ["usda"]):
+            if name == "usda":
+                providers.append(usda)
+            elif name in {"off", "openfoodfacts"}:
+                providers.append(OpenFoodFactsClient())
+        if len(providers) == 1 and providers[0] is usda:
+            return usda
+        return FederatedFoodSearch(providers or [usda])
+
+    async def startup(self) -> None:
+        await self.catalog.start()
+        self.chat.gateway.warm_up()
+
+    async def aclose(self) -> None:
+        await self.catalog.aclose()
+        await self.chat.aclose()
+        self.sessions.close()
 
     async def answer(
         self,
         user_text: str,
         history: list[dict] | None = None,
         allow_correction_retry: bool = True,
+        session_id: str = "",
     ) -> str:
+        answer = ""
+        async for answer in self.answer_stream(
+            user_text,
+            history=history,
+            allow_correction_retry=allow_correction_retry,
+            session_id=session_id,
+            stream=False,
+        ):
+            pass
+        return answer
+
+    async def answer_stream(
+        self,
+        user_text: str,
+        history: list[dict] | None = None,
+        allow_correction_retry: bool = True,
+        session_id: str = "",
+        stream: bool = True,
+    ) -> AsyncIterator[str]:
+        """
+        Yield the reply as it is produced; every value is the full text so far.
+        Every upstream call of the turn, speculative searches included, runs
+        under one TURN_BUDGET_SECONDS deadline.
+        """
+        with deadline(settings.turn_budget_seconds), turn_trace(stream=stream) as trace:
+            speculative = self._start_speculative_search((user_text or "").strip(), session_id)
+            partial = ""
+            try:
+                async for partial in self._answer_stream(
+                    user_text,
+                    history=history,
+                    allow_correction_retry=allow_correction_retry,
+                    session_id=session_id,
+                    stream=stream,
+                    speculative=speculative,
+                ):
+                    yield partial
+            finally:
+                for task in speculative.values():
+                    task.cancel()
+                trace.root.set(source=self._source_label(partial))
+
+    async def answer_one(self, request: dict, index: int = 0) -> dict:
+        """
+        One independent turn from a JSON-like request: `message` (or
+        `user_input`, as in the eval cases), optional `history`, `session_id`
+        and `id`. Returns the answer and its source, or an `error`; never raises.
+        """
+        result: dict = {"index": index}
+        if isinstance(request, dict) and "id" in request:
+            result["id"] = request["id"]
+        message = request.get("message", request.get("user_input")) if isinstance(request, dict) else None
+        history = request.get("history") if isinstance(request, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            result["error"] = "expected a JSON object with a non-empty 'message' string"
+            return result
+        if history is not None and not isinstance(history, list):
+            result["error"] = "'history' must be a list of {role, content} messages"
+            return result
+        started = time.perf_counter()
+        try:
+            answer = await self.answer(message, history=history, session_id=str(request.get("session_id") or ""))
+        except Exception as exc:
+            result["error"] = f"{exc.__class__.__name__}: {exc}"
+        else:
+            result.update(answer=answer, source=self._source_label(answer))
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    async def answer_many(
+        self, requests: Iterable[dict] | AsyncIterable[dict], concurrency: int | None = None
+    ) -> AsyncIterator[dict]:
+        """
+        Answer a batch of independent turns (see `answer_one`) with at most
+        `concurrency` in flight, yielding each result as soon as it is ready:
+        results come back in completion order and carry their input `index`.
+        Requests are read a chunk at a time and each chunk's query extractions
+        share one model call, so memory stays flat however long the batch is.
+        Batch calls queue behind interactive turns at the upstream limiters.
+        """
+        limit = max(1, concurrency or settings.batch_max_concurrency)
+        source = _as_async_iterator(requests)
+        pending: deque[tuple[int, dict]] = deque()
+        running: set[asyncio.Task] = set()
+        read = 0
+        exhausted = False
+        try:
+            while True:
+                while len(running) < limit:
+                    if not pending and not exhausted:
+                        chunk = await _read_chunk(source, _BATCH_CHUNK)
+                        exhausted = len(chunk) < _BATCH_CHUNK
+                        await self._prefetch_extractions(chunk)
+                        pending.extend(enumerate(chunk, start=read))
+                        read += len(chunk)
+                    if not pending:
+                        break
+                    index, request = pending.popleft()
+                    with background():
+                        running.add(asyncio.create_task(self.answer_one(request, index)))
+                if not running:
+                    return
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _prefetch_extractions(self, requests: list[dict]) -> None:
+        # One batched model call warms the shared extraction cache for the whole chunk.
+        if self.chat.extraction_cache is None or not self.chat.client:
+            return
+        texts = []
+        for request in requests:
+            message = request.get("message", request.get("user_input")) if isinstance(request, dict) else None
+            text = message.strip() if isinstance(message, str) else ""
+            if text and text.lower() not in GREETINGS and not self.chat.has_cached_extraction(text):
+                texts.append(text)
+        if texts:
+            with background(), deadline(settings.turn_budget_seconds * _EXTRACTION_SHARE):
+                await self.chat.extract_food_queries(list(dict.fromkeys(texts)))
+
+    async def _answer_stream(
+        self,
+        user_text: str,
+        history: list[dict] | None,
+        allow_correction_retry: bool,
+        session_id: str,
+        stream: bool,
+        speculative: dict[tuple[str, int], asyncio.Task],
+        record: bool = True,
+    ) -> AsyncIterator[str]:
         text = (user_text or "").strip()
         if not text:
-            return "Send a message to chat with the model."
+            yield "Send a message to chat with the model."
+            return
         if self.debug:
             print(f"[DEBUG][SERVICE] user_text='{text}'")
 
         lowered = text.lower()
-        if lowered in {"hi", "hello", "hey", "hola", "buenas", "ola"}:
-            return (
+        if lowered in GREETINGS:
+            yield (
                 "[source: ux]\n\n"
                 "What would you like to do?\n\n"
                 "1. Compare products\n"
@@ -37,8 +242,16 @@ class AssistantService:
                 "3. Tell me your goal\n\n"
                 "You can include a goal like: lower calories, lower sugar, higher protein, or lower sodium."
             )
-
-        extraction = self.chat.extract_food_query(text, history=history, use_history=False)
+            return
+
+        # The session store already holds earlier turns; only messages it has not seen are extracted.
+        # A slow extraction falls back to the heuristic one rather than eat the whole budget.
+        state, unseen = self.sessions.resume(session_id, history)
+        with deadline(settings.turn_budget_seconds * _EXTRACTION_SHARE):
+            extraction, history_extractions = await asyncio.gather(
+                self._extract_message(text, session_id),
+                self._extract_history(unseen, session_id),
+            )
         if self.chat.is_natural_food_request(extraction):
             extraction["mode"] = "general"
         elif extraction.get("mode") in {"general", "catalog"} and self._should_force_catalog_mode(text):
@@ -46,8 +259,16 @@ class AssistantService:
         mode = extraction.get("mode", "catalog")
         search_query = extraction.get("food_query", text)
         compare_items = extraction.get("compare_items", []) or []
-        session_state = self._build_session_state(history)
+        self._drop_unused_speculation(speculative, mode, search_query, compare_items)
+        for message in unseen:
+            state.fold(message, history_extractions.get(message) or {}, self.sessions.max_messages)
+        session_state = self._session_snapshot(state)
         goal = self._infer_goal(text, session_state)
+        previous_query = state.last_query
+        if record:
+            state.fold(text, extraction, self.sessions.max_messages)
+            state.seen = len(history or []) + 1
+            self.sessions.save(session_id, state)
         if self.debug:
             print(
                 f"[DEBUG][SERVICE] extracted_mode='{mode}' extracted_query='{search_query}' "
@@ -56,65 +277,83 @@ class AssistantService:
 
         if mode == "memory":
             if not session_state["products"]:
-                return (
+                yield (
                     "[source: memory]\n\n"
                     "I do not have earlier product queries in this chat yet. "
                     "If you want, I can start by comparing two products or analyzing one product label."
                 )
+                return
             lines = ["[source: memory]", "", "Here is what we have covered so far:"]
             lines.append("- Products discussed: " + ", ".join(session_state["products"]))
             lines.append("- Last active goal: " + session_state["goal"])
+            if state.last_results:
+                lines.append("- Last results shown: " + ", ".join(state.last_results))
             lines.append("")
             lines.append("If you want, I can continue with that same goal or switch to a new one.")
-            return "\n".join(lines)
+            yield "\n".join(lines)
+            return
 
         if mode == "correction" and allow_correction_retry:
-            previous_query = self._latest_actionable_user_query(history)
             if not previous_query:
-                return "[source: correction]\n\nUnderstood. Please restate what product(s) you want me to analyze."
+                yield "[source: correction]\n\nUnderstood. Please restate what product(s) you want me to analyze."
+                return
             if self.debug:
                 print(f"[DEBUG][SERVICE] correction_target='{previous_query}'")
-            return await self.answer(
+            # Same turn, so it is not recorded again; the state above already covers the correction.
+            async for partial in self._answer_stream(
                 previous_query,
                 history=history,
                 allow_correction_retry=False,
-            )
+                session_id=session_id,
+                stream=stream,
+                speculative={},
+                record=False,
+            ):
+                yield partial
+            return
 
         if mode == "general":
             if self._needs_goal_clarification(text):
-                return (
+                yield (
                     "[source: clarification]\n\n"
                     "What do you mean by better here: lower calories, lower sugar, higher protein, or lower sodium? "
                     "If you want, I can default to lower calories."
                 )
-            answer = self.chat.reply(
-                f"SESSION_STATE: {self._session_state_text(session_state)}\n\n"
+                return
+            async for answer in self._reply_progress(
                 f"User question: {text}\n"
                 "Answer as a nutrition assistant with concise, practical advice. "
                 "If user asks numbers, clarify they are approximate unless label data is provided.",
                 history=history,
-            )
-            return f"[source: {self.chat.last_source}]\n\n{answer}"
+                session=self._session_state_text(session_state),
+                stream=stream,
+            ):
+                yield f"[source: {self.chat.last_source}]\n\n{answer}"
+            return
 
         if mode == "compare":
             if self._needs_goal_clarification(text):
-                return (
+                yield (
                     "[source: clarification]\n\n"
                     "Before I compare them, what should 'better' mean here: lower calories, lower sugar, higher protein, or lower sodium?"
                 )
+                return
             if len(compare_items) < 2:
                 compare_items = self._split_compare_items(search_query)
             if len(compare_items) < 2:
-                answer = self.chat.reply(
+                async for answer in self._reply_progress(
                     "Ask one short clarification question to identify the 2 products to compare.",
                     history=history,
-                )
-                return f"[source: {self.chat.last_source}]\n\n{answer}"
+                    stream=stream,
+                ):
+                    yield f"[source: {self.chat.last_source}]\n\n{answer}"
+                return
 
-            grouped_context = []
+            blocks: list[ContextBlock] = []
             total_hits = 0
-            tasks = [self._search_item_for_compare(item_query) for item_query in compare_items[:4]]
-            compare_results = await asyncio.gather(*tasks)
+            with self._search_deadline():
+                tasks = [self._search_item_for_compare(item_query, speculative) for item_query in compare_items[:4]]
+                compare_results = await asyncio.gather(*tasks)
             best_rows: list[tuple[str, FoodProduct]] = []
             explanations = []
             for item_query, found, provider, provider_error, provider_status in compare_results:
@@ -126,134 +365,200 @@ class AssistantService:
                         f"provider='{provider}' error='{provider_error}' status={provider_status}"
                     )
                 if not filtered:
-                    grouped_context.append(f"ITEM_QUERY: {item_query}\n- No relevant matches in catalog.")
+                    blocks.append(ContextBlock(f"ITEM_QUERY: {item_query}", ["- No relevant matches in catalog."]))
                     continue
                 explanations.append(
                     f"- {item_query}: {match_meta['confidence']} confidence, {match_meta['explanation']}, source={provider}"
                 )
-                lines = []
-                for idx, item in enumerate(filtered[:3], start=1):
-                    if idx == 1:
-                        best_rows.append((item_query, item))
-                    lines.append(
-                        f"{idx}. {item.product_name} | brand={item.brands or 'n/a'} | "
-                        f"kcal_100g={item.energy_kcal_100g} | sugar_100g={item.sugars_100g} | "
-                        f"protein_100g={item.proteins_100g} | fat_100g={item.fat_100g} | salt_100g={item.salt_100g} | url={item.url}"
+                best_rows.append((item_query, filtered[0]))
+                blocks.append(
+                    ContextBlock(
+                        f"ITEM_QUERY: {item_query} | SOURCE: {provider}",
+                        [self._context_row(idx, item) for idx, item in enumerate(filtered[:3], start=1)],
                     )
-                grouped_context.append(f"ITEM_QUERY: {item_query} | SOURCE: {provider}\n" + "\n".join(lines))
+                )
 
             if total_hits == 0:
-                answer = self.chat.reply(
+                async for answer in self._reply_progress(
                     f"User question: {text}\nNo catalog matches found. Give general comparison guidance and ask user to provide exact product names.",
                     history=history,
-                )
-                return f"[source: {self.chat.last_source}]\n\n{answer}"
+                    stream=stream,
+                ):
+                    yield f"[source: {self.chat.last_source}]\n\n{answer}"
+                return
 
+            if record:
+                self._show_results(session_id, state, [item for _, item in best_rows])
             table = self._format_comparison_table(best_rows, goal)
             match_block = "Match quality\n\n" + "\n".join(explanations)
-            compare_context = "\n\n".join(grouped_context)
-            answer = self.chat.reply_with_context(
-                user_text=(
-                    f"SESSION_STATE: {self._session_state_text(session_state)}\n"
+            answer_key = self._answer_key(
+                "compare", compare_items[:4], goal, ["\n".join([b.header, *b.rows]) for b in blocks], history
+            )
+            cached = self._cached_answer(answer_key, text, compare_items)
+            if cached is not None:
+                yield f"[source: llm + usda-compare]\n\n{cached}\n\n{table}\n\n{match_block}"
+                return
+            answer = ""
+            async for answer in self._reply_progress(
+                (
                     f"{text}\n"
                     "Compare the requested items side-by-side using catalog values when available. "
                     f"The comparison goal is '{goal}'. "
                     "If data is missing for an item, explicitly say so."
                 ),
-                context=compare_context,
+                context=blocks,
                 history=history,
-            )
+                session=self._session_state_text(session_state),
+                stream=stream,
+            ):
+                if stream and self.chat.last_source == "llm":
+                    yield f"[source: llm + usda-compare]\n\n{answer}"
             answer = self._ensure_natural_answer(answer, best_rows, goal, is_compare=True)
+            if self.chat.last_source == "llm":
+                self._remember_answer(answer_key, text, answer, compare_items)
             compare_source = f"{self.chat.last_source} + usda-compare"
             if self.chat.last_source != "llm" and self.chat.last_error:
                 compare_source += f" ({self.chat.last_error})"
-            return f"[source: {compare_source}]\n\n{answer}\n\n{table}\n\n{match_block}"
+            yield f"[source: {compare_source}]\n\n{answer}\n\n{table}\n\n{match_block}"
+            return
 
-        products, source, source_error, source_status = await self._search_usda(search_query, page_size=12)
-        products, match_meta = self._filter_relevant_products(search_query, products)
+        with self._search_deadline():
+            search_query, products, match_meta, source, source_error, source_status = await self._search_with_variants(
+                search_query, prefetched=speculative
+            )
         if self.debug:
             print(
-                f"[DEBUG][SERVICE] products={len(products)} source='{source}' "
+                f"[DEBUG][SERVICE] products={len(products)} query='{search_query}' source='{source}' "
                 f"error='{source_error}' status={source_status}"
             )
         if not products:
-            # Retry once with a shorter query to improve catalog hit-rate.
-            short_query = " ".join(search_query.split()[:3]).strip()
-            if short_query and short_query != search_query:
-                products, source, source_error, source_status = await self._search_usda(short_query, page_size=12)
-                products, match_meta = self._filter_relevant_products(short_query, products)
-                if self.debug:
-                    print(
-                        f"[DEBUG][SERVICE] retry_query='{short_query}' products={len(products)} "
-                        f"source='{source}' error='{source_error}' status={source_status}"
-                    )
-            if products:
-                search_query = short_query
-            else:
-                # If catalog misses, still provide useful nutrition guidance via LLM.
-                answer = self.chat.reply(
-                    f"User question: {text}\n"
-                    "Answer as a nutrition assistant. "
-                    "If exact product facts are unknown, state that briefly and provide general guidance.",
-                    history=history,
-                )
-                if self.chat.last_source == "llm":
-                    if self.debug:
-                        print("[DEBUG][SERVICE] response_source='llm' (no catalog hits)")
-                    return f"[source: llm]\n\n{answer}"
-                details = source_error or self.usda.last_error or "No matching products in catalog."
+            # If catalog misses, still provide useful nutrition guidance via LLM.
+            answer = ""
+            async for answer in self._reply_progress(
+                f"User question: {text}\n"
+                "Answer as a nutrition assistant. "
+                "If exact product facts are unknown, state that briefly and provide general guidance.",
+                history=history,
+                stream=stream,
+            ):
+                if stream and self.chat.last_source == "llm":
+                    yield f"[source: llm]\n\n{answer}"
+            if self.chat.last_source == "llm":
                 if self.debug:
-                    print("[DEBUG][SERVICE] response_source='usda' (llm unavailable)")
-                return f"[source: usda]\n\nNo catalog results. Details: {details}"
+                    print("[DEBUG][SERVICE] response_source='llm' (no catalog hits)")
+                yield f"[source: llm]\n\n{answer}"
+                return
+            details = source_error or "No matching products in catalog."
+            if self.debug:
+                print("[DEBUG][SERVICE] response_source='usda' (llm unavailable)")
+            yield f"[source: usda]\n\nNo catalog results. Details: {details}"
+            return
 
         if self._needs_disambiguation(search_query, products):
             options = [f"- {p.product_name}" for p in products[:4]]
-            return (
+            yield (
                 "[source: disambiguation]\n\n"
                 "I found multiple plausible product variants. Which one do you mean?\n\n"
                 + "\n".join(options)
             )
+            return
 
-        context_lines = []
-        single_best = []
-        for idx, item in enumerate(products[:6], start=1):
-            if idx == 1:
-                single_best.append((search_query, item))
-            context_lines.append(
-                f"{idx}. {item.product_name} | brand={item.brands or 'n/a'} | "
-                f"kcal_100g={item.energy_kcal_100g} | sugar_100g={item.sugars_100g} | "
-                f"protein_100g={item.proteins_100g} | fat_100g={item.fat_100g} | salt_100g={item.salt_100g} | url={item.url}"
-            )
-        context = "\n".join(context_lines)
+        single_best = [(search_query, products[0])]
+        context_lines = [self._context_row(idx, item) for idx, item in enumerate(products[:6], start=1)]
+        if record:
+            self._show_results(session_id, state, products[:6])
         table = self._format_comparison_table(single_best, goal)
-
-        answer = self.chat.reply_with_context(
-            f"SESSION_STATE: {self._session_state_text(session_state)}\n"
-            f"User request: {text}\n"
-            f"The main goal is '{goal}'.",
-            context=context,
-            history=history,
+        match_block = (
+            "Match quality\n\n"
+            f"- confidence: {match_meta['confidence']}\n"
+            f"- explanation: {match_meta['explanation']}\n"
+            f"- source: {source}"
         )
+        answer_key = self._answer_key("catalog", [search_query], goal, context_lines, history)
+        cached = self._cached_answer(answer_key, text, [search_query])
+        if cached is not None:
+            yield f"[source: llm + usda]\n\n{cached}\n\n{table}\n\n{match_block}"
+            return
+
+        answer = ""
+        async for answer in self._reply_progress(
+            f"User request: {text}\nThe main goal is '{goal}'.",
+            context=[ContextBlock(rows=context_lines)],
+            history=history,
+            session=self._session_state_text(session_state),
+            stream=stream,
+        ):
+            if stream and self.chat.last_source == "llm":
+                yield f"[source: llm + usda]\n\n{answer}"
         if self.chat.last_source == "llm":
             if self.debug:
                 print("[DEBUG][SERVICE] response_source='llm + usda'")
-            match_block = (
-                "Match quality\n\n"
-                f"- confidence: {match_meta['confidence']}\n"
-                f"- explanation: {match_meta['explanation']}\n"
-                f"- source: {source}"
-            )
             answer = self._ensure_natural_answer(answer, single_best, goal, is_compare=False)
-            return f"[source: llm + usda]\n\n{answer}\n\n{table}\n\n{match_block}"
+            self._remember_answer(answer_key, text, answer, [search_query])
+            yield f"[source: llm + usda]\n\n{answer}\n\n{table}\n\n{match_block}"
+            return
 
         details = f" ({self.chat.last_error})" if self.chat.last_error else ""
         if self.debug:
             print("[DEBUG][SERVICE] response_source='fallback + usda'")
-        return (
+        yield (
             f"[source: fallback + usda{details}]\n\n"
-            f"Top matches:\n{context}"
+            "Top matches:\n" + "\n".join(f"{row} | url={item.url}" for row, item in zip(context_lines, products))
         )
 
+    @staticmethod
+    def _search_deadline():
+        # Searches stop early enough to leave the answer its share of the turn budget.
+        left = remaining()
+        if left is None:
+            return deadline(None)
+        return deadline(max(0.001, left - settings.turn_budget_seconds * _ANSWER_SHARE))
+
+    def _answer_key(
+        self, mode: str, items: list[str], goal: str, context_blocks: list[str], history: list[dict] | None
+    ) -> tuple | None:
+        # An answer that saw earlier turns (history, recalled goal or products) is specific to that chat.
+        if self.answers is None or history:
+            return None
+        canonical = tuple(sorted({self.chat._normalize_compare_item(i) or i.lower() for i in items}))
+        return (mode, canonical, goal, fingerprint(context_blocks))
+
+    def _cached_answer(self, key: tuple | None, text: str, items: list[str]) -> str | None:
+        if key is None:
+            return None
+        cached = self.answers.get(key, text, ignore=items)
+        record_cache("answer", "hit" if cached is not None else "miss")
+        return cached
+
+    def _remember_answer(self, key: tuple | None, text: str, answer: str, items: list[str]) -> None:
+        if key is not None:
+            self.answers.put(key, text, answer, ignore=items)
+
+    @traced("llm_reply")
+    async def _reply_progress(
+        self,
+        user_text: str,
+        history: list[dict] | None,
+        context: list[ContextBlock] | None = None,
+        stream: bool = True,
+        session: str = "",
+    ) -> AsyncIterator[str]:
+        # Yields the cumulative reply text; the last value is the complete answer.
+        if not stream:
+            if context is None:
+                yield await self.chat.reply(user_text, history=history, session=session)
+            else:
+                yield await self.chat.reply_with_context(user_text, context=context, history=history, session=session)
+            return
+        if context is None:
+            deltas = self.chat.stream_reply(user_text, history=history, session=session)
+        else:
+            deltas = self.chat.stream_reply_with_context(user_text, context=context, history=history, session=session)
+        parts: list[str] = []
+        async for delta in deltas:
+            parts.append(delta)
+            yield "".join(parts).strip()
+
     @staticmethod
     def _split_compare_items(query: str) -> list[str]:
         parts = []
@@ -263,16 +568,161 @@ class AssistantService:
                 parts.append(item)
         return parts[:4]
 
-    async def _search_item_for_compare(self, item_query: str) -> tuple[str, list[FoodProduct], str, str, int | None]:
-        found, source, err, status = await self._search_usda(item_query, page_size=6)
+    @staticmethod
+    def _source_label(answer: str) -> str:
+        # "[source: fallback + usda (HTTP 503)]" -> "fallback + usda", keeping metric labels low-cardinality.
+        match = re.match(r"\[source:\s*([^\]\(]*)", answer or "")
+        return match.group(1).strip() if match else "none"
+
+    @traced("extraction")
+    async def _extract_message(self, text: str, session_id: str) -> dict:
+        cached = self.sessions.extraction(session_id, text)
+        record_cache("extraction_memo", "hit" if cached is not None else "miss")
+        if cached is not None:
+            return cached
+        extraction = await self.chat.extract_food_query(text, use_history=False)
+        self.sessions.remember_extraction(session_id, text, extraction)
+        return extraction
+
+    @traced("history_recall")
+    async def _extract_history(self, texts: list[str], session_id: str) -> dict[str, dict]:
+        out: dict[str, dict] = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            cached = self.sessions.extraction(session_id, text)
+            if cached is None:
+                missing.append(text)
+            else:
+                out[text] = cached
+        current_span().set(messages=len(out) + len(missing), memo_hits=len(out))
+        if missing:
+            if self.debug:
+                print(f"[DEBUG][SERVICE] history_extractions_missing={len(missing)} session='{session_id}'")
+            results = await self.chat.extract_food_queries(missing)
+            for text, extraction in zip(missing, results):
+                self.sessions.remember_extraction(session_id, text, extraction)
+                out[text] = extraction
+        return out
+
+    async def _search_item_for_compare(
+        self, item_query: str, prefetched: dict[tuple[str, int], asyncio.Task] | None = None
+    ) -> tuple[str, list[FoodProduct], str, str, int | None]:
+        found, source, err, status = await self._search_catalog(item_query, page_size=6, prefetched=prefetched)
         return item_query, found, source, err, status
 
-    async def _search_usda(self, query: str, page_size: int) -> tuple[list[FoodProduct], str, str, int | None]:
-        client = USDAFoodDataClient()
-        found = await client.search_products(query, page_size=page_size)
-        return found, "usda", client.last_error, client.last_status
+    async def _search_with_variants(
+        self,
+        query: str,
+        prefetched: dict[tuple[str, int], asyncio.Task] | None = None,
+    ) -> tuple[str, list[FoodProduct], dict[str, str], str, str, int | None]:
+        """
+        Search the query and a few rewrites concurrently and keep the result set
+        that best matches the original query; a high-confidence hit cancels the rest.
+        """
+        variants = self._query_variants(query)[: 1 + max(0, settings.search_fanout_variants)]
+        tasks = {
+            asyncio.create_task(self._search_catalog(v, page_size=12, prefetched=prefetched if i == 0 else None)): (i, v)
+            for i, v in enumerate(variants)
+        }
+        best: tuple | None = None
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    idx, variant = tasks[task]
+                    found, source, error, status = task.result()
+                    filtered, meta = self._filter_relevant_products(variant, found)
+                    top = CatalogStore(filtered).search(query, top_k=1)
+                    score = (_CONFIDENCE_RANK[self._match_confidence(top[0])], top[0].coverage) if top else (0, 0.0)
+                    # Rank by relevance to the original query; ties go to the less rewritten query.
+                    rank = (score if filtered else (-1, 0.0), -idx)
+                    if self.debug:
+                        print(
+                            f"[DEBUG][SERVICE] variant='{variant}' raw_hits={len(found)} filtered_hits={len(filtered)} "
+                            f"score={score} error='{error}' status={status}"
+                        )
+                    if best is None or rank > best[0]:
+                        best = (rank, variant, filtered, meta, source, error, status)
+                if best is not None and best[0][0][0] == _CONFIDENCE_RANK["high"]:
+                    break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        _, variant, filtered, meta, source, error, status = best
+        return (variant if filtered else query), filtered, meta, source, error, status
+
+    def _start_speculative_search(self, text: str, session_id: str) -> dict[tuple[str, int], asyncio.Task]:
+        # Only worth it when an LLM extraction round trip is about to happen.
+        if not settings.speculative_search or not self.chat.client or not text:
+            return {}
+        if text.lower() in GREETINGS or self.sessions.extraction(session_id, text) is not None:
+            return {}
+        if self.chat.has_cached_extraction(text):
+            return {}
+        guess = self.chat.guess_food_query(text)
+        if self.chat.is_natural_food_request(guess):
+            return {}
+        if guess["mode"] == "catalog":
+            targets = [(guess["food_query"], 12)]
+        elif guess["mode"] == "compare":
+            targets = [(item, 6) for item in guess["compare_items"][:4]]
+        else:
+            return {}
+        if self.debug:
+            print(f"[DEBUG][SERVICE] speculative_search targets={targets}")
+        # Tasks copy the context here, so their upstream calls queue behind interactive ones.
+        with background():
+            return {
+                (self._query_key(query), size): asyncio.create_task(self.catalog.search(query, page_size=size))
+                for query, size in targets
+            }
+
+    def _drop_unused_speculation(
+        self,
+        speculative: dict[tuple[str, int], asyncio.Task],
+        mode: str,
+        search_query: str,
+        compare_items: list[str],
+    ) -> None:
+        if not speculative:
+            return
+        wanted: set[tuple[str, int]] = set()
+        if mode == "catalog":
+            wanted.add((self._query_key(search_query), 12))
+        elif mode == "compare":
+            items = compare_items if len(compare_items) >= 2 else self._split_compare_items(search_query)
+            wanted.update((self._query_key(item), 6) for item in items[:4])
+        for key in list(speculative):
+            if key not in wanted:
+                speculative.pop(key).cancel()
+        if self.debug:
+            print(f"[DEBUG][SERVICE] speculative_search reused={len(speculative)}")
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return " ".join(sorted(set(query.lower().split())))
+
+    async def _search_catalog(
+        self,
+        query: str,
+        page_size: int,
+        prefetched: dict[tuple[str, int], asyncio.Task] | None = None,
+    ) -> tuple[list[FoodProduct], str, str, int | None]:
+        task = (prefetched or {}).pop((self._query_key(query), page_size), None)
+        with span("provider_search", speculative=task is not None) as s:
+            if task is not None:
+                result = await task
+            else:
+                result = await self.catalog.search(query, page_size=page_size)
+            s.set(provider=result.source, status=result.status, hits=len(result.products))
+            record_cache("usda", result.cache_status)
+        PROVIDER_REQUESTS.inc(provider=result.source or "none", status=result.status or "error")
+        return result.products, result.source, result.error, result.status
 
     @staticmethod
+    @traced("filtering")
     def _filter_relevant_products(query: str, products: list[FoodProduct]) -> tuple[list[FoodProduct], dict[str, str]]:
         sane_products = [p for p in products if AssistantService._is_reasonable_product(p)]
         if not sane_products:
@@ -280,41 +730,51 @@ class AssistantService:
         if not sane_products:
             return [], {"confidence": "low", "explanation": "no relevant product match"}
 
-        q = (query or "").lower()
-        raw_tokens = [t for t in re.findall(r"[a-z0-9]+", q) if len(t) >= 3]
-        q_tokens = []
-        for tok in raw_tokens:
-            q_tokens.extend(AssistantService._token_variants(tok))
-        q_tokens = list(dict.fromkeys(q_tokens))
-        if not q_tokens:
+        if not query_terms(query):
             return sane_products[:3], {"confidence": "low", "explanation": "query tokens too broad for strict filtering"}
 
-        scored: list[tuple[int, FoodProduct]] = []
-        for p in sane_products:
-            hay = f"{p.product_name} {p.brands} {p.ingredients_text}".lower()
-            score = 0
-            if q in hay:
-                score += 8
-            for tok in q_tokens:
-                if tok in hay:
-                    score += 2
-            # Keep exact-brand/product style matches first.
-            if p.product_name.lower().startswith(q_tokens[0]):
-                score += 1
-            if score > 0:
-                scored.append((score, p))
-
-        if not scored:
+        hits = CatalogStore(sane_products).search(query)
+        if not hits:
             # For generic queries (e.g., apples/oranges), keep top raw results instead of emptying out.
             return sane_products[:3], {"confidence": "low", "explanation": "fallback to broad USDA search results"}
 
-        scored.sort(key=lambda x: x[0], reverse=True)
-        best_score = scored[0][0]
-        min_score = max(2, best_score - 3)
-        scored = [x for x in scored if x[0] >= min_score]
-        confidence = "high" if best_score >= 8 else "medium" if best_score >= 4 else "low"
-        explanation = "exact keyword match" if best_score >= 8 else "partial keyword match"
-        return [p for _, p in scored], {"confidence": confidence, "explanation": explanation}
+        best = hits[0]
+        # Exact phrase matches outrank everything; otherwise keep products scoring close to the best one.
+        kept = [h.item for h in hits if h.exact == best.exact and h.score >= 0.5 * best.score]
+        confidence = AssistantService._match_confidence(best)
+        if best.exact:
+            explanation = "exact keyword match"
+        else:
+            explanation = "all keywords matched" if confidence == "high" else "partial keyword match"
+        return kept, {"confidence": confidence, "explanation": explanation}
+
+    @staticmethod
+    def _match_confidence(hit: Hit) -> str:
+        # High: the query appears as a phrase or every term matched; medium: several terms or most of the IDF mass.
+        if hit.exact or hit.coverage >= 0.999:
+            return "high"
+        return "medium" if hit.matched >= 2 or hit.coverage >= 0.5 else "low"
+
+    @staticmethod
+    def _query_variants(query: str) -> list[str]:
+        tokens = query.split()
+        variants = [query]
+        # Shorter query: long extracted queries often over-constrain the search.
+        variants.append(" ".join(tokens[:3]))
+        variants.append(" ".join(AssistantService._singularize(t) for t in tokens))
+        # Drop the leading (usually brand) token so generic product matches can still surface.
+        if len(tokens) >= 3:
+            variants.append(" ".join(tokens[1:]))
+        return [v for v in dict.fromkeys(v.strip() for v in variants) if v]
+
+    @staticmethod
+    def _singularize(token: str) -> str:
+        variants = AssistantService._token_variants(token)
+        if len(variants) == 1:
+            return token
+        if token.endswith(("ches", "shes", "sses", "xes", "zes")):
+            return variants[1]
+        return variants[-1]
 
     @staticmethod
     def _token_variants(token: str) -> list[str]:
@@ -327,39 +787,21 @@ class AssistantService:
 
     @staticmethod
     def _infer_goal(text: str, session_state: dict[str, object]) -> str:
-        lowered = (text or "").lower()
-        rules = [
-            ("lower calories", ["calorie", "kcal", "less calorie", "lower calorie", "calorie dense"]),
-            ("lower sugar", ["sugar", "less sweet", "lower sugar"]),
-            ("higher protein", ["protein", "more protein", "high protein"]),
-            ("lower sodium", ["sodium", "salt", "electrolyte"]),
-            ("lower fat", ["fat", "grease", "greasy"]),
-        ]
-        for goal, keywords in rules:
-            if any(k in lowered for k in keywords):
-                return goal
+        goal = goal_from_signals(cue_signals(text or ""))
+        if goal:
+            return goal
         prev = str(session_state.get("goal", "")).strip()
         return prev or "lower calories"
 
     @staticmethod
-    def _metric_value(item: FoodProduct, goal: str) -> float:
-        mapping = {
-            "lower calories": item.energy_kcal_100g,
-            "lower sugar": item.sugars_100g,
-            "higher protein": item.proteins_100g,
-            "lower sodium": item.salt_100g,
-            "lower fat": item.fat_100g,
-        }
-        value = mapping.get(goal)
-        if value is None:
-            return float("-inf") if goal == "higher protein" else float("inf")
-        return float(value)
+    def _rank_by_goal(rows: list[tuple[str, FoodProduct]], goal: str) -> list[tuple[str, FoodProduct]]:
+        return [rows[i] for i in rank_products([item for _, item in rows], goal)]
 
+    @traced("table_formatting")
     def _format_comparison_table(self, rows: list[tuple[str, FoodProduct]], goal: str) -> str:
         if not rows:
             return ""
-        reverse = goal == "higher protein"
-        ranked = sorted(rows, key=lambda x: self._metric_value(x[1], goal), reverse=reverse)
+        ranked = self._rank_by_goal(rows, goal)
         lines = [
             "Comparison table",
             "",
@@ -372,10 +814,31 @@ class AssistantService:
                 f"{self._fmt_num(item.sugars_100g)} | {self._fmt_num(item.proteins_100g)} | "
                 f"{self._fmt_num(item.fat_100g)} | {self._fmt_num(item.salt_100g)} |"
             )
+        servings = [
+            (item, values) for (_, item), values in zip(ranked, per_serving([item for _, item in ranked])) if values
+        ]
+        if servings:
+            lines += ["", "Per serving", ""]
+            for item, (kcal, sugar, protein, fat, salt) in servings:
+                lines.append(
+                    f"- {item.product_name} ({self._fmt_num(item.serving_size_g)} g): {self._fmt_num(kcal)} kcal, "
+                    f"sugar {self._fmt_num(sugar)} g, protein {self._fmt_num(protein)} g, "
+                    f"fat {self._fmt_num(fat)} g, salt {self._fmt_num(salt)} g"
+                )
         lines.append("")
         lines.append(f"Assumed goal: {goal}")
         return "\n".join(lines)
 
+    @staticmethod
+    def _context_row(idx: int, item: FoodProduct) -> str:
+        # What the model grounds on: names and nutrients, with numbers rounded and no URL.
+        return (
+            f"{idx}. {item.product_name} | brand={item.brands or 'n/a'} | "
+            f"kcal_100g={_compact_num(item.energy_kcal_100g)} | sugar_100g={_compact_num(item.sugars_100g)} | "
+            f"protein_100g={_compact_num(item.proteins_100g)} | fat_100g={_compact_num(item.fat_100g)} | "
+            f"salt_100g={_compact_num(item.salt_100g)}"
+        )
+
     @staticmethod
     def _fmt_num(value: float | None) -> str:
         if value is None:
@@ -390,20 +853,14 @@ class AssistantService:
             return True
         return 0.0 <= float(item.energy_kcal_100g) <= 900.0
 
-    def _build_session_state(self, history: list[dict] | None) -> dict[str, object]:
-        products = self._recall_product_queries(history)
-        goal = ""
-        if history:
-            for msg in reversed(history):
-                if str(msg.get("role", "")).lower() != "user":
-                    continue
-                text = str(msg.get("content", "")).strip()
-                if not text:
-                    continue
-                goal = self._infer_goal(text, {"goal": ""})
-                if goal:
-                    break
-        return {"products": products, "goal": goal or "lower calories"}
+    def _show_results(self, session_id: str, state: SessionState, products: list[FoodProduct]) -> None:
+        state.show_results([p.product_name for p in products])
+        self.sessions.save(session_id, state)
+
+    @staticmethod
+    def _session_snapshot(state: SessionState) -> dict[str, object]:
+        # Copied so recording the current message does not leak into this turn's view of the past.
+        return {"products": list(state.products), "goal": state.goal or "lower calories"}
 
     def _ensure_natural_answer(
         self,
@@ -419,8 +876,7 @@ class AssistantService:
             return "I could not generate a detailed recommendation. I found limited catalog data for your request."
 
         if is_compare and len(rows) >= 2:
-            reverse = goal == "higher protein"
-            ranked = sorted(rows, key=lambda x: self._metric_value(x[1], goal), reverse=reverse)
+            ranked = self._rank_by_goal(rows, goal)
             best_query, best_item = ranked[0]
             second_query, second_item = ranked[1]
             return (
@@ -443,13 +899,8 @@ class AssistantService:
 
     @staticmethod
     def _needs_goal_clarification(text: str) -> bool:
-        lowered = (text or "").lower()
-        asks_better = any(x in lowered for x in ["better", "healthier", "best option", "which is best"])
-        has_goal = any(
-            x in lowered
-            for x in ["calorie", "kcal", "sugar", "protein", "sodium", "salt", "fat", "electrolyte"]
-        )
-        return asks_better and not has_goal
+        signals = cue_signals(text or "")
+        return "asks_better" in signals and "has_goal" not in signals
 
     @staticmethod
     def _needs_disambiguation(query: str, products: list[FoodProduct]) -> bool:
@@ -466,49 +917,30 @@ class AssistantService:
 
     @staticmethod
     def _should_force_catalog_mode(text: str) -> bool:
-        lowered = (text or "").lower()
-        catalog_cues = ["show me", "find me", "look up", "nutrition facts for", "product", "products", "option", "options"]
-        return any(cue in lowered for cue in catalog_cues)
-
-    def _recall_product_queries(self, history: list[dict] | None) -> list[str]:
-        if not history:
-            return []
-        found: list[str] = []
-        seen = set()
-        for msg in history:
-            if str(msg.get("role", "")).lower() != "user":
-                continue
-            text = str(msg.get("content", "")).strip()
-            if not text:
-                continue
-            extracted = self.chat.extract_food_query(text, use_history=False)
-            mode = str(extracted.get("mode", "")).strip().lower()
-            if mode == "catalog":
-                query = str(extracted.get("food_query", "")).strip()
-                if query and query not in seen:
-                    seen.add(query)
-                    found.append(query)
-            elif mode == "compare":
-                items = extracted.get("compare_items", []) or []
-                for item in items:
-                    q = str(item).strip()
-                    if q and q not in seen:
-                        seen.add(q)
-                        found.append(q)
-        return found[-8:]
-
-    def _latest_actionable_user_query(self, history: list[dict] | None) -> str:
-        if not history:
-            return ""
-        for msg in reversed(history):
-            if str(msg.get("role", "")).lower() != "user":
-                continue
-            text = str(msg.get("content", "")).strip()
-            if not text:
-                continue
-            extracted = self.chat.extract_food_query(text, use_history=False)
-            mode = str(extracted.get("mode", "")).lower()
-            if mode in {"memory", "correction"}:
-                continue
-            return text
-        return ""
+        return "catalog_force" in cue_signals(text or "")
+
+
+def _compact_num(value: float | None) -> str:
+    # 0.30000000000000004 costs the model several tokens and tells it nothing more than 0.3.
+    return "n/a" if value is None else f"{round(float(value), 2):g}"
+
+
+def _as_async_iterator(items: Iterable[dict] | AsyncIterable[dict]) -> AsyncIterator[dict]:
+    if hasattr(items, "__aiter__"):
+        return items.__aiter__()
+
+    async def wrap() -> AsyncIterator[dict]:
+        for item in items:
+            yield item
+
+    return wrap()
+
+
+async def _read_chunk(source: AsyncIterator[dict], size: int) -> list[dict]:
+    chunk: list[dict] = []
+    while len(chunk) < size:
+        try:
+            chunk.append(await anext(source))
+        except StopAsyncIteration:
+            break
+    return chunk
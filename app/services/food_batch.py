@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Sequence
+
+import numpy as np
+
+from app.schemas import FoodProduct
+
+# Column order of FoodBatch.values, and the FoodProduct field behind each column.
+COLUMNS = ("kcal", "sugar", "protein", "fat", "salt")
+FIELDS = ("energy_kcal_100g", "sugars_100g", "proteins_100g", "fat_100g", "salt_100g")
+_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+_row = attrgetter(*FIELDS)
+# Building the arrays dominates a one-off call. Measured per call (1 core, CPython 3.11):
+# - Weighted ranking on two goals: Python 23 us vs columnar 68 us at 12 products;
+#   they break even at ~1k products (1.18 ms vs 1.13 ms).
+# - Single-goal ranking and per-serving values: Python is 1.4-2x faster at every
+#   size up to 8k, so those stay in Python.
+VECTORIZE_MIN_PRODUCTS = 1024
+
+# goal -> (column, +1 when higher is better / -1 when lower is better)
+GOAL_OBJECTIVES = {
+    "lower calories": ("kcal", -1.0),
+    "lower sugar": ("sugar", -1.0),
+    "higher protein": ("protein", 1.0),
+    "lower sodium": ("salt", -1.0),
+    "lower fat": ("fat", -1.0),
+}
+
+
+@dataclass(frozen=True)
+class FoodBatch:
+    """
+    Columnar view of FoodProducts: one float row per product, NaN where the
+    provider had no value, plus serving sizes in grams. Ranking and scoring
+    run over whole columns instead of calling a key function per product.
+    """
+
+    values: np.ndarray  # (n, len(COLUMNS)) per 100 g
+    serving_g: np.ndarray  # (n,)
+
+    @classmethod
+    def from_products(cls, products: Sequence[FoodProduct]) -> FoodBatch:
+        # Swapping None for NaN in Python keeps numpy on its fast float-list path.
+        flat = [math.nan if v is None else v for p in products for v in _row(p)]
+        values = np.array(flat, dtype=np.float64).reshape(len(products), len(COLUMNS))
+        serving = np.array(
+            [math.nan if p.serving_size_g is None else p.serving_size_g for p in products], dtype=np.float64
+        )
+        return cls(values=values, serving_g=serving)
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+    @property
+    def missing(self) -> np.ndarray:
+        return np.isnan(self.values)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, _INDEX[name]]
+
+    def goal_order(self, goal: str) -> np.ndarray:
+        """
+        Indices best-first for a single goal. Products missing the goal's
+        nutrient go last; ties and unknown goals keep input order.
+        """
+        objective = GOAL_OBJECTIVES.get(goal)
+        if objective is None:
+            return np.arange(len(self))
+        name, direction = objective
+        key = -direction * self.column(name)
+        return np.argsort(np.where(np.isnan(key), np.inf, key), kind="stable")
+
+    def scores(self, weights: dict[str, float]) -> np.ndarray:
+        """
+        Weighted multi-objective score in [0, 1] per product, keyed by goal.
+        Each goal's column is min-max scaled across the batch and oriented so
+        1 is best; a missing value scores 0 for that goal.
+        """
+        total = np.zeros(len(self))
+        weight_sum = 0.0
+        for goal, weight in weights.items():
+            objective = GOAL_OBJECTIVES.get(goal)
+            if objective is None or weight <= 0:
+                continue
+            name, direction = objective
+            col = direction * self.column(name)
+            present = ~np.isnan(col)
+            if present.any():
+                lo, hi = col[present].min(), col[present].max()
+                scaled = np.ones_like(col) if hi == lo else (col - lo) / (hi - lo)
+                total += weight * np.where(present, scaled, 0.0)
+            weight_sum += weight
+        return total / weight_sum if weight_sum else total
+
+    def rank(self, weights: dict[str, float]) -> np.ndarray:
+        """Indices ordered by descending `scores(weights)`, ties in input order."""
+        return np.argsort(-self.scores(weights), kind="stable")
+
+    def per_serving(self) -> np.ndarray:
+        """Values scaled from per-100 g to per serving; NaN where the serving size is unknown."""
+        return self.values * (self.serving_g / 100.0)[:, None]
+
+
+def goal_weights(goal: str) -> dict[str, float]:
+    """Equal weights for each known goal in a comma-separated goal string."""
+    return {g: 1.0 for g in (part.strip() for part in goal.split(",")) if g in GOAL_OBJECTIVES}
+
+
+def rank_products(products: Sequence[FoodProduct], goal: str) -> list[int]:
+    """
+    Indices best-first for `goal`. A single goal orders by its nutrient with
+    missing values last, as in FoodBatch.goal_order; several comma-separated
+    goals are weighted equally, as in FoodBatch.rank. Ties keep input order,
+    and a goal with no known part (e.g. a recalled free-text goal) keeps it all.
+    """
+    weights = goal_weights(goal)
+    if not weights:
+        return list(range(len(products)))
+    if len(weights) == 1:
+        name, direction = GOAL_OBJECTIVES[next(iter(weights))]
+        field = FIELDS[_INDEX[name]]
+        keys = [getattr(p, field) for p in products]
+        return sorted(range(len(products)), key=lambda i: (keys[i] is None, -direction * (keys[i] or 0.0)))
+    if len(products) >= VECTORIZE_MIN_PRODUCTS:
+        return FoodBatch.from_products(products).rank(weights).tolist()
+    scores = _python_scores(products, weights)
+    return sorted(range(len(products)), key=lambda i: -scores[i])
+
+
+def per_serving(products: Sequence[FoodProduct]) -> list[tuple[float | None, ...] | None]:
+    """
+    Nutrients per serving in COLUMNS order, per product; None where the
+    serving size is unknown. Same values as FoodBatch.per_serving.
+    """
+    return [
+        None
+        if p.serving_size_g is None
+        else tuple(None if v is None else v * p.serving_size_g / 100.0 for v in _row(p))
+        for p in products
+    ]
+
+
+def _python_scores(products: Sequence[FoodProduct], weights: dict[str, float]) -> list[float]:
+    # FoodBatch.scores for a handful of products.
+    total = [0.0] * len(products)
+    weight_sum = 0.0
+    for goal, weight in weights.items():
+        name, direction = GOAL_OBJECTIVES[goal]
+        field = FIELDS[_INDEX[name]]
+        col = [None if (v := getattr(p, field)) is None else direction * v for p in products]
+        present = [v for v in col if v is not None]
+        if present:
+            lo, hi = min(present), max(present)
+            for i, v in enumerate(col):
+                if v is not None:
+                    total[i] += weight * (1.0 if hi == lo else (v - lo) / (hi - lo))
+        weight_sum += weight
+    return [t / weight_sum for t in total] if weight_sum else total
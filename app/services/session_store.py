@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from app.cache.ttl import TTLCache
+from app.llm.cues import cue_signals, goal_from_signals
+
+MAX_PRODUCTS = 8
+MAX_RESULTS = 6
+
+
+@dataclass
+class SessionState:
+    goal: str = ""
+    products: list[str] = field(default_factory=list)
+    last_query: str = ""  # latest user message that asked for products (not memory or correction)
+    last_results: list[str] = field(default_factory=list)
+    extractions: OrderedDict[str, dict] = field(default_factory=OrderedDict)
+    # History entries already folded in (up to and including `last_text`, the
+    # latest user message), so the next turn only reads what came after.
+    seen: int = 0
+    last_text: str = ""
+
+    def fold(self, text: str, extraction: dict, max_messages: int = 64) -> None:
+        """Apply one user message and its extraction; messages must arrive oldest first."""
+        self.goal = goal_from_signals(cue_signals(text)) or self.goal
+        mode = str(extraction.get("mode", "")).strip().lower()
+        if mode == "catalog":
+            self._add_products([extraction.get("food_query", "")])
+        elif mode == "compare":
+            self._add_products(extraction.get("compare_items", []) or [])
+        if mode not in {"memory", "correction"}:
+            self.last_query = text
+        self.last_text = text
+        self.remember(text, extraction, max_messages)
+
+    def remember(self, text: str, extraction: dict, max_messages: int = 64) -> None:
+        self.extractions[text] = _copy(extraction)
+        self.extractions.move_to_end(text)
+        while len(self.extractions) > max(1, max_messages):
+            self.extractions.popitem(last=False)
+
+    def show_results(self, names: list[str]) -> None:
+        self.last_results = [n for n in names if n][:MAX_RESULTS]
+
+    def _add_products(self, queries: list) -> None:
+        for query in queries:
+            q = str(query).strip()
+            if q and q not in self.products:
+                self.products.append(q)
+        del self.products[:-MAX_PRODUCTS]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "goal": self.goal,
+                "products": self.products,
+                "last_query": self.last_query,
+                "last_results": self.last_results,
+                "extractions": list(self.extractions.items()),
+                "seen": self.seen,
+                "last_text": self.last_text,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, raw: str) -> SessionState:
+        data = json.loads(raw)
+        return cls(
+            goal=data.get("goal", ""),
+            products=list(data.get("products", [])),
+            last_query=data.get("last_query", ""),
+            last_results=list(data.get("last_results", [])),
+            extractions=OrderedDict((text, e) for text, e in data.get("extractions", [])),
+            seen=int(data.get("seen", 0)),
+            last_text=data.get("last_text", ""),
+        )
+
+
+class SessionStore:
+    """
+    Conversation state per chat session, updated one message at a time so a
+    turn costs the same however long the chat is. States live in a bounded
+    in-memory LRU with a TTL; an optional SQLite file keeps them across
+    restarts. A history that no longer extends the stored one (edited or
+    retried turns, or an evicted session) is replayed from scratch. With
+    `shared`, other processes write the same file, so an in-memory copy is
+    only used while the file still holds that version of it.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1024,
+        ttl_seconds: float = 24 * 3600,
+        max_messages: int = 64,
+        path: str | Path | None = None,
+        shared: bool = False,
+    ) -> None:
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max(1, max_messages)
+        # Each state is kept with the `updated` stamp of its last write to the file.
+        self.memory: TTLCache[tuple[float, SessionState]] = TTLCache(
+            max_entries=self.max_sessions, ttl_seconds=ttl_seconds
+        )
+        self.path = Path(path) if path else None
+        self.shared = shared and self.path is not None
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, session_id: str) -> SessionState | None:
+        if not session_id:
+            return None
+        cached = self.memory.get(session_id)
+        if cached is not None and (not self.shared or self._stamp(session_id) == cached[0]):
+            return cached[1]
+        loaded = self._load(session_id)
+        if loaded is None:
+            return None
+        self.memory.set(session_id, loaded)
+        return loaded[1]
+
+    def resume(self, session_id: str, history: list[dict] | None) -> tuple[SessionState, list[str]]:
+        """
+        The session's state and the user messages in `history` it has not
+        folded in yet: normally none, since the previous turn recorded itself.
+        """
+        history = history or []
+        state = self.get(session_id)
+        if state is None or not _extends(state, history):
+            # Replay everything, but keep the extraction records so it costs no model calls.
+            state, new = SessionState(extractions=OrderedDict(state.extractions) if state else OrderedDict()), history
+        else:
+            new = history[state.seen :]
+        return state, [text for text in (_user_text(m) for m in new) if text]
+
+    def extraction(self, session_id: str, text: str) -> dict | None:
+        state = self.get(session_id)
+        cached = state.extractions.get(text) if state is not None else None
+        return _copy(cached) if cached is not None else None
+
+    def remember_extraction(self, session_id: str, text: str, extraction: dict) -> None:
+        if not session_id:
+            return
+        state = self.get(session_id) or SessionState()
+        state.remember(text, extraction, self.max_messages)
+        self.save(session_id, state)
+
+    def save(self, session_id: str, state: SessionState) -> None:
+        if not session_id:
+            return
+        self.memory.set(session_id, (self._store(session_id, state), state))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __len__(self) -> int:
+        return len(self.memory)
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self.path is None:
+            return None
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _load(self, session_id: str) -> tuple[float, SessionState] | None:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT updated, value FROM sessions WHERE session_id = ? AND updated > ?",
+                (session_id, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return (row[0], SessionState.from_json(row[1])) if row else None
+
+    def _stamp(self, session_id: str) -> float | None:
+        # A primary-key read of one float: much cheaper than re-parsing the state.
+        with self._lock:
+            row = self._connect().execute("SELECT updated FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def _store(self, session_id: str, state: SessionState) -> float:
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            if conn is None:
+                return now
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, value, updated) VALUES (?, ?, ?)",
+                (session_id, state.to_json(), now),
+            )
+            self._writes += 1
+            if self._writes % 256 == 0:
+                conn.execute("DELETE FROM sessions WHERE updated <= ?", (now - self.ttl_seconds,))
+                conn.execute(
+                    "DELETE FROM sessions WHERE session_id NOT IN"
+                    " (SELECT session_id FROM sessions ORDER BY updated DESC LIMIT ?)",
+                    (self.max_sessions * 4,),
+                )
+        return now
+
+
+def _extends(state: SessionState, history: list[dict]) -> bool:
+    # O(1): the message at the stored boundary must still be the one folded last.
+    if state.seen > len(history):
+        return False
+    return state.seen == 0 or _user_text(history[state.seen - 1]) == state.last_text
+
+
+def _user_text(message: dict) -> str:
+    if str(message.get("role", "")).lower() != "user":
+        return ""
+    return str(message.get("content", "")).strip()
+
+
+def _copy(extraction: dict) -> dict:
+    out = dict(extraction)
+    out["compare_items"] = list(extraction.get("compare_items", []) or [])
+    return out
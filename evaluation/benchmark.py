@@ -0,0 +1,240 @@
+"""
+Offline latency benchmark: replays evaluation/eval_cases.jsonl through
+AssistantService against local fake USDA / OpenFoodFacts / OpenAI servers.
+
+    python -m evaluation.benchmark --concurrency 8 --repeat 5 \
+        --usda latency_ms=150,jitter_ms=30 --llm latency_ms=400,token_ms=2,error_rate=0.02
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from collections import defaultdict
+from dataclasses import asdict, fields
+from typing import Any
+
+from evaluation.cases import load_cases, synthetic_history
+from evaluation.fakes import FaultProfile, FakeUpstreams
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linear-interpolated percentile, q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.mean(values), 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(max(values), 2) if values else 0.0,
+    }
+
+
+class StageRecorder:
+    """Collects span durations emitted by app.observability.tracing."""
+
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.tokens: dict[str, int] = defaultdict(int)
+        self.enabled = True
+
+    def on_span(self, span: Any) -> None:
+        if not self.enabled or span.name == "turn":
+            return
+        self.samples[span.name].append(span.duration_ms)
+        if "first_chunk_ms" in span.attrs:
+            self.samples[f"{span.name}_first_chunk"].append(span.attrs["first_chunk_ms"])
+        for kind in ("prompt_tokens", "completion_tokens"):
+            self.tokens[kind] += int(span.attrs.get(kind, 0))
+
+
+async def run_benchmark(
+    cases: list[dict],
+    concurrency: int = 4,
+    repeat: int = 3,
+    warmup: int = 1,
+    stream: bool = True,
+) -> dict[str, Any]:
+    # Imported here so app.config picks up the fake upstream environment.
+    from app.observability.tracing import add_span_listener, remove_span_listener
+    from app.services.assistant_service import AssistantService
+
+    service = AssistantService()
+    recorder = StageRecorder()
+    add_span_listener(recorder.on_span)
+    await service.startup()
+
+    limit = asyncio.Semaphore(max(1, concurrency))
+    turns: list[dict[str, Any]] = []
+
+    async def run_turn(case: dict, round_idx: int) -> None:
+        async with limit:
+            history = synthetic_history(case["id"])
+            session_id = f"bench-{round_idx}-{case['id']}"
+            started = time.perf_counter()
+            first_chunk_ms: float | None = None
+            response, error = "", ""
+            try:
+                if stream:
+                    async for partial in service.answer_stream(case["user_input"], history=history, session_id=session_id):
+                        if first_chunk_ms is None:
+                            first_chunk_ms = (time.perf_counter() - started) * 1000
+                        response = partial
+                else:
+                    response = await service.answer(case["user_input"], history=history, session_id=session_id)
+            except Exception as exc:
+                error = f"{exc.__class__.__name__}: {exc}"
+            total_ms = (time.perf_counter() - started) * 1000
+            if round_idx >= 0:
+                turns.append(
+                    {
+                        "id": case["id"],
+                        "bucket": case["id"].split("_")[0],
+                        "round": round_idx,
+                        "total_ms": total_ms,
+                        "first_chunk_ms": first_chunk_ms if first_chunk_ms is not None else total_ms,
+                        "source_ok": response.startswith(case.get("expected_source", "")),
+                        "error": error,
+                    }
+                )
+
+    try:
+        # Warm-up rounds open pooled connections and are not recorded.
+        recorder.enabled = False
+        for w in range(warmup):
+            await asyncio.gather(*(run_turn(c, -1 - w) for c in cases))
+        recorder.enabled = True
+
+        wall_started = time.perf_counter()
+        await asyncio.gather(*(run_turn(c, r) for r in range(repeat) for c in cases))
+        wall_seconds = time.perf_counter() - wall_started
+    finally:
+        remove_span_listener(recorder.on_span)
+        await service.aclose()
+
+    by_bucket: dict[str, list[float]] = defaultdict(list)
+    for t in turns:
+        by_bucket[t["bucket"]].append(t["total_ms"])
+    return {
+        "config": {"cases": len(cases), "concurrency": concurrency, "repeat": repeat, "warmup": warmup, "stream": stream},
+        "turns": len(turns),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_turns_per_s": round(len(turns) / wall_seconds, 2) if wall_seconds else 0.0,
+        "errors": sum(1 for t in turns if t["error"]),
+        "source_accuracy": round(sum(t["source_ok"] for t in turns) / len(turns), 4) if turns else 0.0,
+        "end_to_end": summarize([t["total_ms"] for t in turns]),
+        "first_chunk": summarize([t["first_chunk_ms"] for t in turns]),
+        "stages": {stage: summarize(values) for stage, values in sorted(recorder.samples.items())},
+        "llm_tokens": dict(recorder.tokens),
+        "buckets": {bucket: summarize(values) for bucket, values in sorted(by_bucket.items())},
+    }
+
+
+def parse_profile(spec: str, default: FaultProfile) -> FaultProfile:
+    """Parse `latency_ms=150,jitter_ms=20,error_rate=0.05` on top of `default`."""
+    values = asdict(default)
+    known = {f.name: f.type for f in fields(FaultProfile)}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        key, _, raw = part.partition("=")
+        key = key.strip()
+        if key not in known:
+            raise argparse.ArgumentTypeError(f"unknown fault setting '{key}' (expected one of {', '.join(known)})")
+        values[key] = int(raw) if key == "error_status" else float(raw)
+    return FaultProfile(**values)
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [
+        f"turns={report['turns']} wall={report['wall_seconds']}s "
+        f"throughput={report['throughput_turns_per_s']} turns/s errors={report['errors']} "
+        f"source_accuracy={report['source_accuracy']}",
+        "",
+        f"{'stage':<26}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}",
+    ]
+    rows = [("end_to_end", report["end_to_end"]), ("first_chunk", report["first_chunk"])]
+    rows += [(name, s) for name, s in report["stages"].items()]
+    rows += [(f"bucket:{name}", s) for name, s in report["buckets"].items()]
+    for name, s in rows:
+        lines.append(
+            f"{name:<26}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}"
+        )
+    tokens = report.get("llm_tokens", {})
+    if tokens:
+        lines.append("")
+        lines.append("llm tokens: " + " ".join(f"{k}={v}" for k, v in sorted(tokens.items())))
+    upstream = report.get("upstreams", {})
+    if upstream:
+        lines.append("")
+        for name, s in upstream.items():
+            lines.append(f"upstream {name}: requests={s['requests']} errors={s['errors']} stalls={s['stalls']}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay eval cases against local fake providers and report latency.")
+    parser.add_argument("--cases", default=None, help="JSONL cases file (default evaluation/eval_cases.jsonl).")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3, help="Recorded passes over the case list.")
+    parser.add_argument("--warmup", type=int, default=1, help="Unrecorded passes run first.")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for injected latency jitter and failures.")
+    parser.add_argument("--usda", default="latency_ms=150,jitter_ms=30", help="USDA fault profile.")
+    parser.add_argument("--off", default="latency_ms=250,jitter_ms=50", help="OpenFoodFacts fault profile.")
+    parser.add_argument("--llm", default="latency_ms=400,jitter_ms=80,token_ms=2", help="OpenAI fault profile.")
+    parser.add_argument("--providers", default="usda", help="SEARCH_PROVIDERS for the run, e.g. usda,off.")
+    parser.add_argument("--no-stream", action="store_true", help="Use answer() instead of answer_stream().")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the USDA search cache.")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(
+        usda=parse_profile(args.usda, FaultProfile()),
+        off=parse_profile(args.off, FaultProfile()),
+        llm=parse_profile(args.llm, FaultProfile()),
+        seed=args.seed,
+    )
+    with upstreams:
+        os.environ.update(upstreams.env())
+        os.environ.update(
+            {
+                "USDA_PROVIDER": "api",
+                "SEARCH_PROVIDERS": args.providers,
+                "STREAM_RESPONSES": "0" if args.no_stream else "1",
+                "DEBUG_LOG": "0",
+            }
+        )
+        if args.no_cache:
+            os.environ["USDA_CACHE_MAX_ENTRIES"] = "0"
+        report = asyncio.run(
+            run_benchmark(
+                load_cases(args.cases),
+                concurrency=args.concurrency,
+                repeat=args.repeat,
+                warmup=args.warmup,
+                stream=not args.no_stream,
+            )
+        )
+        report["upstreams"] = {name: asdict(s) for name, s in upstreams.stats.items()}
+        report["profiles"] = {name: asdict(p) for name, p in upstreams.profiles.items()}
+
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+CASES_PATH = Path(__file__).resolve().parent / "eval_cases.jsonl"
+
+
+def load_cases(path: str | Path | None = None) -> list[dict]:
+    text = Path(path or CASES_PATH).read_text(encoding="utf-8")
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def synthetic_history(case_id: str) -> list[dict]:
+    """Prior turns replayed before cases that depend on session state (same as the notebook)."""
+    if case_id == "memory_001":
+        return [
+            {"role": "user", "content": "Compare Snickers and Kit Kat to see which is less calorie dense"},
+            {"role": "assistant", "content": "[source: llm + usda-compare] ..."},
+            {"role": "user", "content": "Can you tell me the nutrition facts for a Monster energy drink?"},
+            {"role": "assistant", "content": "[source: llm + usda] ..."},
+        ]
+    if case_id == "memory_002":
+        return [
+            {"role": "user", "content": "Compare Coke Zero and Pepsi for sugar"},
+            {"role": "assistant", "content": "[source: llm + usda-compare] ..."},
+        ]
+    if case_id == "correction_001":
+        return [
+            {"role": "user", "content": "Tell me the nutrition facts for a Snickers bar"},
+            {"role": "assistant", "content": "[source: llm + usda] ..."},
+        ]
+    return []
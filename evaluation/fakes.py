@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.llm.prompts import FOOD_QUERY_BATCH_EXTRACTION_SYSTEM_PROMPT, FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# (description, brand, gtin, kcal, sugar, protein, fat, sodium_mg) per 100 g/ml.
+FAKE_FOODS = [
+    ("Monster Energy Drink", "Monster Beverage", "070847811169", 47, 11, 0, 0, 80),
+    ("Monster Zero Ultra Energy Drink", "Monster Beverage", "070847022206", 1, 0, 0, 0, 80),
+    ("Prime Hydration Drink", "Prime", "811265030305", 8, 0, 0, 0, 5),
+    ("Red Bull Sugarfree Energy Drink", "Red Bull", "611269101713", 2, 0, 0, 0, 40),
+    ("Red Bull Energy Drink", "Red Bull", "611269991000", 46, 11, 0, 0, 40),
+    ("Snickers Chocolate Bar", "Mars", "040000424314", 488, 48, 8, 24, 230),
+    ("Kit Kat Wafer Bar", "Hershey", "034000002405", 518, 48, 6, 26, 80),
+    ("M&M's Milk Chocolate Candies", "Mars", "040000000310", 492, 64, 4, 21, 60),
+    ("Coca Cola Zero Sugar Soda", "Coca-Cola", "049000042566", 0, 0, 0, 0, 12),
+    ("Coke Zero Soda", "Coca-Cola", "049000050103", 0, 0, 0, 0, 12),
+    ("Pepsi Cola Soda", "PepsiCo", "012000001291", 41, 11, 0, 0, 9),
+    ("Pepsi Zero Sugar Soda", "PepsiCo", "012000171161", 0, 0, 0, 0, 11),
+    ("Diet Soda Lemon Lime", "Generic", "", 0, 0, 0, 0, 15),
+    ("Greek Yogurt Plain Nonfat", "Generic", "", 59, 3.2, 10, 0.4, 36),
+    ("Oikos Triple Zero Vanilla Greek Yogurt", "Danone", "036632036461", 60, 4, 10.6, 0, 40),
+    ("High Protein Greek Yogurt", "Generic", "", 70, 3, 12, 0.5, 40),
+    ("Low Sodium Chicken Noodle Soup", "Campbell's", "051000012616", 28, 0.4, 1.6, 0.8, 58),
+    ("Tomato Soup", "Campbell's", "051000012517", 36, 4.8, 0.8, 0.4, 283),
+]
+
+
+@dataclass
+class FaultProfile:
+    """Injected behaviour for one fake upstream."""
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    stall_rate: float = 0.0
+    stall_seconds: float = 30.0
+    token_ms: float = 0.0
+
+
+@dataclass
+class FakeUpstreamStats:
+    requests: int = 0
+    errors: int = 0
+    stalls: int = 0
+    by_route: dict[str, int] = field(default_factory=dict)
+
+
+class FakeUpstreams:
+    """
+    One local HTTP server standing in for USDA FoodData Central (`/usda`),
+    OpenFoodFacts (`/off`) and an OpenAI-compatible API (`/openai/v1`).
+    Latency and failures are drawn from a seeded RNG so runs are repeatable.
+    """
+
+    def __init__(
+        self,
+        usda: FaultProfile | None = None,
+        off: FaultProfile | None = None,
+        llm: FaultProfile | None = None,
+        seed: int = 7,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.profiles = {"usda": usda or FaultProfile(), "off": off or FaultProfile(), "llm": llm or FaultProfile()}
+        self.stats = {name: FakeUpstreamStats() for name in self.profiles}
+        self.host = host
+        self.port = port
+        self._rng = random.Random(seed)
+        self._server: uvicorn.Server | None = None
+        self._thread: threading.Thread | None = None
+        self.app = self._build_app()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def env(self) -> dict[str, str]:
+        """Environment that points the app's providers at this server."""
+        return {
+            "USDA_BASE_URL": f"{self.base_url}/usda/fdc/v1/foods/search",
+            "USDA_API_KEY": "benchmark",
+            "OFF_BASE_URL": f"{self.base_url}/off/cgi/search.pl",
+            "OPENAI_BASE_URL": f"{self.base_url}/openai/v1",
+            "OPENAI_API_KEY": "benchmark",
+            # The fakes have no quota; keep local metering from throttling load runs.
+            "USDA_RATE_LIMIT_PER_HOUR": "0",
+            "OFF_RATE_LIMIT_PER_MINUTE": "0",
+        }
+
+    def start(self) -> "FakeUpstreams":
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("fake upstream server failed to start")
+            time.sleep(0.01)
+        self.port = self._server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def __enter__(self) -> "FakeUpstreams":
+        return self.start()
+
+    def __exit__(self, *_: object) -> None:
+        self.stop()
+
+    async def _inject(self, name: str, route: str) -> JSONResponse | None:
+        profile, stats = self.profiles[name], self.stats[name]
+        stats.requests += 1
+        stats.by_route[route] = stats.by_route.get(route, 0) + 1
+        roll = self._rng.random()
+        delay = profile.latency_ms + self._rng.uniform(-profile.jitter_ms, profile.jitter_ms)
+        if roll < profile.stall_rate:
+            stats.stalls += 1
+            delay = profile.stall_seconds * 1000
+        await asyncio.sleep(max(0.0, delay) / 1000)
+        if profile.stall_rate <= roll < profile.stall_rate + profile.error_rate:
+            stats.errors += 1
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=profile.error_status)
+        return None
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/usda/fdc/v1/foods/search")
+        async def usda_search(request: Request):
+            failure = await self._inject("usda", "search")
+            if failure is not None:
+                return failure
+            payload = await request.json()
+            foods = _match_foods(str(payload.get("query", "")), int(payload.get("pageSize", 12)))
+            return {"totalHits": len(foods), "foods": [_usda_food(i, row) for i, row in foods]}
+
+        @app.get("/off/cgi/search.pl")
+        async def off_search(search_terms: str = "", page_size: int = 20):
+            failure = await self._inject("off", "search")
+            if failure is not None:
+                return failure
+            foods = _match_foods(search_terms, page_size)
+            return {"count": len(foods), "products": [_off_product(row) for _, row in foods]}
+
+        @app.post("/openai/v1/chat/completions")
+        async def chat_completions(request: Request):
+            failure = await self._inject("llm", "chat")
+            if failure is not None:
+                return failure
+            body = await request.json()
+            messages = body.get("messages", [])
+            text = _fake_completion(messages)
+            prompt_tokens = _prompt_tokens(messages)
+            if not body.get("stream"):
+                return _chat_completion(body.get("model", ""), text, prompt_tokens)
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                self._stream_chunks(body.get("model", ""), text, include_usage, prompt_tokens),
+                media_type="text/event-stream",
+            )
+
+        @app.post("/openai/v1/responses")
+        async def responses(request: Request):
+            failure = await self._inject("llm", "responses")
+            if failure is not None:
+                return failure
+            body = await request.json()
+            text = _fake_completion([{"role": "user", "content": str(body.get("input", ""))}])
+            return {
+                "id": "resp-fake",
+                "object": "response",
+                "created_at": int(time.time()),
+                "model": body.get("model", ""),
+                "status": "completed",
+                "output": [
+                    {
+                        "id": "msg-fake",
+                        "type": "message",
+                        "role": "assistant",
+                        "status": "completed",
+                        "content": [{"type": "output_text", "text": text, "annotations": []}],
+                    }
+                ],
+            }
+
+        return app
+
+    async def _stream_chunks(
+        self, model: str, text: str, include_usage: bool = False, prompt_tokens: int = 0
+    ) -> AsyncIterator[str]:
+        token_ms = self.profiles["llm"].token_ms
+        pieces = re.findall(r"\S+\s*", text)
+        for piece in pieces:
+            if token_ms:
+                await asyncio.sleep(token_ms / 1000)
+            yield "data: " + json.dumps(_chunk(model, {"content": piece})) + "\n\n"
+        yield "data: " + json.dumps(_chunk(model, {}, finish_reason="stop")) + "\n\n"
+        if include_usage:
+            usage_chunk = _chunk(model, {})
+            usage_chunk["choices"] = []
+            usage_chunk["usage"] = _usage(prompt_tokens, len(pieces))
+            yield "data: " + json.dumps(usage_chunk) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+
+def _match_foods(query: str, limit: int) -> list[tuple[int, tuple]]:
+    tokens = set(_TOKEN_RE.findall(query.lower()))
+    scored = []
+    for idx, row in enumerate(FAKE_FOODS):
+        hay = set(_TOKEN_RE.findall(f"{row[0]} {row[1]}".lower()))
+        hits = len(tokens & hay)
+        if hits:
+            scored.append((-hits, idx, row))
+    scored.sort()
+    return [(idx, row) for _, idx, row in scored[:limit]]
+
+
+def _usda_food(idx: int, row: tuple) -> dict:
+    description, brand, gtin, kcal, sugar, protein, fat, sodium = row
+    nutrients = [
+        ("Energy", kcal, "KCAL", "208"),
+        ("Total Sugars", sugar, "G", "269"),
+        ("Sugars, total including NLEA", sugar, "G", "269"),
+        ("Protein", protein, "G", "203"),
+        ("Total lipid (fat)", fat, "G", "204"),
+        ("Sodium, Na", sodium, "MG", "307"),
+    ]
+    return {
+        "fdcId": 900000 + idx,
+        "description": description.upper(),
+        "dataType": "Branded",
+        "brandOwner": brand,
+        "gtinUpc": gtin,
+        "ingredients": "",
+        "foodNutrients": [
+            {"nutrientName": name, "value": value, "unitName": unit, "nutrientNumber": number}
+            for name, value, unit, number in nutrients
+        ],
+    }
+
+
+def _off_product(row: tuple) -> dict:
+    description, brand, gtin, kcal, sugar, protein, fat, sodium = row
+    return {
+        "code": gtin or description.lower().replace(" ", "-"),
+        "product_name": description,
+        "brands": brand,
+        "nutriscore_grade": "c",
+        "nutriments": {
+            "energy-kcal_100g": kcal,
+            "sugars_100g": sugar,
+            "proteins_100g": protein,
+            "fat_100g": fat,
+            "salt_100g": sodium / 1000 * 2.5,
+        },
+        "ingredients_text": "",
+        "url": "",
+    }
+
+
+def _fake_completion(messages: list[dict]) -> str:
+    system = next((str(m.get("content", "")) for m in messages if m.get("role") == "system"), "")
+    user = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+    # The fake "model" extracts with the app's own heuristic so routing stays deterministic.
+    # Imported lazily: app.config reads the environment once, after the server's URLs are known.
+    from app.llm.responder import ChatResponder
+
+    if system == FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT:
+        return json.dumps(ChatResponder._fallback_extract_food_query(user))
+    if system == FOOD_QUERY_BATCH_EXTRACTION_SYSTEM_PROMPT:
+        texts = json.loads(user)
+        return json.dumps({"results": [ChatResponder._fallback_extract_food_query(t) for t in texts]})
+    return (
+        "Based on the nutrition data provided, here is a short summary of the options. "
+        "Values are per 100 g or 100 ml as reported by the catalog. "
+        "Pick the option that best matches your goal and check the label for serving size."
+    )
+
+
+def _chat_completion(model: str, text: str, prompt_tokens: int = 0) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+        ],
+        "usage": _usage(prompt_tokens, len(text.split())),
+    }
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict:
+    # Token counts are word counts; good enough to exercise usage accounting.
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _prompt_tokens(messages: list[dict]) -> int:
+    return sum(len(str(m.get("content", "")).split()) for m in messages)
+
+
+def _chunk(model: str, delta: dict, finish_reason: str | None = None) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
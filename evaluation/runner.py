@@ -0,0 +1,222 @@
+"""
+Concurrent evaluation runner for evaluation/eval_cases.jsonl.
+
+    python -m evaluation --concurrency 6 --out results.json --baseline evaluation/baseline.json
+    python -m evaluation --offline --update-baseline evaluation/baseline.json
+
+Exits non-zero when accuracy or p95 latency regresses past the baseline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any
+
+from evaluation.benchmark import parse_profile, summarize
+from evaluation.cases import load_cases, synthetic_history
+from evaluation.fakes import FaultProfile, FakeUpstreams
+
+ACCURACY_KEYS = ("routing_accuracy", "source_accuracy", "keyword_accuracy", "overall_pass_rate")
+# Cleared for every run: files from earlier runs would serve warm extractions and searches.
+PERSISTENT_CACHES = ("EXTRACTION_CACHE_PATH", "PROVIDER_CACHE_PATH", "SESSION_STORE_PATH")
+
+
+def expected_mode_ok(expected_mode: str, extracted_mode: str) -> bool:
+    if expected_mode == "greeting":
+        return True
+    if expected_mode == "catalog_or_disambiguation":
+        return extracted_mode in {"catalog", "compare"}
+    if expected_mode == "clarification_or_compare":
+        return extracted_mode in {"general", "compare"}
+    return extracted_mode == expected_mode
+
+
+def keywords_ok(must_contain: list[str], response_text: str) -> bool:
+    lowered = response_text.lower()
+    return all(token.lower() in lowered for token in must_contain)
+
+
+async def normalized_mode(service: Any, classifier: Any, user_input: str) -> str:
+    lowered = user_input.strip().lower()
+    if lowered in {"hi", "hello", "hey", "hola", "buenas", "ola"}:
+        return "greeting"
+    extracted = await classifier.extract_food_query(user_input, use_history=False)
+    if classifier.is_natural_food_request(extracted):
+        extracted["mode"] = "general"
+    elif extracted.get("mode") in {"general", "catalog"} and service._should_force_catalog_mode(user_input):
+        extracted["mode"] = "catalog"
+    return extracted.get("mode", "unknown")
+
+
+async def run_cases(cases: list[dict], concurrency: int = 4) -> list[dict]:
+    # Imported here so app.config sees any environment set up by the caller.
+    from app.llm.responder import ChatResponder
+    from app.services.assistant_service import AssistantService
+
+    # A fresh service per run, so its answer and extraction caches start cold.
+    service = AssistantService()
+    await service.startup()
+    # Routing is classified by a separate, uncached responder: sharing the
+    # service's extraction cache would spare the timed turns their model call.
+    classifier = ChatResponder()
+    classifier.extraction_cache = None
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_case(case: dict) -> dict:
+        async with limit:
+            user_input = case["user_input"]
+            started = time.perf_counter()
+            response, error = "", ""
+            try:
+                response = await service.answer(
+                    user_input, history=synthetic_history(case["id"]), session_id=f"eval-{case['id']}"
+                )
+            except Exception as exc:
+                error = f"{exc.__class__.__name__}: {exc}"
+            latency_ms = (time.perf_counter() - started) * 1000
+            extracted_mode = await normalized_mode(service, classifier, user_input)
+        mode_pass = expected_mode_ok(case.get("expected_mode", ""), extracted_mode)
+        source_pass = response.startswith(case.get("expected_source", ""))
+        keyword_pass = keywords_ok(case.get("must_contain", []), response)
+        return {
+            "id": case["id"],
+            "bucket": case["id"].split("_")[0],
+            "expected_mode": case.get("expected_mode", ""),
+            "extracted_mode": extracted_mode,
+            "mode_pass": mode_pass,
+            "source_pass": source_pass,
+            "keyword_pass": keyword_pass,
+            "passed": mode_pass and source_pass and keyword_pass,
+            "latency_ms": round(latency_ms, 2),
+            "error": error,
+            "response": response,
+        }
+
+    try:
+        return list(await asyncio.gather(*(run_case(c) for c in cases)))
+    finally:
+        await classifier.aclose()
+        await service.aclose()
+
+
+def summarize_results(results: list[dict]) -> dict[str, Any]:
+    def accuracy(rows: list[dict]) -> dict[str, float]:
+        n = len(rows) or 1
+        return {
+            "routing_accuracy": round(sum(r["mode_pass"] for r in rows) / n, 4),
+            "source_accuracy": round(sum(r["source_pass"] for r in rows) / n, 4),
+            "keyword_accuracy": round(sum(r["keyword_pass"] for r in rows) / n, 4),
+            "overall_pass_rate": round(sum(r["passed"] for r in rows) / n, 4),
+        }
+
+    buckets: dict[str, list[dict]] = defaultdict(list)
+    for r in results:
+        buckets[r["bucket"]].append(r)
+    return {
+        "case_count": len(results),
+        **accuracy(results),
+        "latency": summarize([r["latency_ms"] for r in results]),
+        "buckets": {
+            name: {**accuracy(rows), "latency": summarize([r["latency_ms"] for r in rows])}
+            for name, rows in sorted(buckets.items())
+        },
+    }
+
+
+def compare_to_baseline(
+    summary: dict[str, Any],
+    baseline: dict[str, Any],
+    latency_tolerance: float = 0.25,
+    latency_floor_ms: float = 50.0,
+    accuracy_tolerance: float = 0.0,
+) -> list[str]:
+    """
+    Return human-readable regressions. Latency regresses when p95 grows by more
+    than `latency_tolerance` (fraction) and by more than `latency_floor_ms`;
+    accuracy regresses when it drops by more than `accuracy_tolerance`.
+    """
+    failures: list[str] = []
+    scopes = [("overall", summary, baseline)]
+    for name, current in summary.get("buckets", {}).items():
+        if name in baseline.get("buckets", {}):
+            scopes.append((f"bucket:{name}", current, baseline["buckets"][name]))
+    for scope, current, previous in scopes:
+        for key in ACCURACY_KEYS:
+            if key in previous and current[key] < previous[key] - accuracy_tolerance:
+                failures.append(f"{scope} {key} {previous[key]:.3f} -> {current[key]:.3f}")
+        before = previous.get("latency", {}).get("p95_ms")
+        after = current["latency"]["p95_ms"]
+        if before is not None and after > before * (1 + latency_tolerance) and after - before > latency_floor_ms:
+            failures.append(f"{scope} p95 latency {before:.1f}ms -> {after:.1f}ms")
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run eval_cases.jsonl concurrently and gate on a stored baseline.")
+    parser.add_argument("--cases", default=None, help="JSONL cases file (default evaluation/eval_cases.jsonl).")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs over the case list, each on a fresh service.")
+    parser.add_argument("--out", default=None, help="Write per-case results and summary as JSON here.")
+    parser.add_argument("--baseline", default=None, help="Baseline summary JSON to gate against.")
+    parser.add_argument("--update-baseline", default=None, help="Store this run's summary as the new baseline.")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25, help="Allowed p95 growth (fraction).")
+    parser.add_argument("--latency-floor-ms", type=float, default=50.0, help="Ignore p95 growth below this.")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.0, help="Allowed accuracy drop (absolute).")
+    parser.add_argument("--offline", action="store_true", help="Run against local fake USDA/OpenAI servers.")
+    parser.add_argument("--llm", default="latency_ms=400,jitter_ms=80", help="Fake OpenAI profile with --offline.")
+    parser.add_argument("--usda", default="latency_ms=150,jitter_ms=30", help="Fake USDA profile with --offline.")
+    args = parser.parse_args(argv)
+
+    fakes = None
+    if args.offline:
+        fakes = FakeUpstreams(
+            usda=parse_profile(args.usda, FaultProfile()), llm=parse_profile(args.llm, FaultProfile())
+        )
+    cases = load_cases(args.cases)
+    results: list[dict] = []
+    with fakes or nullcontext():
+        if fakes is not None:
+            os.environ.update(fakes.env())
+            os.environ.update({"USDA_PROVIDER": "api", "SEARCH_PROVIDERS": "usda"})
+        os.environ.update(dict.fromkeys(PERSISTENT_CACHES, ""))
+        for _ in range(max(1, args.repeat)):
+            results.extend(asyncio.run(run_cases(cases, concurrency=args.concurrency)))
+
+    summary = summarize_results(results)
+    print(json.dumps({k: v for k, v in summary.items() if k != "buckets"}, indent=2))
+    for name, bucket in summary["buckets"].items():
+        lat = bucket["latency"]
+        print(
+            f"{name:<16} pass={bucket['overall_pass_rate']:.2f} "
+            f"p50={lat['p50_ms']:.1f}ms p95={lat['p95_ms']:.1f}ms p99={lat['p99_ms']:.1f}ms"
+        )
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({"summary": summary, "results": results}, indent=2), encoding="utf-8")
+    if args.update_baseline:
+        Path(args.update_baseline).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        failures = compare_to_baseline(
+            summary,
+            baseline,
+            latency_tolerance=args.latency_tolerance,
+            latency_floor_ms=args.latency_floor_ms,
+            accuracy_tolerance=args.accuracy_tolerance,
+        )
+        if failures:
+            print("\nRegressions against baseline:", file=sys.stderr)
+            for failure in failures:
+                print(f"- {failure}", file=sys.stderr)
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
@@ -0,0 +1,30 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.config import settings
+from app.data_providers.usda_snapshot import build_snapshot
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build the offline USDA FoodData Central index from extracted CSV bulk downloads."
+    )
+    parser.add_argument(
+        "source_dirs",
+        nargs="+",
+        help="Extracted FoodData Central CSV folders (Branded, Foundation, Survey FNDDS).",
+    )
+    parser.add_argument("--out", default=settings.usda_snapshot_path, help="Output SQLite file.")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    count = build_snapshot(args.source_dirs, args.out)
+    print(f"indexed_foods={count} out={args.out} seconds={time.perf_counter() - t0:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+from app.cache.answer_cache import AnswerCache, fingerprint
+
+
+def test_rephrased_question_reuses_answer_but_different_question_misses():
+    cache = AnswerCache()
+    items = ["snickers", "kit kat"]
+    key = ("compare", tuple(items), "lower sugar", fingerprint(["snickers rows", "kit kat rows"]))
+    cache.put(key, "Which has less sugar, Snickers or Kit Kat?", "Kit Kat has less sugar.", ignore=items)
+
+    assert cache.get(key, "snickers vs kit kat: which has less sugar", ignore=items) == "Kit Kat has less sugar."
+    assert cache.get(key, "Is Snickers or Kit Kat better before a long run in hot weather?", ignore=items) is None
+
+
+def test_key_pins_catalog_context():
+    cache = AnswerCache()
+    cache.put(("catalog", ("gatorade",), "", fingerprint(["row a"])), "gatorade sodium", "About 270 mg.", ignore=["gatorade"])
+
+    assert cache.get(("catalog", ("gatorade",), "", fingerprint(["row a"])), "Gatorade sodium?", ignore=["gatorade"])
+    assert cache.get(("catalog", ("gatorade",), "", fingerprint(["row b"])), "Gatorade sodium?", ignore=["gatorade"]) is None
+    assert fingerprint(["x", "y"]) == fingerprint(["y", "x"])
@@ -0,0 +1,124 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import build_router
+from app.services.assistant_service import AssistantService
+
+
+class StubService(AssistantService):
+    """The batch plumbing of AssistantService around a canned `answer`."""
+
+    def __init__(self) -> None:
+        self.chat = SimpleNamespace(extraction_cache=None, client=None)
+        self.active = 0
+        self.peak = 0
+
+    async def answer(self, user_text, history=None, allow_correction_retry=True, session_id=""):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.03 if user_text == "slow" else 0.001)
+        self.active -= 1
+        return f"[source: llm + usda]\n\n{user_text} ({len(history or [])} earlier)"
+
+
+def test_answer_many_streams_in_completion_order_with_bounded_concurrency():
+    service = StubService()
+    pulled = 0
+
+    def requests():
+        nonlocal pulled
+        for i in range(40):
+            pulled += 1
+            yield {"id": f"r{i}", "message": "slow" if i == 0 else f"q{i}"}
+
+    async def scenario():
+        results = []
+        async for result in service.answer_many(requests(), concurrency=4):
+            if not results:
+                # The first result arrives before the whole batch has been read.
+                assert pulled < 40
+            results.append(result)
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(results) == 40 and service.peak == 4
+    assert results[-1]["id"] == "r0"  # the slow one finished last
+    assert sorted(r["index"] for r in results) == list(range(40))
+    assert all(r["source"] == "llm + usda" for r in results)
+
+
+def test_api_answers_single_turns_and_ndjson_batches():
+    app = FastAPI()
+    service = StubService()
+    app.include_router(build_router(lambda: service))
+    client = TestClient(app)
+
+    single = client.post("/v1/answer", json={"message": "monster", "history": [{"role": "user", "content": "hi"}]})
+    assert single.status_code == 200
+    assert single.json()["answer"].endswith("monster (1 earlier)") and single.json()["source"] == "llm + usda"
+    assert client.post("/v1/answer", json={"message": ""}).status_code == 422
+
+    body = "\n".join([json.dumps({"id": "a", "message": "snickers"}), "not json", "", json.dumps({"user_input": "kit kat"})])
+    batch = client.post("/v1/answer/batch?concurrency=2", content=body)
+    assert batch.headers["content-type"].startswith("application/x-ndjson")
+    rows = sorted((json.loads(line) for line in batch.text.splitlines()), key=lambda r: r["index"])
+    assert [r["index"] for r in rows] == [0, 1, 2]
+    assert rows[0]["id"] == "a" and "snickers" in rows[0]["answer"]
+    assert "error" in rows[1] and "answer" not in rows[1]
+    assert "kit kat" in rows[2]["answer"]
+
+
+def test_batch_results_stream_back_while_the_upload_is_still_arriving():
+    app = FastAPI()
+    service = StubService()
+    app.include_router(build_router(lambda: service))
+    first_part = "".join(json.dumps({"id": f"a{i}", "message": f"q{i}"}) + "\n" for i in range(20))
+    rest = "".join(json.dumps({"id": f"b{i}", "message": f"q{i}"}) + "\n" for i in range(5))
+    answered = asyncio.Event()
+    sent: list[bytes] = []
+    pending_at_first_result: list[int] = []
+
+    async def scenario():
+        uploads = [first_part[:150].encode(), first_part[150:].encode(), rest.encode()]
+
+        async def receive():
+            if not uploads:
+                await asyncio.sleep(3600)  # the client stays connected
+            if len(uploads) == 1:
+                # Hold back the end of the body until a result has come back.
+                await asyncio.wait_for(answered.wait(), timeout=2)
+            body = uploads.pop(0)
+            return {"type": "http.request", "body": body, "more_body": bool(uploads)}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                if not answered.is_set():
+                    pending_at_first_result.append(len(uploads))
+                    answered.set()
+                sent.append(message["body"])
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.3"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/v1/answer/batch",
+            "raw_path": b"/v1/answer/batch",
+            "query_string": b"concurrency=4",
+            "headers": [(b"content-type", b"application/x-ndjson")],
+            "client": ("127.0.0.1", 1),
+            "server": ("testserver", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+
+    asyncio.run(scenario())
+    assert pending_at_first_result == [1]
+    rows = [json.loads(line) for line in b"".join(sent).decode().splitlines()]
+    # Every line was answered, including the ones that arrived after the first result.
+    assert sorted(r["index"] for r in rows) == list(range(25))
+    assert {r["id"] for r in rows} >= {"b0", "b4"}
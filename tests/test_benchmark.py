@@ -0,0 +1,22 @@
+from evaluation.benchmark import parse_profile, percentile
+from evaluation.fakes import FaultProfile, _match_foods
+
+
+def test_percentile_interpolates_between_ranks():
+    values = [10.0, 20.0, 30.0, 40.0]
+    assert percentile(values, 50) == 25.0
+    assert percentile(values, 100) == 40.0
+    assert percentile([], 95) == 0.0
+
+
+def test_parse_profile_overrides_defaults():
+    profile = parse_profile("latency_ms=120, error_rate=0.1,error_status=429", FaultProfile(jitter_ms=5))
+    assert profile.latency_ms == 120.0
+    assert profile.jitter_ms == 5
+    assert profile.error_rate == 0.1
+    assert profile.error_status == 429
+
+
+def test_fake_catalog_ranks_by_token_overlap():
+    names = [row[0] for _, row in _match_foods("monster zero ultra", 3)]
+    assert names[0] == "Monster Zero Ultra Energy Drink"
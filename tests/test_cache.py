@@ -0,0 +1,71 @@
+import asyncio
+
+from app.cache.ttl import FRESH, MISS, STALE, TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_expires_and_evicts_lru():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=2, ttl_seconds=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.stats.evictions == 1
+    clock.now = 11
+    assert cache.lookup("a") == (MISS, None)
+
+
+def test_ttl_cache_negative_entries_use_their_own_ttl():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=4, ttl_seconds=100, negative_ttl_seconds=5, clock=clock)
+    cache.set("empty", [], negative=True)
+    assert cache.get("empty") == []
+    assert cache.stats.negative_hits == 1
+    clock.now = 6
+    assert cache.get("empty") is None
+
+
+def test_ttl_cache_serves_stale_and_refreshes_in_background():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=4, ttl_seconds=10, stale_seconds=30, clock=clock)
+    calls = []
+
+    async def loader():
+        calls.append(clock.now)
+        return len(calls)
+
+    async def run():
+        assert await cache.get_or_load("k", loader) == (MISS, 1)
+        assert await cache.get_or_load("k", loader) == (FRESH, 1)
+        clock.now = 15
+        assert await cache.get_or_load("k", loader) == (STALE, 1)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return await cache.get_or_load("k", loader)
+
+    assert asyncio.run(run()) == (FRESH, 2)
+    assert cache.stats.refreshes == 1
+    assert len(calls) == 2
+
+
+def test_ttl_cache_skips_uncacheable_values():
+    cache = TTLCache(max_entries=4, ttl_seconds=10)
+
+    async def loader():
+        return "error"
+
+    async def run():
+        await cache.get_or_load("k", loader, is_cacheable=lambda v: v != "error")
+        return await cache.get_or_load("k", loader, is_cacheable=lambda v: v != "error")
+
+    assert asyncio.run(run()) == (MISS, "error")
+    assert len(cache) == 0
@@ -0,0 +1,61 @@
+from app.rag.catalog_store import CatalogStore
+from app.schemas import FoodProduct, Product
+
+
+def _food(name, brand="", ingredients=""):
+    return FoodProduct(code=name, product_name=name, brands=brand, ingredients_text=ingredients)
+
+
+def test_bm25_weights_name_over_ingredients_and_ranks_phrases_first():
+    products = [
+        _food("Granola Bar", ingredients="oats, peanut butter, honey"),
+        _food("Peanut Butter Cups", brand="Reese's"),
+        _food("Creamy Peanut Spread with Butter Flavor"),
+        _food("Apple Slices"),
+    ]
+    hits = CatalogStore(products).search("peanut butter")
+
+    assert [h.item.product_name for h in hits] == [
+        "Peanut Butter Cups",
+        "Granola Bar",
+        "Creamy Peanut Spread with Butter Flavor",
+    ]
+    assert hits[0].exact and hits[1].exact and not hits[2].exact
+    assert hits[2].coverage == 1.0 and hits[2].matched == 2
+
+
+def test_plurals_and_compound_prefixes_match():
+    store = CatalogStore([_food("Red Bull Sugarfree"), _food("Protein Bars"), _food("Water")])
+
+    assert [h.item.product_name for h in store.search("protein bar")] == ["Protein Bars"]
+    sugar = store.search("sugar")
+    assert [h.item.product_name for h in sugar] == ["Red Bull Sugarfree"] and not sugar[0].exact
+    assert CatalogStore([]).search("anything") == []
+
+
+def test_rerank_keeps_unmatched_products_after_matches():
+    titles = ["Phone case", "Wireless earbuds", "Earbuds charging case", "Laptop stand"]
+    products = [
+        Product(id=str(i), title=t, price=1.0, currency_id="USD", condition="new", permalink="", seller_nickname="", category_id="c")
+        for i, t in enumerate(titles)
+    ]
+    assert [p.id for p in CatalogStore.rerank("earbuds case", products, top_k=4)] == ["2", "1", "0", "3"]
+
+
+def test_index_postings_and_corpus_length_normalization():
+    store = CatalogStore([_food("Peanut Bar"), _food("Apple Slices", ingredients="apples"), _food("Peanuts")])
+    # Only documents holding a token are posted under it; "peanut" reaches "peanuts" through stemming.
+    assert [doc for doc, _ in store._postings["peanut"]] == [0, 2]
+    assert "appl" not in store._postings and store._term_postings("appl")
+
+    def score(corpus):
+        return next(h.score for h in CatalogStore(corpus).search("peanut") if h.item.product_name == "Peanut Bar")
+
+    short_names = [_food("Peanut Bar"), _food("Oat Bar"), _food("Rice Cake")]
+    long_names = [
+        _food("Peanut Bar"),
+        _food("Oat Bar with Honey Almond Crunch and Dark Chocolate Chips"),
+        _food("Brown Rice Cake with Sea Salt and Caramel Drizzle"),
+    ]
+    # Same term and document frequencies; only the corpus's average name length differs.
+    assert score(long_names) > score(short_names)
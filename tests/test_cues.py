@@ -0,0 +1,21 @@
+from app.llm.cues import CueMatcher, CueRule, cue_signals, goal_from_signals
+
+
+def test_overlapping_cues_all_raise_their_signals():
+    matcher = CueMatcher(
+        (
+            CueRule("short", ("better",)),
+            CueRule("long", ("better than",)),
+            CueRule("inner", ("than",)),
+        )
+    )
+    assert matcher.scan("is it better than that") == {"short", "long", "inner"}
+    assert matcher.scan("the best") == frozenset()
+
+
+def test_cue_signals_cover_mode_goal_and_clarification():
+    signals = cue_signals("Which is healthier, Coke or Pepsi?")
+    assert {"compare_split", "compare_cue", "asks_better", "catalog_term"} <= signals
+    assert "has_goal" not in signals
+    assert goal_from_signals(cue_signals("Compare Monster and Prime for sugar")) == "lower sugar"
+    assert goal_from_signals(cue_signals("hello")) == ""
@@ -0,0 +1,87 @@
+import asyncio
+
+from app.llm import responder
+from app.services import assistant_service
+from evaluation.runner import compare_to_baseline, expected_mode_ok, run_cases, summarize_results
+
+
+def _row(case_id: str, latency_ms: float, passed: bool = True) -> dict:
+    return {
+        "id": case_id,
+        "bucket": case_id.split("_")[0],
+        "mode_pass": passed,
+        "source_pass": passed,
+        "keyword_pass": True,
+        "passed": passed,
+        "latency_ms": latency_ms,
+    }
+
+
+def test_summarize_results_groups_by_bucket():
+    summary = summarize_results([_row("single_001", 100), _row("single_002", 300, passed=False), _row("greet_001", 1)])
+    assert summary["case_count"] == 3
+    assert summary["buckets"]["single"]["overall_pass_rate"] == 0.5
+    assert summary["buckets"]["single"]["latency"]["p50_ms"] == 200
+    assert summary["buckets"]["greet"]["routing_accuracy"] == 1.0
+
+
+def test_compare_to_baseline_flags_latency_and_accuracy_regressions():
+    baseline = summarize_results([_row("single_001", 100), _row("greet_001", 1)])
+    slower = summarize_results([_row("single_001", 400), _row("greet_001", 2)])
+    failures = compare_to_baseline(slower, baseline, latency_tolerance=0.25, latency_floor_ms=50)
+    assert any("bucket:single p95" in f for f in failures)
+    # The greet bucket doubled but stays under the absolute floor.
+    assert not any("bucket:greet" in f for f in failures)
+
+    worse = summarize_results([_row("single_001", 100, passed=False), _row("greet_001", 1)])
+    assert any("overall_pass_rate" in f for f in compare_to_baseline(worse, baseline))
+    assert compare_to_baseline(baseline, baseline) == []
+
+
+def test_expected_mode_accepts_alternatives():
+    assert expected_mode_ok("catalog_or_disambiguation", "compare")
+    assert not expected_mode_ok("memory", "catalog")
+
+
+def test_run_cases_times_the_answer_before_classifying_with_an_uncached_responder(monkeypatch):
+    events: list[str] = []
+
+    class FakeService:
+        def __init__(self) -> None:
+            self.chat = None
+
+        async def startup(self) -> None:
+            pass
+
+        async def aclose(self) -> None:
+            pass
+
+        async def answer(self, user_text, history=None, session_id=""):
+            events.append("answer")
+            await asyncio.sleep(0.02)
+            return "[source: llm + usda]\n\nMonster"
+
+        def _should_force_catalog_mode(self, text: str) -> bool:
+            return False
+
+    class FakeClassifier:
+        def __init__(self) -> None:
+            self.extraction_cache = "shared"
+
+        async def extract_food_query(self, text, use_history=False):
+            events.append(f"classify cache={self.extraction_cache}")
+            return {"mode": "catalog"}
+
+        def is_natural_food_request(self, extracted: dict) -> bool:
+            return False
+
+        async def aclose(self) -> None:
+            pass
+
+    monkeypatch.setattr(assistant_service, "AssistantService", FakeService)
+    monkeypatch.setattr(responder, "ChatResponder", FakeClassifier)
+    case = {"id": "single_001", "user_input": "monster", "expected_mode": "catalog", "expected_source": "[source: llm"}
+    (result,) = asyncio.run(run_cases([case]))
+
+    assert events == ["answer", "classify cache=None"]
+    assert result["passed"] and result["latency_ms"] >= 20
@@ -0,0 +1,30 @@
+from app.cache.extraction_cache import ExtractionCache, prompt_version
+
+
+def test_extraction_cache_normalizes_text_and_returns_copies():
+    cache = ExtractionCache(prompt_version("prompt"), max_entries=2)
+    cache.put("Compare Snickers  and Kit Kat", {"mode": "compare", "food_query": "snickers kit kat", "compare_items": ["snickers", "kit kat"]})
+
+    hit = cache.get("compare snickers and kit kat ")
+    assert hit["compare_items"] == ["snickers", "kit kat"]
+    hit["compare_items"].append("mutated")
+    assert cache.get("compare snickers and kit kat")["compare_items"] == ["snickers", "kit kat"]
+    assert cache.get("compare snickers and twix") is None
+
+
+def test_persistent_store_survives_restart_and_drops_old_prompt_versions(tmp_path):
+    path = tmp_path / "extractions.sqlite3"
+    extraction = {"mode": "catalog", "food_query": "monster energy drink", "compare_items": []}
+
+    first = ExtractionCache(prompt_version("v1"), path=path)
+    first.put("Monster energy drink", extraction)
+    first.close()
+
+    reopened = ExtractionCache(prompt_version("v1"), path=path)
+    assert reopened.get("monster energy drink") == extraction
+    reopened.close()
+
+    edited = ExtractionCache(prompt_version("v2"), path=path)
+    assert edited.get("monster energy drink") is None
+    edited.close()
+    assert ExtractionCache(prompt_version("v1"), path=path).get("monster energy drink") is None
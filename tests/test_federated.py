@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from app.data_providers.base import ProviderResult
+from app.data_providers.federated import FederatedFoodSearch
+from app.schemas import FoodProduct
+
+
+class FakeProvider:
+    def __init__(self, source: str, products: list[FoodProduct], delay: float = 0.0) -> None:
+        self.source = source
+        self.products = products
+        self.delay = delay
+        self.cancelled = False
+
+    async def search(self, query: str, page_size: int | None = None) -> ProviderResult:
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return ProviderResult(products=list(self.products), source=self.source)
+
+
+def test_federated_merge_dedupes_by_gtin_and_name():
+    usda = FakeProvider(
+        "usda",
+        [
+            FoodProduct(code="1", product_name="Kit Kat", gtin="0034000002405", energy_kcal_100g=518),
+            FoodProduct(code="2", product_name="Snickers Bar"),
+        ],
+    )
+    off = FakeProvider(
+        "openfoodfacts",
+        [
+            FoodProduct(code="34000002405", product_name="KitKat wafer", gtin="34000002405", sugars_100g=48),
+            FoodProduct(code="9", product_name="snickers  bar", salt_100g=0.3),
+            FoodProduct(code="7", product_name="Twix"),
+        ],
+    )
+    federated = FederatedFoodSearch([usda, off], budget_seconds=1, strategy="merge")
+    result = asyncio.run(federated.search("chocolate"))
+
+    assert [p.code for p in result.products] == ["1", "2", "7"]
+    assert result.products[0].sugars_100g == 48
+    assert result.products[1].salt_100g == 0.3
+    assert result.source == "usda+openfoodfacts"
+
+
+def test_federated_merge_keeps_same_named_items_from_one_provider_apart():
+    usda = FakeProvider(
+        "usda",
+        [
+            FoodProduct(code="1", product_name="GREEK YOGURT", brands="Fage", proteins_100g=10),
+            FoodProduct(code="2", product_name="Greek Yogurt", brands="Chobani", sugars_100g=4),
+        ],
+    )
+    off = FakeProvider("openfoodfacts", [FoodProduct(code="8", product_name="greek yogurt", salt_100g=0.1)])
+    result = asyncio.run(FederatedFoodSearch([usda, off], budget_seconds=1, strategy="merge").search("greek yogurt"))
+
+    assert [p.code for p in result.products] == ["1", "2"]
+    # Nutrients were not mixed between the two brands; the other provider's copy still filled a gap.
+    assert result.products[0].sugars_100g is None and result.products[1].proteins_100g is None
+    assert result.products[0].salt_100g == 0.1
+
+
+def test_federated_first_prefers_earlier_provider_and_respects_budget():
+    slow = FakeProvider("usda", [FoodProduct(code="1", product_name="Slow")], delay=5)
+    fast = FakeProvider("openfoodfacts", [FoodProduct(code="2", product_name="Fast")])
+    federated = FederatedFoodSearch([slow, fast], budget_seconds=0.05, strategy="first")
+    result = asyncio.run(federated.search("anything"))
+
+    assert result.source == "openfoodfacts"
+    assert [p.code for p in result.products] == ["2"]
+    assert slow.cancelled
+
+
+def test_federated_first_returns_a_fast_result_without_waiting_out_the_budget():
+    slow = FakeProvider("usda", [FoodProduct(code="1", product_name="Slow")], delay=5)
+    fast = FakeProvider("openfoodfacts", [FoodProduct(code="2", product_name="Fast")], delay=0.01)
+    federated = FederatedFoodSearch([slow, fast], budget_seconds=8, strategy="first", grace_seconds=0.05)
+    started = time.perf_counter()
+    result = asyncio.run(federated.search("anything"))
+
+    assert result.source == "openfoodfacts"
+    assert time.perf_counter() - started < 0.5
+    assert slow.cancelled
+
+
+def test_federated_first_lets_an_earlier_provider_win_within_the_grace_period():
+    usda = FakeProvider("usda", [FoodProduct(code="1", product_name="Kit Kat")], delay=0.05)
+    off = FakeProvider("openfoodfacts", [FoodProduct(code="2", product_name="KitKat")], delay=0.0)
+    federated = FederatedFoodSearch([usda, off], budget_seconds=8, strategy="first", grace_seconds=1.0)
+    started = time.perf_counter()
+    result = asyncio.run(federated.search("kit kat"))
+
+    assert result.source == "usda"
+    # Returned as soon as USDA answered, not at the end of the grace period.
+    assert time.perf_counter() - started < 0.5
@@ -0,0 +1,90 @@
+import math
+import random
+
+import numpy as np
+
+from app.llm.context import compact_reply
+from app.schemas import FoodProduct
+from app.services import food_batch
+from app.services.assistant_service import AssistantService
+from app.services.food_batch import FoodBatch, per_serving, rank_products
+
+
+def _product(name, kcal=None, sugar=None, protein=None, serving=None):
+    return FoodProduct(
+        code=name, product_name=name, energy_kcal_100g=kcal, sugars_100g=sugar, proteins_100g=protein, serving_size_g=serving
+    )
+
+
+def test_goal_order_matches_sentinel_sort_with_missing_values_last():
+    rng = random.Random(3)
+    products = [
+        _product(str(i), kcal=rng.choice([None, 50.0, 120.0, rng.uniform(0, 600)]), protein=rng.choice([None, 5.0, 9.0]))
+        for i in range(200)
+    ]
+    batch = FoodBatch.from_products(products)
+    for goal, field, reverse in (("lower calories", "energy_kcal_100g", False), ("higher protein", "proteins_100g", True)):
+        sentinel = -math.inf if reverse else math.inf
+        expected = sorted(
+            products, key=lambda p: sentinel if getattr(p, field) is None else getattr(p, field), reverse=reverse
+        )
+        assert [products[i].code for i in batch.goal_order(goal)] == [p.code for p in expected]
+    assert list(batch.goal_order("unknown goal")) == list(range(200))
+
+
+def test_weighted_scores_and_per_serving():
+    batch = FoodBatch.from_products(
+        [
+            _product("lean", kcal=100, sugar=20, protein=30, serving=50),
+            _product("sweet", kcal=100, sugar=40, protein=10),
+            _product("bare", kcal=300),
+        ]
+    )
+    assert list(batch.rank({"lower sugar": 1, "higher protein": 1})) == [0, 1, 2]
+    assert np.allclose(batch.scores({"lower sugar": 1}), [1.0, 0.0, 0.0])
+    per_serving = batch.per_serving()
+    assert per_serving[0, 0] == 50 and math.isnan(per_serving[1, 0])
+
+
+def test_python_and_columnar_paths_agree():
+    rng = random.Random(7)
+    products = [
+        _product(
+            str(i),
+            kcal=rng.choice([None, 80.0, rng.uniform(0, 600)]),
+            sugar=rng.choice([None, 10.0, rng.uniform(0, 50)]),
+            protein=rng.choice([None, rng.uniform(0, 30)]),
+            serving=rng.choice([None, 30.0, rng.uniform(10, 300)]),
+        )
+        for i in range(1100)
+    ]
+    both = "lower sugar, higher protein"
+    batch, few = FoodBatch.from_products(products), products[:60]
+    # Above the threshold a weighted ranking runs on FoodBatch; below it, in Python. Same order either way.
+    assert len(products) >= food_batch.VECTORIZE_MIN_PRODUCTS > len(few)
+    assert rank_products(products, both) == batch.rank(food_batch.goal_weights(both)).tolist()
+    assert rank_products(few, both) == FoodBatch.from_products(few).rank(food_batch.goal_weights(both)).tolist()
+    for goal in ("lower calories", "higher protein"):
+        assert rank_products(products, goal) == batch.goal_order(goal).tolist()
+    # A recalled goal with no known part keeps input order, at any size.
+    assert rank_products(products, "feel better") == rank_products(few, "") + list(range(60, 1100))
+
+    for a, b, serving in zip(per_serving(products), batch.per_serving().tolist(), batch.serving_g.tolist()):
+        assert (a is None) == math.isnan(serving)
+        if a is not None:
+            assert all((x is None and math.isnan(y)) or math.isclose(x, y) for x, y in zip(a, b))
+
+
+def test_comparison_table_ranks_on_every_goal_and_lists_servings():
+    rows = [
+        ("sweet", _product("SWEET BAR", kcal=400, sugar=40, protein=5, serving=50)),
+        ("lean", _product("LEAN BAR", kcal=380, sugar=10, protein=30)),
+    ]
+    service = AssistantService.__new__(AssistantService)  # table formatting needs no providers
+    table = service._format_comparison_table(rows, "lower sugar, higher protein")
+
+    assert table.index("LEAN BAR") < table.index("SWEET BAR")
+    assert "- SWEET BAR (50.0 g): 200.0 kcal, sugar 20.0 g, protein 2.5 g" in table
+    assert "LEAN BAR (" not in table
+    assert table.endswith("Assumed goal: lower sugar, higher protein")
+    assert compact_reply(table) == "[table shown: LEAN BAR; SWEET BAR | goal: lower sugar, higher protein]"
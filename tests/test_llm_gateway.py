@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.data_providers.ratelimit import UpstreamLimiter
+from app.llm.gateway import LLMGateway
+from app.llm.responder import ChatResponder
+
+
+class FakeRaw:
+    status_code = 200
+    headers: dict = {}
+
+    def __init__(self, parsed) -> None:
+        self._parsed = parsed
+
+    def parse(self):
+        return self._parsed
+
+
+class FakeEndpoint:
+    """Stands in for `client.<api>.with_raw_response`: answers through `reply` after `delay`."""
+
+    def __init__(self, reply, delay: float = 0.0) -> None:
+        self.reply = reply
+        self.delay = delay
+        self.with_raw_response = self
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            return FakeRaw(self.reply(str(kwargs.get("messages") or kwargs.get("input"))))
+        finally:
+            self.active -= 1
+
+
+def _chat_reply(text: str):
+    if "fail" in text:
+        raise RuntimeError("chat down")
+    message = SimpleNamespace(content=f"chat: {text[-20:]}")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def _responses_reply(text: str):
+    if "fail twice" in text:
+        raise RuntimeError("responses down")
+    return SimpleNamespace(output_text="from responses", usage=None)
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.chat = SimpleNamespace(completions=FakeEndpoint(_chat_reply, delay))
+        self.responses = FakeEndpoint(_responses_reply, delay)
+
+    async def close(self) -> None:
+        pass
+
+
+def _gateway(delay: float = 0.0) -> LLMGateway:
+    gateway = LLMGateway()
+    gateway.client = FakeAsyncOpenAI(delay)
+    gateway.flights = None
+    return gateway
+
+
+def test_gateway_caps_concurrent_calls():
+    gateway = _gateway(delay=0.02)
+    gateway.limiter = UpstreamLimiter("llm", rate_per_second=0, burst=1, max_concurrency=2)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(gateway.chat([{"role": "user", "content": f"question {i}"}]) for i in range(6))
+        )
+
+    replies = asyncio.run(scenario())
+    completions = gateway.client.chat.completions
+    assert completions.calls == 6 and completions.peak == 2
+    assert replies[3].endswith("question 3'}]")
+
+
+def test_gateway_times_out_slow_calls_and_counts_them_against_the_api():
+    gateway = _gateway(delay=1.0)
+    gateway.timeout = 0.02
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(gateway.chat([{"role": "user", "content": "slow"}]))
+    assert gateway.breaker.failures == 1
+    assert gateway.client.chat.completions.active == 0  # the slow call was cancelled, not left running
+
+
+def test_responder_falls_back_and_keeps_outcomes_per_turn():
+    responder = ChatResponder(gateway=_gateway(delay=0.01))
+    responder.extraction_cache = None
+
+    async def turn(text: str, pause: float):
+        await asyncio.sleep(pause)
+        reply = await responder.reply(text)
+        # Let the other turn finish its call before reading this turn's outcome.
+        await asyncio.sleep(0.05)
+        return reply, responder.last_source, responder.last_error
+
+    async def scenario():
+        return await asyncio.gather(
+            turn("fine question", 0.0), turn("fail once", 0.0), turn("fail twice", 0.005)
+        )
+
+    ok, recovered, failed = asyncio.run(scenario())
+    assert ok[0].startswith("chat:") and ok[1:] == ("llm", "")
+    # Chat completions failed; the Responses API answered instead.
+    assert recovered == ("from responses", "llm", "")
+    assert failed[0].startswith("OpenAI request failed") and failed[1] == "fallback"
+    assert failed[2] == "RuntimeError: responses down"
+    # Nothing leaks into the caller's context.
+    assert responder.last_source == "fallback" and responder.last_error == ""
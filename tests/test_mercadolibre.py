@@ -0,0 +1,36 @@
+import asyncio
+
+import httpx
+
+from app.data_providers import base
+from app.data_providers.mercadolibre import MercadoLibreClient
+
+
+def test_search_goes_through_the_limiter_and_breaker(monkeypatch):
+    seen: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        if "/MPE/" in request.url.path:
+            return httpx.Response(503, text="busy")
+        return httpx.Response(200, json={"results": [{"id": "MLA1", "title": "Kit Kat", "price": 3.5}]})
+
+    monkeypatch.setattr(
+        base, "build_http_client", lambda timeout, headers: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    client = MercadoLibreClient()
+    client.site_id, client.fallback_sites = "MPE", ["MLA"]
+
+    result = asyncio.run(client.search("kit kat"))
+    assert [p.title for p in result.products] == ["Kit Kat"]
+    assert seen == ["/sites/MPE/search", "/sites/MLA/search"]
+    # The fallback site's success reset the breaker; the limiter saw both responses and holds no slots.
+    assert client.breaker.failures == 0 and client.limiter.in_flight == 0
+
+    client.breaker.failures = client.breaker.failure_threshold - 1
+    client.site_id, client.fallback_sites = "MPE", []
+    assert asyncio.run(client.search("kit kat")).error.startswith("MercadoLibre site=MPE HTTP 503")
+    # Fifth failure in a row: the circuit is open and the next search fails fast without a request.
+    calls = len(seen)
+    assert asyncio.run(client.search("kit kat")).error == "MercadoLibre network error: CircuitOpenError"
+    assert len(seen) == calls
@@ -0,0 +1,65 @@
+from app.llm.context import ContextBlock, PromptBuilder, clip_tokens, compact_reply, estimate_tokens
+
+REPLY = """[source: llm + usda-compare]
+
+## Summary
+Kit Kat has fewer calories than Snickers per 100 g.
+
+Comparison table
+
+| Query | Product | kcal/100g | sugar/100g | protein/100g | fat/100g | salt/100g |
+|---|---|---:|---:|---:|---:|---:|
+| kit kat | KIT KAT WAFER BAR | 518.0 | 47.0 | 6.5 | 26.0 | 0.1 |
+| snickers | SNICKERS BAR | 488.0 | 50.0 | 7.5 | 24.0 | 0.6 |
+
+Assumed goal: lower calories
+
+Match quality
+
+- kit kat: high confidence, all query terms matched, source=usda"""
+
+
+def test_estimate_and_clip_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("kcal_100g=518") == 6  # kcal _ 100 g = 518
+    assert estimate_tokens("nutrition") == 2 and estimate_tokens("1234567") == 3
+    assert estimate_tokens("a much longer sentence") < estimate_tokens("a much longer sentence, again and again")
+    long = " ".join(["protein"] * 100)
+    clipped = clip_tokens(long, 10)
+    assert clipped.endswith("…") and estimate_tokens(clipped) <= 10
+    assert clip_tokens("short", 10) == "short"
+
+
+def test_old_replies_keep_their_gist_but_not_their_tables():
+    compact = compact_reply(REPLY)
+    assert compact.startswith("Kit Kat has fewer calories than Snickers")
+    assert "[table shown: KIT KAT WAFER BAR; SNICKERS BAR | goal: lower calories]" in compact
+    assert "source" not in compact and "518.0" not in compact and "Match quality" not in compact
+    assert estimate_tokens(compact) < estimate_tokens(REPLY) / 3
+
+
+def test_budget_fills_rows_then_session_then_history():
+    blocks = [
+        ContextBlock("ITEM_QUERY: snickers", ["1. SNICKERS BAR | kcal_100g=488", "2. SNICKERS ALMOND | kcal_100g=479"]),
+        ContextBlock("ITEM_QUERY: kit kat", ["1. KIT KAT | kcal_100g=518", "2. KIT KAT CHUNKY | kcal_100g=515"]),
+    ]
+    history = [{"role": "user", "content": "monster energy drink"}, {"role": "assistant", "content": REPLY}]
+    args = ("You are a nutrition assistant.", "Compare Snickers and Kit Kat")
+
+    roomy = PromptBuilder(budget=0).build(*args, blocks=blocks, session="goal=lower sugar", history=history)
+    assert [m["role"] for m in roomy] == ["system", "user", "assistant", "user"]
+    assert roomy[-1]["content"].startswith("SESSION_STATE: goal=lower sugar\n\nCompare Snickers and Kit Kat")
+    assert "SNICKERS ALMOND" in roomy[-1]["content"] and "KIT KAT CHUNKY" in roomy[-1]["content"]
+
+    # Too tight for anything optional: the request and each item's best row still go out.
+    tight = PromptBuilder(budget=1).build(*args, blocks=blocks, session="goal=lower sugar", history=history)
+    assert [m["role"] for m in tight] == ["system", "user"]
+    content = tight[-1]["content"]
+    assert "SNICKERS BAR" in content and "1. KIT KAT" in content
+    assert "SNICKERS ALMOND" not in content and "SESSION_STATE" not in content
+
+    # Room for the runners-up and session state, but not for history.
+    sized = sum(estimate_tokens(m["content"]) + 4 for m in roomy[:1] + roomy[-1:])
+    middle = PromptBuilder(budget=sized).build(*args, blocks=blocks, session="goal=lower sugar", history=history)
+    assert [m["role"] for m in middle] == ["system", "user"]
+    assert middle[-1]["content"] == roomy[-1]["content"]
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from app.data_providers.ratelimit import (
+    BACKGROUND,
+    INTERACTIVE,
+    AIMDController,
+    TokenBucket,
+    UpstreamLimiter,
+    background,
+    current_priority,
+    parse_duration,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_refills_and_follows_rate_limit_headers():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=2, clock=clock)
+    bucket.take()
+    bucket.take()
+    assert bucket.delay() == 0.5
+    clock.now = 0.5
+    assert bucket.delay() == 0.0
+
+    # The server says the quota is spent: wait for its reset even with local tokens left.
+    bucket.observe({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "6m0s"})
+    assert bucket.delay() == 360.0
+    assert parse_duration("20ms") == 0.02 and parse_duration("1.5") == 1.5
+    # Unix timestamps (seconds or milliseconds) become the time left until them.
+    assert 29 < parse_duration(str(int(time.time()) + 30)) <= 30
+    assert 29 < parse_duration(str(int((time.time() + 30) * 1000))) <= 30
+    assert parse_duration(str(int(time.time()) - 5)) == 0.0
+
+    unmetered = TokenBucket(rate=0, capacity=1, clock=clock)
+    for _ in range(5):
+        unmetered.take()
+    assert unmetered.delay() == 0.0
+    unmetered.observe({"retry-after": "3"})
+    assert unmetered.delay() == 3.0
+
+
+def test_aimd_backs_off_once_per_cooldown_and_recovers_additively():
+    clock = FakeClock()
+    aimd = AIMDController(initial=8, maximum=8, cooldown=1.0, clock=clock)
+    aimd.on_overload()
+    aimd.on_overload()
+    assert aimd.limit == 4
+    clock.now = 2.0
+    aimd.on_overload()
+    assert aimd.limit == 2
+    for _ in range(2):
+        aimd.on_success()
+    assert round(aimd.limit, 2) == 2.9  # 2 + 1/2 + 1/2.5
+
+
+def test_limiter_serves_interactive_waiters_before_background():
+    async def scenario():
+        limiter = UpstreamLimiter("test", rate_per_second=0, burst=1, max_concurrency=1)
+        order: list[str] = []
+
+        async def call(name: str, priority: int) -> None:
+            async with limiter.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        await limiter.acquire()
+        waiters = [
+            asyncio.create_task(call("prefetch", BACKGROUND)),
+            asyncio.create_task(call("turn", INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*waiters)
+        assert order == ["turn", "prefetch"]
+        assert limiter.in_flight == 0
+
+        with background():
+            assert current_priority() == BACKGROUND
+        assert current_priority() == INTERACTIVE
+
+    asyncio.run(scenario())
+
+
+def test_limiter_releases_a_slot_granted_to_a_cancelled_waiter():
+    async def scenario():
+        limiter = UpstreamLimiter("test", rate_per_second=0, burst=1, max_concurrency=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()  # grants the slot to `waiter` ...
+        waiter.cancel()  # ... which gives up before it runs
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.in_flight == 0
+        await asyncio.wait_for(limiter.acquire(), timeout=1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app.data_providers.resilience import (
+    CircuitBreaker,
+    DeadlineExceeded,
+    LatencyWindow,
+    budget_timeout,
+    deadline,
+    hedged,
+    remaining,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_nested_deadlines_only_shorten_and_clip_timeouts():
+    assert remaining() is None
+    assert budget_timeout(5.0) == (5.0, False)
+    with deadline(10):
+        with deadline(60):
+            assert 9 < remaining() <= 10
+        with deadline(0.5):
+            timeout, clipped = budget_timeout(5.0)
+            assert clipped and 0 < timeout <= 0.5
+        assert budget_timeout(5.0) == (5.0, False)
+    assert remaining() is None
+
+    with deadline(0.001):
+        asyncio.run(asyncio.sleep(0.002))
+        with pytest.raises(DeadlineExceeded):
+            budget_timeout(5.0)
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+    clock.now = 31
+    assert breaker.allow()  # one probe ...
+    assert not breaker.allow()  # ... while everyone else still fails fast
+    breaker.record_failure()
+    clock.now = 45
+    assert not breaker.allow()
+
+    clock.now = 62
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_hedge_delay_waits_for_enough_samples():
+    window = LatencyWindow(quantile=0.9, min_samples=10)
+    for ms in range(1, 10):
+        window.record(ms / 1000)
+    assert window.hedge_delay() is None
+    window.record(0.5)
+    assert window.hedge_delay() == 0.5
+    assert window.hedge_delay(floor=1.0) == 1.0
+    assert LatencyWindow(quantile=0).hedge_delay() is None
+
+
+def test_hedged_call_returns_the_first_success_and_cancels_the_straggler():
+    async def scenario():
+        calls = 0
+        cancelled = asyncio.Event()
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return calls
+
+        assert await asyncio.wait_for(hedged(call, delay=0.01), timeout=1) == 2
+        await asyncio.sleep(0)
+        assert cancelled.is_set()
+
+        async def fast():
+            return "primary"
+
+        assert await hedged(fast, delay=0.01) == "primary"
+
+        async def fails():
+            raise ValueError("upstream")
+
+        with pytest.raises(ValueError):
+            await hedged(fails, delay=0.01)
+
+    asyncio.run(scenario())
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from app.data_providers.base import ProviderResult
+from app.schemas import FoodProduct
+from app.services.assistant_service import AssistantService
+
+
+class StaggeredCatalog:
+    """Answers each query after its own delay with the products listed for it."""
+
+    def __init__(self, answers: dict[str, tuple[float, list[str]]]) -> None:
+        self.answers = answers
+        self.started: list[str] = []
+        self.cancelled: list[str] = []
+
+    async def search(self, query: str, page_size: int | None = None) -> ProviderResult:
+        self.started.append(query)
+        delay, names = self.answers[query]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(query)
+            raise
+        products = [FoodProduct(code=str(i), product_name=name) for i, name in enumerate(names)]
+        return ProviderResult(products=products, source="usda", status=200)
+
+
+def _service(catalog: StaggeredCatalog) -> AssistantService:
+    service = AssistantService()
+    service.catalog = catalog
+    return service
+
+
+def test_variants_run_concurrently_and_a_high_confidence_hit_cancels_the_rest():
+    catalog = StaggeredCatalog(
+        {
+            "monster energy drinks": (0.5, ["MONSTER ENERGY DRINKS"]),
+            "monster energy drink": (0.4, ["MONSTER ENERGY DRINK"]),
+            "energy drinks": (0.05, ["MONSTER ENERGY DRINKS, ULTRA"]),
+        }
+    )
+    service = _service(catalog)
+    started = time.perf_counter()
+    query, products, meta, *_ = asyncio.run(service._search_with_variants("monster energy drinks"))
+    elapsed = time.perf_counter() - started
+
+    assert catalog.started == ["monster energy drinks", "monster energy drink", "energy drinks"]
+    assert query == "energy drinks" and meta["confidence"] == "high"
+    assert [p.product_name for p in products] == ["MONSTER ENERGY DRINKS, ULTRA"]
+    assert sorted(catalog.cancelled) == ["monster energy drink", "monster energy drinks"]
+    # The fastest variant decided the turn; the slow ones were not waited for.
+    assert elapsed < 0.3
+
+
+def test_without_a_confident_hit_every_variant_is_awaited_and_the_best_kept():
+    catalog = StaggeredCatalog(
+        {
+            "monster energy drinks": (0.1, ["MONSTER MUNCH"]),
+            "monster energy drink": (0.08, ["MONSTER MUNCH ENERGY"]),
+            "energy drinks": (0.01, []),
+        }
+    )
+    service = _service(catalog)
+    started = time.perf_counter()
+    query, products, meta, *_ = asyncio.run(service._search_with_variants("monster energy drinks"))
+    elapsed = time.perf_counter() - started
+
+    assert catalog.cancelled == []
+    assert query == "monster energy drink" and [p.product_name for p in products] == ["MONSTER MUNCH ENERGY"]
+    assert meta["confidence"] == "medium"
+    # Concurrent, not serial: the slowest variant bounds the wait.
+    assert elapsed < 0.18
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from app.serve import AffinityProxy, WorkerPool, share_caches
+
+
+def test_api_calls_spread_by_load_and_ui_sessions_stick_to_a_worker(tmp_path):
+    pool = WorkerPool(3, tmp_path)
+    proxy = AffinityProxy(pool)
+    pool.active[:] = [2, 0, 1]
+    assert proxy.pick(b"POST /v1/answer/batch HTTP/1.1\r\n\r\n") == 1
+    assert proxy.pick(b"GET /assets/index.js HTTP/1.1\r\n\r\n") == 1
+
+    # Join, event stream and heartbeat of one Gradio session reach the same worker, whatever its load.
+    join = proxy.pick(b"POST /gradio_api/queue/join HTTP/1.1\r\n\r\n", b'{"data": [], "session_hash": "k3x9q"}')
+    pool.active[:] = [0, 5, 5]
+    assert proxy.pick(b"GET /gradio_api/queue/data?session_hash=k3x9q HTTP/1.1\r\n\r\n") == join
+    assert proxy.pick(b"GET /gradio_api/heartbeat/k3x9q HTTP/1.1\r\n\r\n") == join
+
+
+def test_each_request_is_routed_on_its_own_and_closes_after_its_response(tmp_path):
+    pool = WorkerPool(2, tmp_path)
+    proxy = AffinityProxy(pool)
+    heads: list[tuple[int, bytes]] = []
+    release = asyncio.Event()
+
+    def worker(index: int):
+        async def handle(reader, writer):
+            head = await reader.readuntil(b"\r\n\r\n")
+            heads.append((index, head))
+            await release.wait()
+            writer.write(b"HTTP/1.1 200 OK\r\ncontent-length: 1\r\nconnection: close\r\n\r\n%d" % index)
+            writer.close()
+
+        return handle
+
+    async def request(port: int, head: bytes) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(head)
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def scenario():
+        workers = [await asyncio.start_unix_server(worker(i), pool.sockets[i]) for i in range(2)]
+        server = await asyncio.start_server(proxy.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        keep_alive = b"POST /v1/answer HTTP/1.1\r\nHost: t\r\nConnection: keep-alive\r\nContent-Length: 0\r\n\r\n"
+        calls = [asyncio.create_task(request(port, keep_alive)) for _ in range(2)]
+        while len(heads) < 2:
+            await asyncio.sleep(0.01)
+        release.set()
+        responses = await asyncio.gather(*calls)
+        for s in (server, *workers):
+            s.close()
+        return responses
+
+    responses = asyncio.run(scenario())
+    # Two API calls in flight at once went to different workers...
+    assert sorted(r[-1:] for r in responses) == [b"0", b"1"]
+    # ...and each worker was told to close after answering, so the client's next request is routed afresh.
+    for _, head in heads:
+        assert head.endswith(b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+        assert b"keep-alive" not in head
+
+
+def test_workers_default_to_shared_cache_files(tmp_path, monkeypatch):
+    monkeypatch.setenv("SESSION_STORE_PATH", "/data/sessions.sqlite3")
+    for name in ("EXTRACTION_CACHE_PATH", "PROVIDER_CACHE_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    share_caches(tmp_path)
+    assert os.environ["SESSION_STORE_PATH"] == "/data/sessions.sqlite3"
+    assert Path(os.environ["PROVIDER_CACHE_PATH"]).parent == tmp_path
+    assert os.environ["EXTRACTION_CACHE_PATH"] != os.environ["PROVIDER_CACHE_PATH"]
+
+
+def test_metrics_scrape_sums_every_worker(tmp_path):
+    pool = WorkerPool(3, tmp_path)
+    proxy = AffinityProxy(pool)
+
+    def worker(requests: int):
+        async def handle(reader, writer):
+            assert (await reader.readuntil(b"\r\n\r\n")).startswith(b"GET /metrics ")
+            body = f"# TYPE turns_total counter\nturns_total{{source=\"llm\"}} {requests}\n".encode()
+            writer.write(b"HTTP/1.1 200 OK\r\ncontent-length: %d\r\n\r\n" % len(body) + body)
+            writer.close()
+
+        return handle
+
+    async def scenario():
+        # Worker 2 is down (restarting) and is left out.
+        workers = [await asyncio.start_unix_server(worker(n), pool.sockets[i]) for i, n in enumerate((3, 4))]
+        server = await asyncio.start_server(proxy.handle, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: test\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        for s in (server, *workers):
+            s.close()
+        return response
+
+    response = asyncio.run(scenario())
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.endswith(b'# TYPE turns_total counter\nturns_total{source="llm"} 7\n')
+
+
+def test_importing_the_app_builds_no_service():
+    # Spawned workers import app.main; only the lifespan of a serving process creates the service.
+    script = (
+        "from app.services import assistant_service\n"
+        "def refuse(self): raise SystemExit('AssistantService built at import')\n"
+        "assistant_service.AssistantService.__init__ = refuse\n"
+        "import app.main\n"
+        "assert app.main.service is None\n"
+    )
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=Path(__file__).parents[1])
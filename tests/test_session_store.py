@@ -0,0 +1,73 @@
+from app.services.session_store import SessionState, SessionStore
+
+SNICKERS = {"mode": "compare", "food_query": "snickers kit kat", "compare_items": ["snickers", "kit kat"]}
+MONSTER = {"mode": "catalog", "food_query": "monster energy drink", "compare_items": []}
+
+
+def _turn(store: SessionStore, session_id: str, history: list[dict], text: str, extraction: dict) -> list[dict]:
+    # What the service does at the start of a turn, minus the model calls.
+    state, unseen = store.resume(session_id, history)
+    for message in unseen:
+        state.fold(message, store.extraction(session_id, message) or {})
+    state.fold(text, extraction)
+    state.seen = len(history) + 1
+    store.save(session_id, state)
+    return history + [{"role": "user", "content": text}, {"role": "assistant", "content": "..."}]
+
+
+def test_extraction_records_are_per_session_copies():
+    store = SessionStore()
+    store.remember_extraction("s1", "compare snickers and kit kat", SNICKERS)
+    got = store.extraction("s1", "compare snickers and kit kat")
+    got["compare_items"].append("twix")
+    assert store.extraction("s1", "compare snickers and kit kat")["compare_items"] == ["snickers", "kit kat"]
+    assert store.extraction("s2", "compare snickers and kit kat") is None
+    store.remember_extraction("", "anything", MONSTER)
+    assert store.extraction("", "anything") is None
+
+
+def test_sessions_are_evicted_least_recent_first():
+    store = SessionStore(max_sessions=2)
+    store.remember_extraction("s1", "x", MONSTER)
+    store.remember_extraction("s2", "x", MONSTER)
+    store.get("s1")
+    store.remember_extraction("s3", "x", MONSTER)
+    assert store.get("s2") is None
+    assert store.get("s1") is not None and len(store) == 2
+
+
+def test_turns_fold_incrementally_and_edited_history_is_replayed():
+    store = SessionStore()
+    history = _turn(store, "s1", [], "Compare Snickers and Kit Kat for sugar", SNICKERS)
+    history = _turn(store, "s1", history, "Monster energy drink", MONSTER)
+
+    state, unseen = store.resume("s1", history)
+    assert unseen == []
+    assert state.products == ["snickers", "kit kat", "monster energy drink"]
+    assert state.goal == "lower sugar"
+    assert state.last_query == "Monster energy drink"
+
+    # The user edited their first message: the stored state no longer matches.
+    edited = [{"role": "user", "content": "Monster energy drink"}, {"role": "assistant", "content": "..."}]
+    state, unseen = store.resume("s1", edited)
+    assert unseen == ["Monster energy drink"]
+    assert state.products == [] and state.extractions  # replay starts empty but keeps extraction records
+
+
+def test_state_survives_restart_with_sqlite(tmp_path):
+    path = tmp_path / "sessions.sqlite3"
+    first = SessionStore(path=path)
+    history = _turn(first, "s1", [], "Monster energy drink", MONSTER)
+    state = first.get("s1")
+    state.show_results(["Monster Energy Drink", ""])
+    first.save("s1", state)
+    first.close()
+
+    reopened = SessionStore(path=path)
+    state, unseen = reopened.resume("s1", history)
+    assert unseen == []
+    assert state.products == ["monster energy drink"]
+    assert state.last_results == ["Monster Energy Drink"]
+    assert reopened.extraction("s1", "Monster energy drink") == MONSTER
+    reopened.close()
+    assert SessionState.from_json(state.to_json()) == state
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import httpx
+
+from app.cache.shared import SharedCache
+from app.data_providers import base
+from app.data_providers.usda import USDAFoodDataClient
+from app.services.session_store import SessionStore
+
+MONSTER = {"mode": "catalog", "food_query": "monster energy drink", "compare_items": []}
+
+
+def test_values_are_shared_between_handles_and_expire(tmp_path):
+    path = tmp_path / "shared.sqlite3"
+    first, second = SharedCache(path, "usda"), SharedCache(path, "usda")
+    other = SharedCache(path, "off")
+    first.set('["monster", 12]', {"products": [{"code": "1"}], "status": 200}, ttl_seconds=60)
+    assert second.get('["monster", 12]') == {"products": [{"code": "1"}], "status": 200}
+    assert other.get('["monster", 12]') is None
+
+    first.set("brief", [1], ttl_seconds=0.01)
+    first.set("never", [2], ttl_seconds=0)
+    time.sleep(0.02)
+    assert second.get("brief") is None and second.get("never") is None
+    for cache in (first, second, other):
+        cache.close()
+
+
+def test_shared_session_store_sees_writes_from_other_processes(tmp_path):
+    path = tmp_path / "sessions.sqlite3"
+    worker_a = SessionStore(path=path, shared=True)
+    worker_b = SessionStore(path=path, shared=True)
+    worker_a.remember_extraction("s1", "monster energy drink", MONSTER)
+    assert worker_b.get("s1").extractions  # cached in worker B's memory from here on
+
+    state = worker_a.get("s1")
+    state.show_results(["Monster Energy Drink"])
+    worker_a.save("s1", state)
+    assert worker_b.get("s1").last_results == ["Monster Energy Drink"]
+
+    # Without `shared`, the in-memory copy is trusted as the only writer's.
+    private = SessionStore(path=path)
+    private.get("s1")
+    state.show_results(["Kit Kat"])
+    worker_a.save("s1", state)
+    assert private.get("s1").last_results == ["Monster Energy Drink"]
+    for store in (worker_a, worker_b, private):
+        store.close()
+
+
+def test_usda_results_are_shared_without_the_api_key(tmp_path, monkeypatch):
+    path = tmp_path / "providers.sqlite3"
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"foods": [{"fdcId": 1, "description": "MONSTER ENERGY DRINK"}]})
+
+    monkeypatch.setattr(
+        base, "build_http_client", lambda timeout, headers: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+    def worker() -> USDAFoodDataClient:
+        client = USDAFoodDataClient()
+        client.api_key, client.cache = "SECRET-KEY", None
+        client.shared = SharedCache(path, "usda")
+        return client
+
+    first, second = worker(), worker()
+    fetched = asyncio.run(first.search("monster"))
+    shared = asyncio.run(second.search("monster"))
+
+    assert len(requests) == 1 and requests[0].url.params["api_key"] == "SECRET-KEY"
+    assert shared.cache_status == "shared" and shared.products[0].product_name == fetched.products[0].product_name
+    assert "SECRET-KEY" not in shared.url and "api_key=%2A%2A%2A" in shared.url
+    for client in (first, second):
+        client.shared.close()
+    assert b"SECRET-KEY" not in b"".join(p.read_bytes() for p in tmp_path.iterdir())
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from app.cache.singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_run():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("k", load) for _ in range(5)))
+        assert calls == 1
+        assert [shared for _, shared in results] == [False, True, True, True, True]
+        assert len(flights) == 0
+        # Finished calls are not remembered.
+        assert await flights.do("k", load) == ("result", False) and calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_call_survives_one_waiter_leaving_and_is_cancelled_when_all_leave():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def slow():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(flights.do("k", slow))
+        second = asyncio.create_task(flights.do("k", slow))
+        await started.wait()
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not cancelled.is_set() and len(flights) == 1
+
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        await asyncio.sleep(0)
+        assert cancelled.is_set() and len(flights) == 0
+        assert flights.stats.abandoned == 1
+
+        async def boom():
+            raise ValueError("upstream")
+
+        with pytest.raises(ValueError):
+            await asyncio.gather(flights.do("e", boom), flights.do("e", boom))
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from app.data_providers.base import ProviderResult
+from app.llm.prompts import FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT
+from app.llm.responder import ChatResponder
+from app.schemas import FoodProduct
+from app.services.assistant_service import AssistantService
+
+# The heuristic guess for this message is "monster energy drink".
+MESSAGE = "Can you tell me the nutrition facts for a Monster energy drink?"
+
+
+class SlowExtractionGateway:
+    """Takes 50 ms to extract `food_query`, long enough for the speculative search to start first."""
+
+    model = "fake"
+
+    def __init__(self, food_query: str) -> None:
+        self.client = object()
+        self.food_query = food_query
+
+    async def chat(self, messages: list[dict], **params) -> str:
+        if messages[0]["content"] == FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT:
+            await asyncio.sleep(0.05)
+            return json.dumps({"mode": "catalog", "food_query": self.food_query, "compare_items": []})
+        return "Here is what the label says."
+
+    async def respond(self, input_text: str) -> str:
+        return ""
+
+    async def aclose(self) -> None:
+        pass
+
+
+class CountingCatalog:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.calls: list[str] = []
+        self.cancelled: list[str] = []
+
+    async def search(self, query: str, page_size: int | None = None) -> ProviderResult:
+        self.calls.append(query)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(query)
+            raise
+        product = FoodProduct(code=query, product_name=query.upper(), energy_kcal_100g=45.0)
+        return ProviderResult(products=[product], source="usda", status=200)
+
+
+def _service(food_query: str, catalog: CountingCatalog) -> AssistantService:
+    service = AssistantService()
+    service.chat = ChatResponder(gateway=SlowExtractionGateway(food_query))
+    service.chat.extraction_cache = None
+    service.catalog = catalog
+    service.answers = None
+    return service
+
+
+def test_speculative_result_is_reused_when_the_extraction_agrees():
+    catalog = CountingCatalog(delay=0.01)
+    answer = asyncio.run(_service("monster energy drink", catalog).answer(MESSAGE, session_id="s"))
+
+    assert "MONSTER ENERGY DRINK" in answer
+    # Searched once, before the extraction came back; only the rewritten variant was a new call.
+    assert catalog.calls.count("monster energy drink") == 1
+    assert "monster energy drink" not in catalog.cancelled
+
+
+def test_speculative_search_is_cancelled_when_the_extraction_differs():
+    catalog = CountingCatalog(delay=0.2)
+    answer = asyncio.run(_service("red bull", catalog).answer(MESSAGE, session_id="s"))
+
+    assert "RED BULL" in answer and "MONSTER" not in answer
+    assert catalog.calls == ["monster energy drink", "red bull"]
+    assert catalog.cancelled == ["monster energy drink"]
@@ -0,0 +1,96 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app import main
+from app.data_providers.base import ProviderResult
+from app.llm.prompts import FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT
+from app.llm.responder import ChatResponder
+from app.services.assistant_service import AssistantService
+
+QUESTION = "How much protein do adults need per day?"
+CHUNKS = ["Adults need ", "about 0.8 g ", "per kg of body weight."]
+
+
+class FakeStreamingGateway:
+    """Extracts every message as a general question and streams CHUNKS, failing at chunk `fail_at`."""
+
+    model = "fake"
+
+    def __init__(self, fail_at: int | None = None) -> None:
+        self.client = object()
+        self.fail_at = fail_at
+        self.responded = 0
+
+    async def chat(self, messages: list[dict], **params) -> str:
+        if messages[0]["content"] == FOOD_QUERY_EXTRACTION_SYSTEM_PROMPT:
+            return json.dumps({"mode": "general", "food_query": "protein intake", "compare_items": []})
+        return "".join(CHUNKS)
+
+    async def stream_chat(self, messages: list[dict], **params):
+        for i, chunk in enumerate(CHUNKS):
+            if i == self.fail_at:
+                raise RuntimeError("stream dropped")
+            await asyncio.sleep(0)
+            yield chunk
+
+    async def respond(self, input_text: str) -> str:
+        self.responded += 1
+        return "Roughly 0.8 g per kg."
+
+    async def aclose(self) -> None:
+        pass
+
+
+class NoCatalog:
+    async def search(self, query: str, page_size: int | None = None) -> ProviderResult:
+        return ProviderResult(source="usda")
+
+
+def _service(gateway: FakeStreamingGateway) -> AssistantService:
+    service = AssistantService()
+    service.chat = ChatResponder(gateway=gateway)
+    service.chat.extraction_cache = None
+    service.catalog = NoCatalog()
+    service.answers = None
+    return service
+
+
+async def _collect(service: AssistantService, session_id: str) -> list[str]:
+    return [partial async for partial in service.answer_stream(QUESTION, session_id=session_id)]
+
+
+def test_stream_yields_growing_prefixes_that_end_in_the_full_answer():
+    service = _service(FakeStreamingGateway())
+    partials = asyncio.run(_collect(service, "s1"))
+
+    assert partials == ["[source: llm]\n\n" + "".join(CHUNKS[: i + 1]).strip() for i in range(len(CHUNKS))]
+    # The non-streamed path gives the same final message.
+    assert asyncio.run(service.answer(QUESTION, session_id="s2")) == partials[-1]
+
+
+def test_stream_failing_before_any_text_falls_back_to_one_full_reply():
+    gateway = FakeStreamingGateway(fail_at=0)
+    partials = asyncio.run(_collect(_service(gateway), "s1"))
+    assert partials == ["[source: llm]\n\nRoughly 0.8 g per kg."]
+    assert gateway.responded == 1
+
+
+def test_stream_failing_midway_keeps_the_text_already_shown():
+    gateway = FakeStreamingGateway(fail_at=2)
+    service = _service(gateway)
+    partials = asyncio.run(_collect(service, "s1"))
+    assert partials[-1] == "[source: llm]\n\nAdults need about 0.8 g"
+    assert len(partials) == 2 and gateway.responded == 0
+
+
+def test_chat_ui_relays_each_partial(monkeypatch):
+    service = _service(FakeStreamingGateway())
+    monkeypatch.setattr(main, "service", service)
+
+    async def scenario():
+        return [p async for p in main.chat_fn(QUESTION, [], SimpleNamespace(session_hash="ui"))]
+
+    partials = asyncio.run(scenario())
+    assert len(partials) == len(CHUNKS) and partials[-1].endswith("per kg of body weight.")
+    assert service.sessions.get("ui") is not None
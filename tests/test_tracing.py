@@ -0,0 +1,64 @@
+import asyncio
+
+from app.observability.metrics import MetricsRegistry, merge_expositions
+from app.observability.tracing import record_tokens, span, traced, turn_trace
+
+
+def test_turn_trace_collects_nested_spans_across_tasks():
+    @traced("reply")
+    async def reply():
+        record_tokens(12, 5)
+        yield "a"
+        yield "ab"
+
+    async def search(name: str) -> None:
+        with span("provider_search", provider=name):
+            await asyncio.sleep(0)
+
+    async def run():
+        with turn_trace() as trace:
+            await asyncio.gather(search("usda"), search("openfoodfacts"))
+            chunks = [c async for c in reply()]
+            trace.root.set(source="llm + usda")
+        return trace, chunks
+
+    trace, chunks = asyncio.run(run())
+    assert chunks == ["a", "ab"]
+    names = [s.name for s in trace.spans]
+    assert names.count("provider_search") == 2
+    assert names[-1] == "turn"
+    reply_span = next(s for s in trace.spans if s.name == "reply")
+    assert reply_span.attrs["prompt_tokens"] == 12
+    assert reply_span.attrs["completion_tokens"] == 5
+    assert "first_chunk_ms" in reply_span.attrs
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "Demo counter.", ("kind",))
+    histogram = registry.histogram("demo_seconds", "Demo histogram.", ("stage",), buckets=(0.1, 1.0))
+    counter.inc(kind='say "hi"')
+    histogram.observe(0.5, stage="search")
+
+    text = registry.render()
+    assert '# TYPE demo_total counter' in text
+    assert 'demo_total{kind="say \\"hi\\""} 1' in text
+    assert 'demo_seconds_bucket{stage="search",le="0.1"} 0' in text
+    assert 'demo_seconds_bucket{stage="search",le="+Inf"} 1' in text
+    assert 'demo_seconds_sum{stage="search"} 0.5' in text
+
+
+def test_expositions_from_several_processes_are_summed():
+    workers = [MetricsRegistry(), MetricsRegistry()]
+    for i, registry in enumerate(workers):
+        registry.counter("demo_total", "Demo counter.", ("kind",)).inc(kind="a")
+        registry.counter("demo_total", "Demo counter.", ("kind",)).inc(kind="b" if i else "a")
+        registry.histogram("demo_seconds", "Demo histogram.", buckets=(0.1, 1.0)).observe(0.05 + i)
+
+    text = merge_expositions(registry.render() for registry in workers)
+    assert text.count("# TYPE demo_total counter") == 1
+    assert 'demo_total{kind="a"} 3' in text and 'demo_total{kind="b"} 1' in text
+    assert 'demo_seconds_bucket{le="0.1"} 1' in text and 'demo_seconds_bucket{le="+Inf"} 2' in text
+    assert "demo_seconds_count 2" in text and "demo_seconds_sum 1.1" in text
+    # Each family's samples stay under its own TYPE line.
+    assert text.index("# TYPE demo_seconds") > text.index('demo_total{kind="b"}')
@@ -0,0 +1,53 @@
+from app.data_providers.usda_decode import decode_food, decode_nutrients
+from app.schemas import FoodProduct
+
+
+def test_energy_prefers_kcal_and_converts_kj_only_rows():
+    kj_first = [
+        {"nutrientName": "Energy", "nutrientNumber": "268", "unitName": "kJ", "value": 2092},
+        {"nutrientName": "Energy", "nutrientNumber": "208", "unitName": "KCAL", "value": 500},
+    ]
+    assert decode_nutrients(kj_first)["energy_kcal_100g"] == 500
+    # Mislabeled number: the unit wins.
+    mislabeled = [{"nutrientName": "Energy", "nutrientNumber": "208", "unitName": "KJ", "value": 418.4}]
+    assert round(decode_nutrients(mislabeled)["energy_kcal_100g"], 6) == 100
+    assert round(decode_nutrients([{"nutrientId": 1062, "unitName": "kJ", "value": 836.8}])["energy_kcal_100g"], 6) == 200
+
+
+def test_preferred_nutrient_without_a_value_falls_back_to_the_next_source():
+    null_kcal = [
+        {"nutrientName": "Energy", "nutrientNumber": "208", "unitName": "KCAL", "value": None},
+        {"nutrientName": "Energy", "nutrientNumber": "268", "unitName": "kJ", "value": 836.8},
+    ]
+    assert round(decode_nutrients(null_kcal)["energy_kcal_100g"], 6) == 200
+    # Either order.
+    assert round(decode_nutrients(null_kcal[::-1])["energy_kcal_100g"], 6) == 200
+    atwater = [
+        {"nutrientId": 1008, "unitName": "KCAL"},
+        {"nutrientId": 2047, "unitName": "KCAL", "value": 180},
+        {"nutrientId": 1062, "unitName": "kJ", "value": 836.8},
+    ]
+    assert decode_nutrients(atwater)["energy_kcal_100g"] == 180
+    assert decode_nutrients([{"nutrientNumber": "203", "value": None}])["proteins_100g"] is None
+
+
+def test_decode_food_matches_validated_model():
+    item = {
+        "fdcId": 123,
+        "description": "PEANUT BAR",
+        "brandOwner": "Acme",
+        "gtinUpc": "0001",
+        "foodNutrients": [
+            {"nutrientId": 1003, "value": 9.5},
+            {"nutrientNumber": "269.3", "value": 30},
+            {"nutrientNumber": "269", "value": "28"},
+            {"nutrientNumber": "204", "value": None},
+            {"nutrientNumber": "307", "value": 200},
+            {"nutrientName": "Fiber, total dietary", "value": 3},
+            {"nutrientNumber": "605", "value": 0.1},
+        ],
+    }
+    product = decode_food(item)
+    assert product == FoodProduct.model_validate(product.model_dump())
+    assert (product.code, product.proteins_100g, product.sugars_100g, product.fat_100g) == ("123", 9.5, 28.0, None)
+    assert product.salt_100g == 0.5 and product.fiber_100g == 3.0 and product.energy_kcal_100g is None
@@ -0,0 +1,109 @@
+import asyncio
+import csv
+import sqlite3
+import threading
+import time
+
+from app.data_providers.usda_snapshot import USDASnapshotClient, build_snapshot
+
+
+def _write_csv(path, header, rows):
+    with path.open("w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _fixture_dir(tmp_path):
+    src = tmp_path / "branded"
+    src.mkdir()
+    _write_csv(
+        src / "food.csv",
+        ["fdc_id", "data_type", "description", "food_category_id", "publication_date"],
+        [
+            ["1", "branded_food", "SNICKERS CHOCOLATE BAR", "", ""],
+            ["2", "branded_food", "KIT KAT WAFER BAR", "", ""],
+            ["3", "sr_legacy_food", "Snickers legacy row", "", ""],
+            ["4", "foundation_food", "Apples, raw", "", ""],
+        ],
+    )
+    _write_csv(
+        src / "branded_food.csv",
+        ["fdc_id", "brand_owner", "brand_name", "gtin_upc", "ingredients"],
+        [
+            ["1", "Mars Inc.", "SNICKERS", "040000424314", "milk chocolate, peanuts"],
+            ["2", "The Hershey Company", "KIT KAT", "034000002467", "sugar, wheat flour"],
+        ],
+    )
+    _write_csv(
+        src / "nutrient.csv",
+        ["id", "name", "unit_name", "nutrient_nbr", "rank"],
+        [
+            ["1008", "Energy", "KCAL", "208", ""],
+            ["1062", "Energy", "kJ", "268", ""],
+            ["1003", "Protein", "G", "203", ""],
+            ["1093", "Sodium, Na", "MG", "307", ""],
+        ],
+    )
+    _write_csv(
+        src / "food_nutrient.csv",
+        ["id", "fdc_id", "nutrient_id", "amount"],
+        [
+            ["10", "1", "1008", "488"],
+            ["11", "1", "1003", "7.5"],
+            ["12", "1", "1093", "240"],
+            ["13", "2", "1062", "2176"],
+            ["14", "3", "1008", "999"],
+        ],
+    )
+    return src
+
+
+def test_snapshot_search_returns_food_products(tmp_path):
+    out = tmp_path / "snapshot.sqlite3"
+    assert build_snapshot([_fixture_dir(tmp_path)], out) == 3
+
+    client = USDASnapshotClient(out)
+    result = asyncio.run(client.search("snickers bar"))
+    assert result.source == "usda-snapshot"
+    assert [p.code for p in result.products] == ["1"]
+    snickers = result.products[0]
+    assert snickers.brands == "Mars Inc."
+    assert snickers.energy_kcal_100g == 488
+    assert snickers.salt_100g == 0.6
+
+    kit_kat = asyncio.run(client.search("kit kat")).products[0]
+    assert round(kit_kat.energy_kcal_100g) == 520
+
+
+def test_snapshot_search_relaxes_to_any_token_and_reports_misses(tmp_path):
+    out = tmp_path / "snapshot.sqlite3"
+    build_snapshot([_fixture_dir(tmp_path)], out)
+    client = USDASnapshotClient(out)
+
+    assert {p.code for p in asyncio.run(client.search("snickers apples")).products} == {"1", "4"}
+    miss = asyncio.run(client.search("pepsi"))
+    assert miss.products == []
+    assert "snapshot" in miss.error
+
+
+def test_concurrent_searches_share_one_connection(tmp_path, monkeypatch):
+    out = tmp_path / "snapshot.sqlite3"
+    build_snapshot([_fixture_dir(tmp_path)], out)
+    client = USDASnapshotClient(out)
+    opened = []
+    connect = sqlite3.connect
+
+    def slow_connect(*args, **kwargs):
+        time.sleep(0.02)  # widen the window between the None check and the assignment
+        opened.append(connect(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(sqlite3, "connect", slow_connect)
+    threads = [threading.Thread(target=client.search_sync, args=(["snickers"], 5)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(opened) == 1
+    asyncio.run(client.aclose())